@@ -1,13 +1,19 @@
 """
 会员智能运营闭环 Demo - 主程序
 """
+import pandas as pd
 import streamlit as st
 from modules.data_loader import DataLoader
-from modules.ai_engine import AIStrategyEngine
-from modules.rag_search import CampaignRAG
+from modules.data_store import get_data_store
+from modules.ai_engine import get_response_cache, get_shared_engine
+from modules.ai_metrics import get_ai_metrics
+from modules.provider_router import get_routed_engine
 from utils.config import Config
 import os
 
+# 共享数据仓库的底层数组是只读的：开启写时复制后，页面内的原地修改先复制出自己的数据，而不是报错
+pd.set_option('mode.copy_on_write', True)
+
 # 页面配置
 st.set_page_config(
     page_title=Config.PAGE_TITLE,
@@ -16,15 +22,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# 初始化session_state
+# 初始化session_state（数据集由进程级共享仓库提供，会话内只保存用户输入和AI引擎）
 if 'data_loaded' not in st.session_state:
     st.session_state.data_loaded = False
     st.session_state.ai_engine = None
-    st.session_state.rag = None
-    st.session_state.daily_df = None
-    st.session_state.segments_df = None
-    st.session_state.campaigns_df = None
-    st.session_state.capacity_df = None
+
+store = get_data_store()
 
 # 侧边栏
 with st.sidebar:
@@ -64,28 +67,49 @@ with st.sidebar:
         model = "deepseek-chat"
         base_url = "https://api.deepseek.com/v1"
 
-    if api_key and not st.session_state.data_loaded:
+    # 多提供商对冲：另一家作为备用，慢请求或失败时由其兜底
+    backup_provider = "DeepSeek" if api_provider == "OpenAI" else "OpenAI"
+    enable_hedge = st.checkbox(
+        f"🔀 同时使用{backup_provider}（对冲请求）",
+        help="按两家的历史延迟加权分配请求；主请求超过其P90耗时仍未返回时向另一家发出相同请求，取先返回的有效结果"
+    )
+    backup_key = ''
+    if enable_hedge:
+        backup_key = st.text_input(
+            f"{backup_provider} API Key",
+            type="password",
+            value=os.getenv('DEEPSEEK_API_KEY' if backup_provider == "DeepSeek" else 'OPENAI_API_KEY', ''),
+            help=f"备用提供商{backup_provider}的API Key"
+        )
+
+    # 开启对冲时等备用Key填好再初始化
+    if api_key and (backup_key or not enable_hedge) and not st.session_state.data_loaded:
         with st.spinner("正在加载数据..."):
             try:
-                # 初始化数据加载器
-                loader = DataLoader()
-
-                # 加载数据
-                st.session_state.daily_df = loader.load_daily_metrics()
-                st.session_state.segments_df = loader.load_user_segments()
-                st.session_state.campaigns_df = loader.load_campaign_history()
-                st.session_state.capacity_df = loader.load_resource_capacity()
-
-                # 初始化AI引擎（传入配置）
-                st.session_state.ai_engine = AIStrategyEngine(
-                    api_key=api_key,
-                    model=model,
-                    base_url=base_url
-                )
-
-                # 初始化RAG
-                st.session_state.rag = CampaignRAG()
-                st.session_state.rag.build_index(st.session_state.campaigns_df)
+                # 预热共享数据（已被其他会话加载时直接复用）
+                for name in store.DATASETS:
+                    store.get(name)
+
+                # 获取AI引擎（相同配置的会话共用连接池和进行中的请求）
+                if enable_hedge and backup_key:
+                    backup = {
+                        "OpenAI": {'model': "gpt-4o-mini", 'base_url': None},
+                        "DeepSeek": {'model': "deepseek-chat", 'base_url': "https://api.deepseek.com/v1"},
+                    }[backup_provider]
+                    st.session_state.ai_engine = get_routed_engine([
+                        {'name': api_provider, 'api_key': api_key, 'model': model, 'base_url': base_url},
+                        {'name': backup_provider, 'api_key': backup_key, **backup},
+                    ])
+                else:
+                    st.session_state.ai_engine = get_shared_engine(
+                        api_key=api_key,
+                        model=model,
+                        base_url=base_url,
+                        provider=api_provider
+                    )
+
+                # 初始化RAG（进程内共享）
+                store.get_rag()
 
                 st.session_state.data_loaded = True
                 st.success("✅ 系统初始化完成!")
@@ -98,9 +122,39 @@ with st.sidebar:
     st.markdown("### 数据概览")
 
     if st.session_state.data_loaded:
-        st.metric("数据天数", len(st.session_state.daily_df))
-        st.metric("用户分层", len(st.session_state.segments_df))
-        st.metric("历史活动", len(st.session_state.campaigns_df))
+        st.metric("数据天数", len(store.get('daily_metrics')))
+        st.metric("用户分层", len(store.get('user_segments')))
+        st.metric("历史活动", len(store.get('campaign_history')))
+
+        router = st.session_state.ai_engine.router
+        if router is not None:
+            for row in router.stats():
+                latency = f"EWMA {row['ewma']:.1f}秒 · P90 {row['p90']:.1f}秒" if row['ewma'] is not None else "暂无延迟样本"
+                st.caption(f"🔀 {row['name']}：{latency} · 请求 {row['requests']} · 胜出 {row['wins']} · 触发对冲 {row['hedged']}")
+            breakers = [p.breaker for p in router.providers]
+        else:
+            breakers = [st.session_state.ai_engine.breaker]
+        if all(breaker.state != breaker.CLOSED for breaker in breakers):
+            retry_after = min(breaker.retry_after() for breaker in breakers)
+            st.warning(f"⚠️ AI服务响应异常，已暂停调用（约{retry_after:.0f}秒后重试），期间使用默认模板")
+
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            cache_stats = response_cache.stats()
+            st.caption(
+                f"⚡ AI响应缓存：命中 {cache_stats['hits']} 次 / 未命中 {cache_stats['misses']} 次"
+                f"（已缓存 {cache_stats['entries']} 条）"
+            )
+
+        # AI调用诊断（进程内最近的调用，按操作汇总）
+        ai_metrics = get_ai_metrics()
+        metrics_summary = ai_metrics.summary()
+        if not metrics_summary.empty:
+            with st.expander("🔬 AI调用诊断"):
+                st.dataframe(metrics_summary.set_index('操作').T, use_container_width=True)
+                st.caption("耗时单位为秒；流式输出的token数为按字符估算")
+                if ai_metrics.prom_path:
+                    st.caption(f"指标文件：`{ai_metrics.prom_path}`（Prometheus）、`{ai_metrics.jsonl_path}`（逐次明细）")
     else:
         st.info("请输入API Key以加载数据")
 
@@ -146,7 +200,7 @@ if st.session_state.data_loaded:
 
     # 显示最新指标
     loader = DataLoader()
-    latest_metrics = loader.get_latest_metrics(st.session_state.daily_df)
+    latest_metrics = loader.get_latest_metrics(store.get('daily_metrics'))
 
     col1, col2, col3, col4 = st.columns(4)
 
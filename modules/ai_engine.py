@@ -2,19 +2,356 @@
 AI引擎模块
 """
 import openai
-from typing import Dict
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import pandas as pd
+import asyncio
+import hashlib
 import json
-import re
+import random
+import sqlite3
+import threading
+import time
+from modules.ai_metrics import current_call, get_ai_metrics
+from modules.prompt_context import estimate_tokens, get_context_builder
 from utils.config import Config
-from utils.validators import StrategyResponse
+from utils.validators import parse_strategy_response
 from loguru import logger
 
 
+class ResponseCache:
+    """AI响应磁盘缓存
+
+    以 (模型, temperature, prompt) 的哈希为key存入SQLite，多个会话和进程共享同一文件。
+    条目超过TTL视为失效；条目数超过上限时按最近访问时间淘汰（LRU）。
+    缓存读写失败只记录日志，不影响AI调用。
+    """
+
+    def __init__(self, path: str = None, ttl: int = None, max_entries: int = None):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite文件路径（默认使用配置）
+            ttl: 有效期（秒）
+            max_entries: 最大条目数
+        """
+        self.path = path or Config.LLM_CACHE_PATH
+        self.ttl = Config.LLM_CACHE_TTL if ttl is None else ttl
+        self.max_entries = Config.LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT,
+                    temperature REAL,
+                    response TEXT,
+                    created_at REAL,
+                    accessed_at REAL
+                )
+            """)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作单独连接，跨线程/进程安全；SQLite自身负责文件锁
+        return sqlite3.connect(self.path, timeout=5)
+
+    @staticmethod
+    def make_key(model: str, temperature: float, prompt: str) -> str:
+        """缓存key：模型、温度、prompt的SHA-256"""
+        raw = json.dumps([model, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中或已过期返回None"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT response, created_at FROM responses WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    row = None
+                if row is not None:
+                    conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"读取AI响应缓存失败: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row is not None else None
+
+    def set(self, key: str, model: str, temperature: float, response: str):
+        """写入缓存，并淘汰过期及超出上限的条目"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                    (key, model, temperature, response, now, now)
+                )
+                conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,))
+                overflow = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    conn.execute(
+                        'DELETE FROM responses WHERE key IN '
+                        '(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)',
+                        (overflow,)
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"写入AI响应缓存失败: {e}")
+
+    def delete(self, key: str):
+        """删除单条缓存（如缓存的响应无法解析）"""
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            logger.warning(f"删除AI响应缓存失败: {e}")
+
+    def clear(self):
+        """清空缓存"""
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM responses')
+        except sqlite3.Error as e:
+            logger.warning(f"清空AI响应缓存失败: {e}")
+
+    def stats(self) -> Dict:
+        """命中统计（命中/未命中为本进程累计，条目数为磁盘上的总数）"""
+        try:
+            with self._connect() as conn:
+                entries = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+        }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """获取进程级共享的响应缓存（配置关闭时返回None）"""
+    global _response_cache
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断打开期间拒绝调用"""
+
+
+class CircuitBreaker:
+    """AI调用熔断器
+
+    closed：正常放行；连续失败的调用（一次调用的重试全部失败才计一次，含慢调用）达到阈值后进入open。
+    open：直接拒绝，调用方立即走降级方案；经过冷却时间后进入half_open。
+    half_open：只放行一个探测请求，成功则恢复closed，失败则重新open。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = None, slow_call_seconds: float = None,
+                 reset_seconds: float = None):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold: 连续失败多少次后熔断（默认使用配置）
+            slow_call_seconds: 耗时超过该值的调用记为失败（默认使用配置）
+            reset_seconds: 熔断后多久放行探测请求（默认使用配置）
+        """
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.slow_call_seconds = slow_call_seconds or Config.CIRCUIT_SLOW_CALL_SECONDS
+        self.reset_seconds = reset_seconds or Config.CIRCUIT_RESET_SECONDS
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe = None  # 当前半开探测的凭证（None表示没有进行中的探测）
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        是否放行本次调用
+
+        Returns:
+            放行凭证：拒绝时为False；closed时为True；半开探测时为本次探测独有的对象。
+            放弃调用时把凭证交给release，只有持有探测凭证的调用才能释放探测名额
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe = None
+            # 半开状态同一时间只放行一个探测请求
+            if self._probe is not None:
+                return False
+            self._probe = object()
+            return self._probe
+
+    def record_success(self, duration: float = 0.0):
+        """记录一次成功调用（慢调用按失败处理）"""
+        if duration >= self.slow_call_seconds:
+            logger.warning(f"AI调用耗时{duration:.1f}秒，记为慢调用")
+            self.record_failure()
+            return
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("AI服务恢复，熔断关闭")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe = None
+
+    def record_failure(self):
+        """记录一次失败调用"""
+        with self._lock:
+            self.failures += 1
+            self._probe = None
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"AI调用连续失败{self.failures}次，熔断{self.reset_seconds:.0f}秒")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self, token):
+        """放弃本次调用（被取消、没有结果，不计成功也不计失败）；token为allow的返回值"""
+        with self._lock:
+            if token is self._probe:
+                self._probe = None
+
+    def retry_after(self) -> float:
+        """熔断打开时距离下次探测的秒数（未熔断时为0）"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(base_url: str, model: str) -> CircuitBreaker:
+    """获取某个服务地址 + 模型的共享熔断器（同一上游的所有引擎共用健康状态）"""
+    key = (base_url, model)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+        return breaker
+
+
+def is_retryable(error: Exception) -> bool:
+    """连接失败、超时、限流、5xx可重试；其余4xx说明服务可达，不重试也不计入熔断"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError,
+                          openai.InternalServerError, TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409)
+
+
+def retry_delay(attempt: int) -> float:
+    """指数退避（带抖动），第attempt次重试前的等待秒数"""
+    return min(0.5 * 2 ** (attempt - 1), 4.0) * random.uniform(0.5, 1.0)
+
+
+class _InFlightCall:
+    """一次进行中的上游调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.event.wait(timeout)
+
+
+class SingleFlight:
+    """合并并发的相同请求
+
+    同一个key同时只有一个调用方（leader）真正请求上游，其余调用方等待并共享其结果或异常。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def join(self, key: str) -> Tuple[_InFlightCall, bool]:
+        """
+        加入key对应的调用
+
+        Returns:
+            (调用对象, 是否为leader)；leader完成后必须调用finish()
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = self._calls[key] = _InFlightCall()
+            return call, True
+
+    def finish(self, key: str, call: _InFlightCall, result=None, error: BaseException = None):
+        """leader写入结果并唤醒等待方"""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result = result
+        call.error = error
+        call.event.set()
+
+    def do(self, key: str, fn):
+        """执行fn，相同key的并发调用只执行一次"""
+        call, leader = self.join(key)
+        if not leader:
+            call.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
 class AIStrategyEngine:
     """AI策略推荐引擎"""
 
-    def __init__(self, api_key: str = None, model: str = None, base_url: str = None):
+    def __init__(self, api_key: str = None, model: str = None, base_url: str = None,
+                 cache: ResponseCache = None, router=None):
         """
         初始化AI引擎
 
@@ -22,15 +359,27 @@ class AIStrategyEngine:
             api_key: API Key (支持 OpenAI/DeepSeek 等)
             model: 模型名称 (gpt-4o-mini/deepseek-chat等)
             base_url: API Base URL (DeepSeek: https://api.deepseek.com/v1)
+            cache: 响应缓存（默认使用进程级共享缓存）
+            router: 多提供商路由器（ProviderRouter；设置后所有调用经由路由器分配和对冲）
         """
         api_key = api_key or Config.OPENAI_API_KEY
-        self.model = model or Config.OPENAI_MODEL
+        self.router = router
+        self.model = router.model if router is not None else (model or Config.OPENAI_MODEL)
+        self.cache = cache if cache is not None else get_response_cache()
+        self.context_builder = get_context_builder()
+        self.metrics = get_ai_metrics()
+        self._inflight = SingleFlight()
+        self.deadline = Config.OPENAI_CALL_DEADLINE
+        self.max_retries = Config.OPENAI_MAX_RETRIES
+        # 是否请求JSON输出（response_format），服务端不支持时自动关闭
+        self.json_mode = Config.OPENAI_JSON_MODE
 
         # 支持自定义 base_url（用于 DeepSeek 等兼容API）
+        # 重试由引擎按截止时间和熔断状态控制，客户端自身不重试
         client_kwargs = {
             'api_key': api_key,
             'timeout': Config.OPENAI_TIMEOUT,
-            'max_retries': Config.OPENAI_MAX_RETRIES
+            'max_retries': 0
         }
 
         # 优先使用传入的 base_url，其次使用配置文件中的
@@ -39,10 +388,214 @@ class AIStrategyEngine:
         elif Config.OPENAI_BASE_URL:
             client_kwargs['base_url'] = Config.OPENAI_BASE_URL
 
+        self._client_kwargs = client_kwargs
         self.client = openai.OpenAI(**client_kwargs)
+        self.breaker = get_circuit_breaker(client_kwargs.get('base_url'), self.model)
 
         logger.info(f"AI引擎初始化完成 - 模型: {self.model}, Base URL: {client_kwargs.get('base_url', 'OpenAI默认')}")
 
+    def _cache_key(self, prompt: str, temperature: float) -> str:
+        return ResponseCache.make_key(self.model, temperature, prompt)
+
+    def _complete(self, prompt: str, temperature: float, validate=None, json_mode: bool = False) -> str:
+        """
+        调用模型（相同模型、温度、prompt的结果优先从缓存返回）
+
+        Args:
+            prompt: 用户消息
+            temperature: 采样温度
+            validate: 校验回复的函数（不合格时抛出ValueError；路由对冲时据此判断有效结果）
+            json_mode: 要求模型直接输出JSON对象（服务端支持时）
+
+        Returns:
+            模型回复文本
+        """
+        cached = self._cache_lookup(prompt, temperature)
+        if cached is not None:
+            return cached
+
+        # 多个会话同时发出相同请求时只调用一次上游
+        return self._inflight.do(
+            self._cache_key(prompt, temperature),
+            lambda: self._request(prompt, temperature, validate, json_mode)
+        )
+
+    def _call_upstream(self, make_request):
+        """
+        在端到端截止时间内调用上游：熔断打开时立即失败，可重试错误按指数退避重试
+
+        Args:
+            make_request: 接收本次尝试的超时秒数、返回结果的函数
+
+        Returns:
+            make_request的返回值
+        """
+        deadline = time.monotonic() + self.deadline
+        # 熔断器按操作计数：放行一次，重试用尽后才记一次失败（否则单个请求自身的重试就能触发熔断）
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"AI服务熔断中，{self.breaker.retry_after():.0f}秒后重试")
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise TimeoutError(f"AI调用超过截止时间{self.deadline:.0f}秒")
+
+            started = time.monotonic()
+            try:
+                result = make_request(min(remaining, Config.OPENAI_TIMEOUT))
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success(time.monotonic() - started)
+                    raise
+                attempt += 1
+                delay = retry_delay(attempt)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise
+                logger.info(f"AI调用失败，{delay:.1f}秒后第{attempt}次重试: {e!r}")
+                current_call().retries += 1
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success(time.monotonic() - started)
+            return result
+
+    def _request(self, prompt: str, temperature: float, validate=None, json_mode: bool = False) -> str:
+        """请求上游并写入缓存"""
+        if self.router is not None:
+            content = self.router.complete(prompt, temperature, validate, json_mode)
+        else:
+            response = self._call_upstream(
+                lambda timeout: self._create_completion(prompt, temperature, timeout, json_mode)
+            )
+            content = response.choices[0].message.content
+            current_call().add_usage(response.usage)
+
+        self._cache_store(prompt, temperature, content)
+        return content
+
+    def _create_completion(self, prompt: str, temperature: float, timeout: float, json_mode: bool):
+        """非流式请求一次；json_mode时带上response_format，服务端不支持时关闭JSON输出并改为普通请求"""
+        kwargs = {
+            'model': self.model,
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': temperature,
+            'timeout': timeout
+        }
+        if json_mode and self.json_mode:
+            try:
+                return self.client.chat.completions.create(response_format={'type': 'json_object'}, **kwargs)
+            except openai.BadRequestError as e:
+                if 'response_format' not in str(e):
+                    raise
+                logger.info(f"模型{self.model}不支持response_format，改为普通输出")
+                self.json_mode = False
+        return self.client.chat.completions.create(**kwargs)
+
+    def _complete_stream(self, prompt: str, temperature: float) -> Iterator[str]:
+        """
+        流式调用模型，逐段产出回复文本（命中缓存时一次性产出；完整结束后写入缓存）
+
+        Args:
+            prompt: 用户消息
+            temperature: 采样温度
+
+        Yields:
+            回复文本片段
+        """
+        cached = self._cache_lookup(prompt, temperature)
+        if cached is not None:
+            yield cached
+            return
+
+        # 相同请求已在其他会话中流式生成时，等待其完成后一次性产出
+        key = self._cache_key(prompt, temperature)
+        call, leader = self._inflight.join(key)
+        if not leader:
+            if call.wait(Config.OPENAI_CALL_DEADLINE) and call.error is None and call.result:
+                yield call.result
+                return
+            # 对方失败、中断或超时：自行请求上游
+
+        parts = []
+        try:
+            # 截止时间和熔断作用于建立连接到收到响应头；之后的分片按单次超时控制
+            if self.router is not None:
+                stream = self.router.open_stream(prompt, temperature)
+            else:
+                stream = self._call_upstream(lambda timeout: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    stream=True,
+                    timeout=timeout
+                ))
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            finally:
+                # 调用方提前停止迭代时释放连接
+                stream.close()
+        except BaseException as e:
+            if leader:
+                self._inflight.finish(key, call, error=e)
+            raise
+
+        content = ''.join(parts)
+        # 流式响应不带usage，按字符估算token
+        record = current_call()
+        record.prompt_tokens += estimate_tokens(prompt)
+        record.completion_tokens += estimate_tokens(content)
+        record.tokens_estimated = True
+
+        self._cache_store(prompt, temperature, content)
+        if leader:
+            self._inflight.finish(key, call, result=content)
+
+    def _stream_with_fallback(self, prompt: str, temperature: float, fallback,
+                              failure_message: str, operation: str) -> Iterator[str]:
+        """流式输出，出错时改为产出降级内容（已输出部分内容时追加在其后）"""
+        with self.metrics.track(operation, self.model) as record:
+            started = time.perf_counter()
+            produced = False
+            try:
+                for part in self._complete_stream(prompt, temperature):
+                    if not produced:
+                        record.ttft = time.perf_counter() - started
+                        produced = True
+                    yield part
+            except Exception as e:
+                logger.warning(f"{failure_message}: {e}")
+                record.fallback = True
+                record.error = type(e).__name__
+                if produced:
+                    yield "\n\n---\n\n> ⚠️ AI输出中断，以下为默认分析\n\n"
+                yield fallback()
+
+    def _cache_lookup(self, prompt: str, temperature: float) -> Optional[str]:
+        """查询缓存（未启用缓存或未命中返回None）"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_key(prompt, temperature))
+        if cached is not None:
+            logger.info("命中AI响应缓存")
+            current_call().cache_hit = True
+        return cached
+
+    def _cache_store(self, prompt: str, temperature: float, content: str):
+        """缓存模型回复（空回复不缓存）"""
+        if self.cache is not None and content:
+            self.cache.set(self._cache_key(prompt, temperature), self.model, temperature, content)
+
+    def _invalidate(self, prompt: str, temperature: float):
+        """丢弃某个prompt的缓存结果"""
+        if self.cache is not None:
+            self.cache.delete(self._cache_key(prompt, temperature))
+
     def recommend_strategy(self, target: str, history_df: pd.DataFrame,
                           segments_df: pd.DataFrame) -> Dict:
         """
@@ -102,20 +655,26 @@ class AIStrategyEngine:
 2. risk_alert必须是字符串，不要用数组格式
 3. discount_recommendation使用真实券名格式"""
 
-        try:
-            # 3. 调用GPT
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3
-            )
-
-            # 4. 解析并校验
-            return self._parse_strategy_safe(response.choices[0].message.content)
-
-        except Exception as e:
-            logger.warning(f"AI调用失败，使用降级方案: {e}")
-            return self._get_default_strategy()
+        with self.metrics.track('recommend_strategy', self.model) as record:
+            try:
+                # 3. 调用GPT
+                response_text = self._complete(
+                    prompt, temperature=0.3, validate=self._parse_strategy_safe, json_mode=True
+                )
+
+                # 4. 解析并校验（解析失败的响应不保留在缓存中）
+                try:
+                    return self._parse_strategy_safe(response_text)
+                except ValueError:
+                    record.parse_failures += 1
+                    self._invalidate(prompt, temperature=0.3)
+                    raise
+
+            except Exception as e:
+                logger.warning(f"AI调用失败，使用降级方案: {e}")
+                record.fallback = True
+                record.error = type(e).__name__
+                return self._get_default_strategy()
 
     def explain_anomaly(self, date: str, metrics: Dict,
                        context_df: pd.DataFrame) -> str:
@@ -130,6 +689,62 @@ class AIStrategyEngine:
         Returns:
             Markdown格式分析报告
         """
+        prompt = self._anomaly_prompt(date, metrics, context_df)
+
+        with self.metrics.track('explain_anomaly', self.model) as record:
+            try:
+                return self._complete(prompt, temperature=0.2)
+
+            except Exception as e:
+                logger.warning(f"AI异常解释失败: {e}")
+                record.fallback = True
+                record.error = type(e).__name__
+                return self._get_default_anomaly_explanation(metrics)
+
+    def explain_anomaly_stream(self, date: str, metrics: Dict,
+                               context_df: pd.DataFrame) -> Iterator[str]:
+        """
+        流式异常解释，边生成边产出Markdown片段
+
+        Args:
+            date: 异常日期
+            metrics: 指标字典
+            context_df: 上下文数据
+
+        Yields:
+            Markdown片段（失败时产出降级解释）
+        """
+        prompt = self._anomaly_prompt(date, metrics, context_df)
+        yield from self._stream_with_fallback(
+            prompt, 0.2, lambda: self._get_default_anomaly_explanation(metrics), "AI异常解释失败",
+            'explain_anomaly_stream'
+        )
+
+    @staticmethod
+    def anomaly_metrics(context_df: pd.DataFrame, date: str) -> Dict:
+        """
+        提取某个异常日期的关键指标（explain_anomaly的metrics参数）
+
+        Args:
+            context_df: 日度数据
+            date: 异常日期
+
+        Returns:
+            指标字典
+        """
+        row = context_df[context_df['date'] == pd.to_datetime(date)].iloc[0]
+        return {
+            'dau': int(row['dau']),
+            'revenue': int(row['revenue']),
+            'arpu': float(row['arpu']),
+            'dau_change': float(row.get('dau_change', 0)),
+            'revenue_change': float(row.get('revenue_change', 0)),
+            'arpu_change': float(row.get('arpu_change', 0)),
+            'conversion_rate': float(row.get('conversion_rate', 0))
+        }
+
+    def _anomaly_prompt(self, date: str, metrics: Dict, context_df: pd.DataFrame) -> str:
+        """构建异常解释prompt"""
         # 获取前后3天数据作为上下文
         target_date = pd.to_datetime(date)
         context = context_df[
@@ -148,7 +763,7 @@ class AIStrategyEngine:
 - 转化率: {metrics.get('conversion_rate', 0):.2f}%
 
 【上下文数据】
-{context[['date', 'dau', 'revenue', 'arpu', 'content_type']].to_string()}
+{self.context_builder.daily_context(context)}
 
 请分析并输出（Markdown格式）:
 
@@ -162,19 +777,7 @@ class AIStrategyEngine:
 1. [2条可执行措施,每条不超过30字]
 
 要求:简洁、具体、可执行。"""
-
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2
-            )
-
-            return response.choices[0].message.content
-
-        except Exception as e:
-            logger.warning(f"AI异常解释失败: {e}")
-            return self._get_default_anomaly_explanation(metrics)
+        return prompt
 
     def generate_report(self, start_date: str, end_date: str,
                        period_df: pd.DataFrame) -> str:
@@ -189,7 +792,27 @@ class AIStrategyEngine:
         Returns:
             Markdown格式复盘报告
         """
-        # 计算关键指标
+        summary = self._report_summary(period_df)
+        prompt = self._report_prompt(start_date, end_date, period_df, summary)
+
+        with self.metrics.track('generate_report', self.model) as record:
+            try:
+                return self._complete(prompt, temperature=0.5)
+
+            except Exception as e:
+                logger.warning(f"AI复盘生成失败: {e}")
+                record.fallback = True
+                record.error = type(e).__name__
+                return self._get_default_report(*summary)
+
+    @staticmethod
+    def _report_summary(period_df: pd.DataFrame) -> Tuple:
+        """
+        复盘关键指标
+
+        Returns:
+            (总收入, 平均边现, 边现变化%, 内容表现)，与_get_default_report的参数顺序一致
+        """
         total_revenue = period_df['revenue'].sum()
         avg_arpu = period_df['arpu'].mean()
         arpu_change = (period_df['arpu'].iloc[-1] - period_df['arpu'].iloc[0]) / period_df['arpu'].iloc[0] * 100 if len(period_df) > 0 else 0
@@ -200,6 +823,17 @@ class AIStrategyEngine:
             'arpu': 'mean'
         }).sort_values('revenue', ascending=False)
 
+        return total_revenue, avg_arpu, arpu_change, content_performance
+
+    def _report_prompt(self, start_date: str, end_date: str, period_df: pd.DataFrame,
+                       summary: Tuple, chunk_summaries: List[Tuple[str, str]] = None) -> str:
+        """构建复盘报告prompt（给出分段摘要时用摘要代替日度数据，即map-reduce的汇总步骤）"""
+        total_revenue, avg_arpu, arpu_change, content_performance = summary
+        if chunk_summaries:
+            data_section = "【分段摘要】\n" + "\n\n".join(f"### {label}\n{text}" for label, text in chunk_summaries)
+        else:
+            data_section = f"【日度数据】\n{self.context_builder.daily_context(period_df)}"
+
         prompt = f"""你是运营复盘专家,生成详细的活动总结报告。
 
 【活动周期】{start_date} 至 {end_date}
@@ -212,8 +846,7 @@ class AIStrategyEngine:
 【内容表现】
 {content_performance.to_string()}
 
-【日度数据】
-{period_df[['date', 'dau', 'revenue', 'arpu', 'content_type']].to_string()}
+{data_section}
 
 请生成Markdown格式复盘报告,包含:
 
@@ -265,61 +898,35 @@ class AIStrategyEngine:
 [可复用的经验总结,用于后续相似场景]
 
 要求:数据驱动、洞察深刻、建议具体、可直接复用。"""
+        return prompt
 
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.5
-            )
+    def generate_report_stream(self, start_date: str, end_date: str,
+                               period_df: pd.DataFrame) -> Iterator[str]:
+        """
+        流式生成复盘报告，边生成边产出Markdown片段
 
-            return response.choices[0].message.content
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            period_df: 周期数据
 
-        except Exception as e:
-            logger.warning(f"AI复盘生成失败: {e}")
-            return self._get_default_report(total_revenue, avg_arpu, arpu_change, content_performance)
+        Yields:
+            Markdown片段（失败时产出降级报告）
+        """
+        summary = self._report_summary(period_df)
+        prompt = self._report_prompt(start_date, end_date, period_df, summary)
+        yield from self._stream_with_fallback(
+            prompt, 0.5, lambda: self._get_default_report(*summary), "AI复盘生成失败",
+            'generate_report_stream'
+        )
 
     def _parse_strategy_safe(self, response_text: str) -> Dict:
-        """三层防护解析"""
+        """解析并校验策略JSON（线性括号配对提取 + 预构建TypeAdapter一步校验），失败抛出ValueError"""
         try:
-            # 提取JSON代码块
-            json_str = self._extract_json_block(response_text)
-            data = json.loads(json_str)
-
-            # 预处理：将list转换为string（AI有时会返回list格式）
-            if isinstance(data.get('risk_alert'), list):
-                data['risk_alert'] = '\n'.join(str(item) for item in data['risk_alert'])
-                logger.info("已将risk_alert从list转换为string")
-
-            # Pydantic校验
-            validated = StrategyResponse(**data)
-            return validated.model_dump()
-
-        except Exception as e:
+            return parse_strategy_response(response_text)
+        except ValueError as e:
             logger.warning(f"解析失败: {e}")
-            # 尝试直接解析
-            try:
-                data = json.loads(response_text)
-                # 同样的预处理
-                if isinstance(data.get('risk_alert'), list):
-                    data['risk_alert'] = '\n'.join(str(item) for item in data['risk_alert'])
-                return data
-            except:
-                raise ValueError("无法解析AI响应")
-
-    def _extract_json_block(self, text: str) -> str:
-        """提取JSON代码块"""
-        # 尝试提取```json```代码块
-        match = re.search(r'```json\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if match:
-            return match.group(1)
-
-        # 尝试提取{}
-        match = re.search(r'\{.*\}', text, re.DOTALL)
-        if match:
-            return match.group(0)
-
-        return text
+            raise
 
     def _get_default_strategy(self) -> Dict:
         """降级默认策略"""
@@ -415,3 +1022,349 @@ class AIStrategyEngine:
 ## 📝 策略沉淀
 基于数据持续迭代优化，{top_content}内容策略可复用至类似场景
 """
+
+
+class AsyncAIStrategyEngine(AIStrategyEngine):
+    """支持并发调用的AI引擎
+
+    在同步接口之外提供基于asyncio的批量接口：用信号量限制同时在途的请求数，
+    每次调用有独立的截止时间，超时或失败的条目返回降级结果，不影响其他条目。
+    """
+
+    def __init__(self, api_key: str = None, model: str = None, base_url: str = None,
+                 cache: ResponseCache = None, max_concurrency: int = None, deadline: float = None,
+                 router=None):
+        """
+        初始化并发AI引擎
+
+        Args:
+            api_key: API Key (支持 OpenAI/DeepSeek 等)
+            model: 模型名称
+            base_url: API Base URL
+            cache: 响应缓存（默认使用进程级共享缓存）
+            max_concurrency: 最大并发请求数（默认使用配置）
+            deadline: 单次调用截止时间（秒，默认使用配置）
+            router: 多提供商路由器（ProviderRouter）
+        """
+        super().__init__(api_key=api_key, model=model, base_url=base_url, cache=cache, router=router)
+        self.max_concurrency = max_concurrency or Config.OPENAI_MAX_CONCURRENCY
+        self.deadline = deadline or Config.OPENAI_CALL_DEADLINE
+
+    def _make_async_client(self) -> openai.AsyncOpenAI:
+        # 异步客户端的连接池绑定事件循环，每个批次单独创建
+        return openai.AsyncOpenAI(**self._client_kwargs)
+
+    async def _acall_upstream(self, make_request):
+        """_call_upstream的异步版本（make_request返回协程，超时由asyncio.wait_for控制）"""
+        deadline = time.monotonic() + self.deadline
+        token = self.breaker.allow()
+        if not token:
+            raise CircuitOpenError(f"AI服务熔断中，{self.breaker.retry_after():.0f}秒后重试")
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.record_failure()
+                raise TimeoutError(f"AI调用超过截止时间{self.deadline:.0f}秒")
+
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(make_request(), timeout=remaining)
+            except asyncio.CancelledError:
+                # 批次提前结束被取消：本次持有半开探测名额时释放
+                self.breaker.release(token)
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    self.breaker.record_success(time.monotonic() - started)
+                    raise
+                attempt += 1
+                delay = retry_delay(attempt)
+                if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                    self.breaker.record_failure()
+                    raise
+                current_call().retries += 1
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    self.breaker.release(token)
+                    raise
+                continue
+
+            self.breaker.record_success(time.monotonic() - started)
+            return result
+
+    async def _acomplete(self, client: openai.AsyncOpenAI, prompt: str, temperature: float) -> str:
+        """异步调用模型（先查缓存，超过截止时间抛出TimeoutError，熔断时抛出CircuitOpenError）"""
+        cached = self._cache_lookup(prompt, temperature)
+        if cached is not None:
+            return cached
+
+        if self.router is not None:
+            content = await self.router.acomplete(prompt, temperature)
+        else:
+            response = await self._acall_upstream(lambda: client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=temperature
+            ))
+            content = response.choices[0].message.content
+            current_call().add_usage(response.usage)
+
+        self._cache_store(prompt, temperature, content)
+        return content
+
+    async def aexplain_anomaly(self, client: openai.AsyncOpenAI, date: str, metrics: Dict,
+                               context_df: pd.DataFrame) -> str:
+        """explain_anomaly的异步版本（失败时返回降级解释）"""
+        prompt = self._anomaly_prompt(date, metrics, context_df)
+        with self.metrics.track('explain_anomaly', self.model) as record:
+            try:
+                return await self._acomplete(client, prompt, temperature=0.2)
+            except Exception as e:
+                logger.warning(f"AI异常解释失败({date}): {e!r}")
+                record.fallback = True
+                record.error = type(e).__name__
+                return self._get_default_anomaly_explanation(metrics)
+
+    async def _run_batch(self, items: list, worker) -> AsyncIterator:
+        """
+        以有限并发对每个条目执行worker(client, item)，按完成先后产出结果
+
+        调用方提前停止迭代时取消尚未完成的请求。
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with self._make_async_client() as client:
+            async def run(item):
+                async with semaphore:
+                    return await worker(client, item)
+
+            tasks = [asyncio.ensure_future(run(item)) for item in items]
+            try:
+                for finished in asyncio.as_completed(tasks):
+                    yield await finished
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def _iterate(batch: AsyncIterator) -> Iterator:
+        """在独立事件循环中逐条取出异步批次的结果（同步包装，供Streamlit页面逐条渲染）"""
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(batch.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(batch.aclose())
+            loop.close()
+
+    async def explain_anomalies_batch(self, dates: List[str], context_df: pd.DataFrame,
+                                      metrics: Dict[str, Dict] = None) -> AsyncIterator[Tuple[str, str]]:
+        """
+        并发解释多个异常日期，按完成先后依次产出
+
+        Args:
+            dates: 异常日期列表
+            context_df: 日度数据
+            metrics: 日期 -> 指标字典（缺省时从context_df提取）
+
+        Yields:
+            (日期, Markdown格式分析报告)
+        """
+        metrics = metrics or {}
+
+        async def explain(client, date):
+            date_metrics = metrics.get(date) or self.anomaly_metrics(context_df, date)
+            return date, await self.aexplain_anomaly(client, date, date_metrics, context_df)
+
+        async for result in self._run_batch(dates, explain):
+            yield result
+
+    def explain_anomalies_iter(self, dates: List[str], context_df: pd.DataFrame,
+                               metrics: Dict[str, Dict] = None) -> Iterator[Tuple[str, str]]:
+        """
+        explain_anomalies_batch的同步包装，供Streamlit页面逐条渲染
+
+        Yields:
+            (日期, Markdown格式分析报告)，按完成先后
+        """
+        return self._iterate(self.explain_anomalies_batch(dates, context_df, metrics))
+
+    @staticmethod
+    def report_chunks(period_df: pd.DataFrame, by: str = 'week',
+                      campaigns: pd.DataFrame = None) -> List[Tuple[str, pd.DataFrame]]:
+        """
+        把复盘周期切分为分段（map-reduce复盘的map输入）
+
+        分段按自然周对齐：两次复盘的周期有重叠时，完整的周得到相同的分段和prompt，可直接复用缓存的摘要。
+
+        Args:
+            period_df: 周期数据
+            by: 'week' 按自然周；'campaign' 按历史活动窗口（不在任何活动内的日期按自然周）
+            campaigns: 历史活动数据（包含campaign_id, start_date, end_date），by='campaign'时使用
+
+        Returns:
+            [(分段名称, 分段数据)]，按起始日期排序
+        """
+        chunks = []
+        rest = period_df
+        if by == 'campaign' and campaigns is not None:
+            dates = period_df['date']
+            covered = np.zeros(len(period_df), dtype=bool)
+            for row in campaigns.itertuples(index=False):
+                mask = ((dates >= row.start_date) & (dates <= row.end_date)).to_numpy()
+                if mask.any():
+                    chunk = period_df[mask]
+                    chunks.append((
+                        f"活动{row.campaign_id}（{chunk['date'].min():%Y-%m-%d} 至 {chunk['date'].max():%Y-%m-%d}）",
+                        chunk
+                    ))
+                    covered |= mask
+            rest = period_df[~covered]
+
+        for _, chunk in rest.groupby(rest['date'].dt.to_period('W'), sort=True):
+            chunks.append((f"{chunk['date'].min():%Y-%m-%d} 至 {chunk['date'].max():%Y-%m-%d}", chunk))
+
+        chunks.sort(key=lambda item: item[1]['date'].min())
+        return chunks
+
+    def _chunk_prompt(self, label: str, chunk_df: pd.DataFrame) -> str:
+        """构建分段摘要prompt（只依赖分段本身的数据，重叠周期的相同分段命中缓存）"""
+        total_revenue, avg_arpu, arpu_change, content_performance = self._report_summary(chunk_df)
+
+        return f"""你是运营复盘专家,为长周期复盘报告总结其中一个分段。
+
+【分段】{label}
+
+【分段表现】
+- 总收入: {total_revenue:,.0f}元
+- 平均边现: {avg_arpu:.4f}元
+- 边现变化: {arpu_change:+.1f}%
+
+【内容表现】
+{content_performance.to_string()}
+
+【日度数据】
+{self.context_builder.daily_context(chunk_df, Config.REPORT_CHUNK_TOKEN_BUDGET)}
+
+请用不超过150字总结该分段: 关键数字、表现最好和最差的内容、异常或转折点。只输出摘要正文,不要标题。"""
+
+    async def asummarize_chunk(self, client: openai.AsyncOpenAI, label: str, chunk_df: pd.DataFrame) -> str:
+        """生成一个分段的摘要（失败时返回按数据拼出的降级摘要，降级摘要不缓存）"""
+        prompt = self._chunk_prompt(label, chunk_df)
+        with self.metrics.track('summarize_report_chunk', self.model) as record:
+            try:
+                return await self._acomplete(client, prompt, temperature=0.2)
+            except Exception as e:
+                logger.warning(f"AI分段摘要失败({label}): {e!r}")
+                record.fallback = True
+                record.error = type(e).__name__
+                return self._get_default_chunk_summary(chunk_df)
+
+    def summarize_chunks_iter(self, chunks: List[Tuple[str, pd.DataFrame]]) -> Iterator[Tuple[int, str]]:
+        """
+        并发生成各分段摘要
+
+        Args:
+            chunks: report_chunks的结果
+
+        Yields:
+            (分段序号, 摘要)，按完成先后
+        """
+        async def summarize(client, index):
+            label, chunk_df = chunks[index]
+            return index, await self.asummarize_chunk(client, label, chunk_df)
+
+        return self._iterate(self._run_batch(list(range(len(chunks))), summarize))
+
+    def generate_report_mapreduce(self, start_date: str, end_date: str, period_df: pd.DataFrame,
+                                  by: str = 'week', campaigns: pd.DataFrame = None) -> str:
+        """
+        长周期复盘：分段并发摘要后汇总为一份报告
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            period_df: 周期数据
+            by: 分段方式（'week'/'campaign'）
+            campaigns: 历史活动数据（按活动分段时使用）
+
+        Returns:
+            Markdown格式复盘报告
+        """
+        chunks = self.report_chunks(period_df, by, campaigns)
+        summaries = [None] * len(chunks)
+        for index, text in self.summarize_chunks_iter(chunks):
+            summaries[index] = text
+
+        chunk_summaries = [(label, text) for (label, _), text in zip(chunks, summaries)]
+        return ''.join(self.synthesize_report_stream(start_date, end_date, period_df, chunk_summaries))
+
+    def synthesize_report_stream(self, start_date: str, end_date: str, period_df: pd.DataFrame,
+                                 chunk_summaries: List[Tuple[str, str]]) -> Iterator[str]:
+        """
+        根据分段摘要流式生成最终复盘报告（map-reduce的汇总步骤）
+
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            period_df: 周期数据（用于整体指标和降级报告）
+            chunk_summaries: [(分段名称, 摘要)]，按时间顺序
+
+        Yields:
+            Markdown片段（失败时产出降级报告）
+        """
+        summary = self._report_summary(period_df)
+        prompt = self._report_prompt(start_date, end_date, period_df, summary, chunk_summaries)
+        yield from self._stream_with_fallback(
+            prompt, 0.5, lambda: self._get_default_report(*summary), "AI复盘汇总失败",
+            'synthesize_report_stream'
+        )
+
+    def _get_default_chunk_summary(self, chunk_df: pd.DataFrame) -> str:
+        """降级分段摘要"""
+        total_revenue, avg_arpu, arpu_change, content_performance = self._report_summary(chunk_df)
+        top_content = content_performance.index[0] if len(content_performance) > 0 else '未知'
+        return (f"总收入{total_revenue:,.0f}元，平均边现{avg_arpu:.4f}元，"
+                f"边现变化{arpu_change:+.1f}%，收入最高的内容为{top_content}。")
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_shared_engine(api_key: str = None, model: str = None, base_url: str = None,
+                      provider: str = 'OpenAI') -> AsyncAIStrategyEngine:
+    """
+    获取进程级共享的AI引擎
+
+    相同 (提供商, 模型, Base URL, API Key) 的会话共用一个引擎：复用同一个客户端的长连接池，
+    并共享进行中的请求（相同prompt并发时只请求一次上游）。API Key只以哈希参与key。
+
+    Args:
+        api_key: API Key
+        model: 模型名称
+        base_url: API Base URL
+        provider: 提供商名称
+
+    Returns:
+        AsyncAIStrategyEngine
+    """
+    api_key = api_key or Config.OPENAI_API_KEY
+    model = model or Config.OPENAI_MODEL
+    base_url = base_url or Config.OPENAI_BASE_URL
+    key = (provider, model, base_url, hashlib.sha256(api_key.encode('utf-8')).hexdigest())
+
+    engine = _engines.get(key)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = AsyncAIStrategyEngine(api_key=api_key, model=model, base_url=base_url)
+                _engines[key] = engine
+    return engine
@@ -0,0 +1,283 @@
+"""
+AI调用指标模块 - 逐次记录耗时、token、重试、缓存命中和降级，汇总为直方图并导出
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from utils.config import Config
+
+
+# 直方图分桶上界（最后一个桶为+Inf）
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+
+class CallRecord:
+    """一次AI操作的调用记录（由各层在调用过程中逐项填写）"""
+
+    FIELDS = (
+        'operation', 'model', 'timestamp', 'duration', 'ttft', 'prompt_tokens', 'completion_tokens',
+        'tokens_estimated', 'retries', 'cache_hit', 'fallback', 'parse_failures', 'hedged',
+        'provider', 'error'
+    )
+
+    def __init__(self, operation: str, model: str = None):
+        self.operation = operation
+        self.model = model
+        self.timestamp = time.time()
+        self.duration = None
+        self.ttft = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tokens_estimated = False
+        self.retries = 0
+        self.cache_hit = False
+        self.fallback = False
+        self.parse_failures = 0
+        self.hedged = False
+        self.provider = None
+        self.error = None
+
+    def add_usage(self, usage):
+        """累加接口返回的token用量（OpenAI usage对象，缺失时忽略）"""
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+_current = contextvars.ContextVar('ai_call_record', default=None)
+
+
+def current_call() -> CallRecord:
+    """当前上下文中正在记录的调用（不在记录中时返回一次性的空记录，调用方无需判空）"""
+    record = _current.get()
+    return record if record is not None else CallRecord('untracked')
+
+
+class _Histogram:
+    """累积分桶直方图（Prometheus语义：每个桶计数 <= 上界的样本）"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[tuple]:
+        """[(上界文本, 累计数)]，最后一项为+Inf"""
+        bounds = [f"{b:g}" for b in self.buckets] + ['+Inf']
+        return list(zip(bounds, np.cumsum(self.counts).tolist()))
+
+
+class AIMetrics:
+    """AI调用指标收集器
+
+    每次调用完成后更新按操作分组的直方图和计数器，保留最近的调用明细供诊断面板计算分位数，
+    并追加写入JSONL文件、重写Prometheus文本格式文件，供本地采集程序读取。
+    """
+
+    def __init__(self, jsonl_path: str = None, prom_path: str = None, max_records: int = 1000,
+                 jsonl_max_bytes: int = 0):
+        """
+        初始化指标收集器
+
+        Args:
+            jsonl_path: 调用明细JSONL文件（None表示不写）
+            prom_path: Prometheus文本格式文件（None表示不写）
+            max_records: 内存中保留的最近调用数
+            jsonl_max_bytes: JSONL超过该大小时轮转为 .1 备份（只保留一份，0表示不限制）
+        """
+        self.jsonl_path = jsonl_path
+        self.jsonl_max_bytes = jsonl_max_bytes
+        self.prom_path = prom_path
+        self.records = deque(maxlen=max_records)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, operation: str, model: str = None) -> Iterator[CallRecord]:
+        """
+        记录一次AI操作：进入时创建记录并设为当前调用，退出时计时并汇总
+
+        Args:
+            operation: 操作名（recommend_strategy/explain_anomaly/...）
+            model: 模型名称
+        """
+        record = CallRecord(operation, model)
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = record.error or type(e).__name__
+            raise
+        finally:
+            record.duration = time.perf_counter() - started
+            try:
+                _current.reset(token)
+            except ValueError:
+                # 流式生成器在其他上下文中被关闭
+                pass
+            self.record(record)
+
+    def _histogram(self, name: str, operation: str, buckets: tuple) -> _Histogram:
+        key = (name, operation)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(buckets)
+        return histogram
+
+    def _count(self, name: str, labels: tuple, value: float = 1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def record(self, record: CallRecord):
+        """汇总一次调用记录并导出"""
+        op = record.operation
+        outcome = 'cache_hit' if record.cache_hit else ('fallback' if record.fallback else 'ok')
+        with self._lock:
+            self.records.append(record)
+            self._histogram('ai_call_duration_seconds', op, LATENCY_BUCKETS).observe(record.duration or 0.0)
+            if record.ttft is not None:
+                self._histogram('ai_time_to_first_token_seconds', op, LATENCY_BUCKETS).observe(record.ttft)
+            if not record.cache_hit:
+                self._histogram('ai_call_tokens', op, TOKEN_BUCKETS).observe(
+                    record.prompt_tokens + record.completion_tokens
+                )
+            self._count('ai_calls_total', (('operation', op), ('outcome', outcome)))
+            self._count('ai_tokens_total', (('operation', op), ('kind', 'prompt')), record.prompt_tokens)
+            self._count('ai_tokens_total', (('operation', op), ('kind', 'completion')), record.completion_tokens)
+            self._count('ai_call_retries_total', (('operation', op),), record.retries)
+            self._count('ai_parse_failures_total', (('operation', op),), record.parse_failures)
+            self._count('ai_hedged_calls_total', (('operation', op),), int(record.hedged))
+            prom_text = self.to_prometheus() if self.prom_path else None
+
+        self._export(record, prom_text)
+
+    def _export(self, record: CallRecord, prom_text: Optional[str]):
+        try:
+            if self.jsonl_path:
+                self._rotate_jsonl()
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+            if prom_text is not None:
+                # 先写临时文件再替换，采集程序不会读到写了一半的文件
+                tmp_path = f"{self.prom_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(prom_text)
+                os.replace(tmp_path, self.prom_path)
+        except OSError as e:
+            logger.warning(f"AI调用指标写入失败: {e}")
+
+    def _rotate_jsonl(self):
+        """JSONL达到上限时改名为 .1（覆盖旧备份），磁盘占用最多约为上限的两倍"""
+        if self.jsonl_max_bytes <= 0:
+            return
+        try:
+            if os.path.getsize(self.jsonl_path) >= self.jsonl_max_bytes:
+                os.replace(self.jsonl_path, f"{self.jsonl_path}.1")
+        except FileNotFoundError:
+            pass  # 尚未写过，或已被其他线程/进程轮转
+
+    def to_prometheus(self) -> str:
+        """Prometheus文本格式（调用方需持有锁或接受并发下的近似值）"""
+        lines = []
+        helps = {
+            'ai_call_duration_seconds': ('histogram', "AI操作端到端耗时（秒）"),
+            'ai_time_to_first_token_seconds': ('histogram', "流式输出首字耗时（秒）"),
+            'ai_call_tokens': ('histogram', "单次操作消耗的token数"),
+            'ai_calls_total': ('counter', "AI操作次数（按结果：ok/cache_hit/fallback）"),
+            'ai_tokens_total': ('counter', "累计token数"),
+            'ai_call_retries_total': ('counter', "累计重试次数"),
+            'ai_parse_failures_total': ('counter', "累计解析失败次数"),
+            'ai_hedged_calls_total': ('counter', "触发对冲请求的操作次数"),
+        }
+        for name, (kind, text) in helps.items():
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (metric, op), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{operation="{op}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{operation="{op}"}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{operation="{op}"}} {histogram.count}')
+            else:
+                for (metric, labels), value in sorted(self._counters.items()):
+                    if metric != name:
+                        continue
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels)
+                    lines.append(f'{name}{{{label_text}}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> pd.DataFrame:
+        """按操作汇总最近的调用（诊断面板展示用）"""
+        with self._lock:
+            rows = [r.to_dict() for r in self.records]
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows)
+        summary = df.groupby('operation').agg(
+            调用数=('operation', 'size'),
+            P50耗时=('duration', lambda s: s.quantile(0.5)),
+            P95耗时=('duration', lambda s: s.quantile(0.95)),
+            首字P50=('ttft', lambda s: s.dropna().quantile(0.5) if s.notna().any() else np.nan),
+            平均输入token=('prompt_tokens', 'mean'),
+            平均输出token=('completion_tokens', 'mean'),
+            缓存命中率=('cache_hit', 'mean'),
+            降级率=('fallback', 'mean'),
+            重试=('retries', 'sum'),
+            解析失败=('parse_failures', 'sum'),
+        )
+        return summary.round(2).reset_index().rename(columns={'operation': '操作'})
+
+    def reset(self):
+        """清空内存中的统计（不删除已导出的文件）"""
+        with self._lock:
+            self.records.clear()
+            self._histograms.clear()
+            self._counters.clear()
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_ai_metrics() -> AIMetrics:
+    """获取进程级共享的指标收集器（AI_METRICS_EXPORT=0时只在内存中汇总）"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                if Config.AI_METRICS_EXPORT:
+                    os.makedirs(os.path.dirname(Config.AI_METRICS_JSONL_PATH), exist_ok=True)
+                    _metrics = AIMetrics(
+                        Config.AI_METRICS_JSONL_PATH, Config.AI_METRICS_PROM_PATH,
+                        jsonl_max_bytes=Config.AI_METRICS_JSONL_MAX_BYTES,
+                    )
+                else:
+                    _metrics = AIMetrics()
+    return _metrics
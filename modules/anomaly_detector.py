@@ -3,66 +3,568 @@
 """
 import pandas as pd
 import numpy as np
+import json
+import os
+import warnings
+from bisect import bisect_left, insort
+from collections import deque
+from numpy.lib.stride_tricks import sliding_window_view
 from utils.config import Config
 
 
+# 滚动中位数/MAD：窗口不超过该天数时对所有序列整体向量化计算，否则逐条序列维护有序窗口
+MAD_VECTOR_WINDOW = 64
+MAD_VECTOR_CELLS = 2 ** 24  # 向量化计算时每块 (序列数 × 天数 × 窗口) 的最多元素数，控制内存
+
+# 异常分级（按|Z-Score|从高到低匹配）
+ANOMALY_LEVELS = [
+    (2.5, '🔴 严重'),
+    (2.0, '🟠 中度'),
+    (1.5, '🟡 轻微'),
+]
+
+
+def _rolling_mean_std(values: np.ndarray, window: int):
+    """
+    基于累计和的滚动均值/标准差（沿最后一维，min_periods=1，ddof=1，忽略NaN）
+
+    与 pandas rolling(window, min_periods=1).mean()/.std() 结果一致：
+    窗口内只有1个有效值时标准差为NaN，没有有效值时均值也为NaN。
+
+    Returns:
+        (mean, std, count)
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    n = values.shape[-1]
+
+    # 以首个有效值为参照去中心化，减小累计平方和的数值误差（恒定序列保持精确为0）
+    if n:
+        first_valid = np.argmax(valid, axis=-1)[..., None]
+        center = np.take_along_axis(values, first_valid, axis=-1)
+        center = np.where(np.isnan(center), 0.0, center)
+    else:
+        center = 0.0
+    centered = np.where(valid, values - center, 0.0)
+
+    window_sum = np.cumsum(centered, axis=-1)
+    window_sum_sq = np.cumsum(centered * centered, axis=-1)
+    count = np.cumsum(valid, axis=-1, dtype=float)
+    if n > window:
+        # 窗口和 = 累计和[i] - 累计和[i - window]（右侧先复制，避免原地相减覆盖尚未使用的值）
+        window_sum_sq[..., window:] -= window_sum_sq[..., :-window].copy()
+        window_sum[..., window:] -= window_sum[..., :-window].copy()
+        count[..., window:] -= count[..., :-window].copy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = window_sum / count
+        var = (window_sum_sq - window_sum * window_sum / count) / (count - 1)
+
+    # 抵消误差可能产生极小的负数或非零值，相对数据量级可忽略的方差视为0
+    scale = np.max(centered * centered + center * center, axis=-1, keepdims=True) if n else 0
+    var = np.where(var <= 1e-24 * scale, 0.0, var)
+
+    return mean + center, np.sqrt(var), count
+
+
+def _calendar_adjust(values: np.ndarray, holiday: np.ndarray, robust: bool = False) -> np.ndarray:
+    """
+    按行剔除日历效应：周末/节假日的值减去（周末基线 - 工作日基线）
+
+    Args:
+        values: (序列数, 天数) 矩阵，缺失为NaN
+        holiday: (天数,) 或 (序列数, 天数) 的布尔矩阵
+        robust: 为True时基线取中位数（不受个别异常值影响），否则取均值
+    """
+    holiday = np.broadcast_to(holiday, values.shape)
+    valid = ~np.isnan(values)
+
+    def masked_center(mask):
+        count = mask.sum(axis=-1)
+        if robust:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)  # 全NaN行
+                return np.nanmedian(np.where(mask, values, np.nan), axis=-1), count
+        total = np.where(mask, values, 0.0).sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count, count
+
+    overall_mean, _ = masked_center(valid)
+    workday_mean, workday_count = masked_center(valid & ~holiday)
+    weekend_mean, weekend_count = masked_center(valid & holiday)
+
+    # 某类日期没有数据时退化为整体基线
+    workday_mean = np.where(workday_count > 0, workday_mean, overall_mean)
+    weekend_mean = np.where(weekend_count > 0, weekend_mean, overall_mean)
+
+    return values - np.where(holiday, (weekend_mean - workday_mean)[..., None], 0.0)
+
+
+def _kth_of_sorted_pair(a, len_a: int, b, len_b: int, k: int) -> float:
+    """
+    两个升序序列合并后的第k小值（k从0开始），二分查找，O(log w)
+
+    a、b 为按下标取值的函数，避免为每个窗口物化偏差数组
+    """
+    lo, hi = max(0, k + 1 - len_b), min(k + 1, len_a)
+    while lo < hi:
+        i = (lo + hi) // 2  # 从a中取i个，从b中取k+1-i个
+        if a(i) < b(k - i):
+            lo = i + 1
+        else:
+            hi = i
+    i, j = lo, k + 1 - lo
+    return max(a(i - 1) if i > 0 else -np.inf, b(j - 1) if j > 0 else -np.inf)
+
+
+def _rolling_median_mad(values: np.ndarray, window: int):
+    """
+    滚动中位数/MAD（min_periods=1，忽略NaN），与 pandas rolling(window, min_periods=1).median() 一致
+
+    窗口内的值维护为有序列表，每步二分定位后插入/删除（列表元素移动为O(w)，整体O(n·w)，
+    但移动是一次内存拷贝，远快于逐步重新排序）；
+    MAD = median(|x - 中位数|)：中位数左侧与右侧的偏差各自有序，
+    用两个有序序列的第k小值二分求得，O(log w)，不需要物化偏差数组。
+    适合长窗口的单条序列；短窗口的多条序列见_rolling_median_mad_matrix。
+
+    Returns:
+        (median, mad)，均为与values同长度的一维数组
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    median = np.full(n, np.nan)
+    mad = np.full(n, np.nan)
+    ordered = []
+    for i, value in enumerate(values.tolist()):
+        if i >= window:
+            oldest = values[i - window]
+            if oldest == oldest:
+                del ordered[bisect_left(ordered, oldest)]
+        if value == value:
+            insort(ordered, value)
+
+        size = len(ordered)
+        if size == 0:
+            continue
+        half = size // 2
+        center = ordered[half] if size % 2 else (ordered[half - 1] + ordered[half]) / 2
+        median[i] = center
+
+        # 左侧偏差：center - ordered[half-1], center - ordered[half-2], ...（升序）
+        # 右侧偏差：ordered[half] - center, ordered[half+1] - center, ...（升序）
+        def left(j):
+            return center - ordered[half - 1 - j]
+
+        def right(j):
+            return ordered[half + j] - center
+
+        len_left, len_right = half, size - half
+        if size % 2:
+            mad[i] = _kth_of_sorted_pair(left, len_left, right, len_right, half)
+        else:
+            mad[i] = (
+                _kth_of_sorted_pair(left, len_left, right, len_right, half - 1)
+                + _kth_of_sorted_pair(left, len_left, right, len_right, half)
+            ) / 2
+    return median, mad
+
+
+def _sorted_nanmedian(block: np.ndarray) -> np.ndarray:
+    """沿最后一维的中位数（忽略NaN，全NaN为NaN）：np.sort把NaN排在末尾，按有效值个数取中间位置"""
+    ordered = np.sort(block, axis=-1)
+    count = (~np.isnan(ordered)).sum(axis=-1, keepdims=True)
+    lower = np.take_along_axis(ordered, np.maximum(count - 1, 0) // 2, axis=-1)[..., 0]
+    upper = np.take_along_axis(ordered, count // 2 - (count == 0), axis=-1)[..., 0]
+    return np.where(count[..., 0] > 0, (lower + upper) / 2, np.nan)
+
+
+def _rolling_median_mad_matrix(values: np.ndarray, window: int):
+    """
+    多条序列的滚动中位数/MAD（min_periods=1，忽略NaN），结果与逐行调用_rolling_median_mad一致
+
+    左侧补window-1个NaN后取滑动窗口视图，按行分块对窗口排序，一次算出所有序列、所有日期的
+    中位数和MAD：O(n·w log w)，但没有逐元素的Python循环，适合短窗口、多序列的批量检测。
+
+    Returns:
+        (median, mad)，均为与values同形状的二维数组
+    """
+    values = np.asarray(values, dtype=float)
+    rows, n = values.shape
+    padded = np.concatenate([np.full((rows, window - 1), np.nan), values], axis=1)
+    windows = sliding_window_view(padded, window, axis=1)
+    median = np.empty_like(values)
+    mad = np.empty_like(values)
+    step = max(1, MAD_VECTOR_CELLS // max(n * window, 1))
+    for start in range(0, rows, step):
+        block = windows[start:start + step]
+        median[start:start + step] = _sorted_nanmedian(block)
+        mad[start:start + step] = _sorted_nanmedian(np.abs(block - median[start:start + step, :, None]))
+    return median, mad
+
+
+def _robust_scale(mad: np.ndarray) -> np.ndarray:
+    """MAD换算为正态分布下的等效标准差"""
+    return 1.4826 * mad
+
+
+def _zscore_kernel(values: np.ndarray, holiday: np.ndarray, window: int, weekday: np.ndarray):
+    """均值/标准差滚动Z-Score（剔除周末与工作日的均值差）"""
+    adjusted = _calendar_adjust(values, holiday)
+    baseline, std, _ = _rolling_mean_std(adjusted, window)
+    return adjusted, baseline, std
+
+
+def _mad_kernel(values: np.ndarray, holiday: np.ndarray, window: int, weekday: np.ndarray):
+    """滚动中位数/MAD稳健Z-Score（日历效应也按中位数剔除）"""
+    adjusted = _calendar_adjust(values, holiday, robust=True)
+    if window <= MAD_VECTOR_WINDOW:
+        baseline, mad = _rolling_median_mad_matrix(adjusted, window)
+        return adjusted, baseline, _robust_scale(mad)
+
+    baseline = np.empty_like(adjusted)
+    scale = np.empty_like(adjusted)
+    for row in range(adjusted.shape[0]):
+        baseline[row], mad = _rolling_median_mad(adjusted[row], window)
+        scale[row] = _robust_scale(mad)
+    return adjusted, baseline, scale
+
+
+def _seasonal_kernel(values: np.ndarray, holiday: np.ndarray, window: int, weekday: np.ndarray):
+    """
+    星期季节分解：值 = 趋势 + 星期效应 + 残差，按残差的中位数/MAD计算稳健Z-Score
+
+    趋势为居中的window日滑动平均；星期效应为各星期几（工作日的节假日单独一类）
+    去趋势值的中位数；全部为整列向量化运算。
+    """
+    n_days = values.shape[-1]
+    half = window // 2
+
+    # 居中滑动平均：尾部补NaN后取尾随窗口，再整体左移half
+    padded = np.concatenate([values, np.full(values.shape[:-1] + (half,), np.nan)], axis=-1)
+    trend = _rolling_mean_std(padded, window)[0][..., half:half + n_days]
+    detrended = values - trend
+
+    holiday = np.broadcast_to(holiday, values.shape)
+    category = np.where(holiday & (weekday < 5), 7, np.broadcast_to(weekday, values.shape))
+    seasonal = np.zeros_like(values)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # 全NaN行
+        for cat in range(8):
+            mask = category == cat
+            if mask.any():
+                effect = np.nanmedian(np.where(mask, detrended, np.nan), axis=-1)
+                seasonal = np.where(mask, np.nan_to_num(effect)[..., None], seasonal)
+
+        residual = detrended - seasonal
+        resid_center = np.nanmedian(residual, axis=-1, keepdims=True)
+        scale = _robust_scale(np.nanmedian(np.abs(residual - resid_center), axis=-1, keepdims=True))
+
+    adjusted = values - seasonal
+    baseline = trend + resid_center
+    return adjusted, baseline, np.broadcast_to(scale, values.shape).copy()
+
+
+# 异常检测算法注册表：名称 -> kernel(values, holiday, window, weekday) -> (adjusted, baseline, scale)
+# Z-Score = (adjusted - baseline) / scale
+ANOMALY_METHODS = {
+    'zscore': _zscore_kernel,
+    'mad': _mad_kernel,
+    'seasonal': _seasonal_kernel,
+}
+
+
+def _score_matrix(values: np.ndarray, holiday: np.ndarray, window: int,
+                  weekday: np.ndarray, method: str):
+    """按指定算法计算 (adjusted, baseline, scale, zscore)"""
+    kernel = ANOMALY_METHODS.get(method)
+    if kernel is None:
+        raise ValueError(f"不支持的异常检测算法: {method}（可选: {', '.join(ANOMALY_METHODS)}）")
+    adjusted, baseline, scale = kernel(values, holiday, window, weekday)
+
+    # 处理标准差为0的情况
+    scale = np.where(scale == 0, _nanstd_rows(values)[:, None], scale)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zscore = (adjusted - baseline) / scale
+    return adjusted, baseline, scale, zscore
+
+
+def _nanstd_rows(values: np.ndarray) -> np.ndarray:
+    """按行计算样本标准差（ddof=1，忽略NaN，有效值不足2个时为NaN）"""
+    count = (~np.isnan(values)).sum(axis=-1)
+    out = np.full(values.shape[:-1], np.nan)
+    enough = count > 1
+    if enough.any():
+        out[enough] = np.nanstd(values[enough], axis=-1, ddof=1)
+    return out
+
+
+class AnomalyResult:
+    """异常检测结果
+
+    以NumPy数组保存逐点的检测中间量，不修改输入DataFrame。
+    """
+
+    def __init__(self, index: pd.Index, dates: np.ndarray, arpu: np.ndarray,
+                 adjusted: np.ndarray, baseline: np.ndarray, std: np.ndarray,
+                 zscore: np.ndarray, is_anomaly: np.ndarray,
+                 dau: np.ndarray, revenue: np.ndarray):
+        self.index = index
+        self.dates = dates
+        self.arpu = arpu
+        self.adjusted = adjusted
+        self.baseline = baseline
+        self.std = std
+        self.zscore = zscore
+        self.is_anomaly = is_anomaly
+        self.dau = dau
+        self.revenue = revenue
+
+    def __len__(self) -> int:
+        return len(self.zscore)
+
+    @property
+    def n_anomalies(self) -> int:
+        return int(self.is_anomaly.sum())
+
+    @staticmethod
+    def level_of(zscore: np.ndarray) -> np.ndarray:
+        """按|Z-Score|计算异常分级"""
+        abs_z = np.abs(zscore)
+        conditions = [abs_z > bound for bound, _ in ANOMALY_LEVELS]
+        labels = [label for _, label in ANOMALY_LEVELS]
+        with np.errstate(invalid='ignore'):
+            return np.select(conditions, labels, default='normal')
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        异常点DataFrame
+
+        Returns:
+            包含 date, arpu, arpu_zscore, anomaly_level, dau, revenue 的DataFrame；无异常时为空DataFrame
+        """
+        mask = self.is_anomaly
+        if not mask.any():
+            return pd.DataFrame()
+
+        return pd.DataFrame({
+            'date': self.dates[mask],
+            'arpu': self.arpu[mask],
+            'arpu_zscore': self.zscore[mask],
+            'anomaly_level': self.level_of(self.zscore[mask]),
+            'dau': self.dau[mask],
+            'revenue': self.revenue[mask],
+        }, index=self.index[mask])
+
+
 class AnomalyDetector:
     """异常检测器"""
 
     @staticmethod
-    def detect_arpu_anomalies(df: pd.DataFrame, threshold: float = None):
+    def score_arpu(df: pd.DataFrame, threshold: float = None,
+                   window: int = None, method: str = None) -> AnomalyResult:
         """
-        智能异常检测（剔除日历效应）
+        智能异常检测（剔除日历效应），全部在NumPy数组上完成，不修改输入
 
         Args:
-            df: 包含arpu, is_holiday的DataFrame
+            df: 包含date, arpu, is_holiday, dau的DataFrame（可选dau_change）
             threshold: Z-Score阈值（默认使用配置）
+            window: 滚动窗口天数（默认使用配置）
+            method: 检测算法 zscore/mad/seasonal（默认使用配置）
 
         Returns:
-            异常点DataFrame
+            AnomalyResult
         """
         threshold = threshold or Config.ANOMALY_THRESHOLD
+        window = window or Config.ANOMALY_WINDOW
+        method = method or Config.ANOMALY_METHOD
 
-        # 1. 计算工作日/周末基线
-        workday_mean = df[df['is_holiday'] == 0]['arpu'].mean() if len(df[df['is_holiday'] == 0]) > 0 else df['arpu'].mean()
-        weekend_mean = df[df['is_holiday'] == 1]['arpu'].mean() if len(df[df['is_holiday'] == 1]) > 0 else df['arpu'].mean()
+        arpu = df['arpu'].to_numpy(dtype=float)
+        holiday = df['is_holiday'].to_numpy() != 0
+        dau = df['dau'].to_numpy()
+        weekday = pd.DatetimeIndex(df['date']).dayofweek.to_numpy()
 
-        # 2. 归一化处理（剔除日历效应）
-        df['arpu_adjusted'] = df.apply(
-            lambda row: row['arpu'] - (weekend_mean - workday_mean) if row['is_holiday'] else row['arpu'],
-            axis=1
+        # 1-3. 剔除日历效应后计算滚动Z-Score
+        adjusted, baseline, std, zscore = (
+            row[0] for row in _score_matrix(arpu[None, :], holiday, window, weekday, method)
         )
 
-        # 3. 滚动窗口Z-Score
-        df['arpu_ma7'] = df['arpu_adjusted'].rolling(window=Config.ANOMALY_WINDOW, min_periods=1).mean()
-        df['arpu_std7'] = df['arpu_adjusted'].rolling(window=Config.ANOMALY_WINDOW, min_periods=1).std()
+        # 4. 多维度交叉验证（避免DAU突增导致的误判）
+        if 'dau_change' in df.columns:
+            dau_change = df['dau_change'].to_numpy(dtype=float)
+        else:
+            dau_float = dau.astype(float)
+            dau_change = np.full(len(dau_float), np.nan)
+            dau_change[1:] = (dau_float[1:] / dau_float[:-1] - 1) * 100
 
-        # 处理标准差为0的情况
-        df['arpu_std7'] = df['arpu_std7'].replace(0, df['arpu'].std())
+        with np.errstate(invalid='ignore'):
+            is_anomaly = (
+                (np.abs(zscore) > threshold) &  # 边现异常
+                (np.abs(dau_change) < 30)       # DAU无剧烈波动
+            )
 
-        df['arpu_zscore'] = (df['arpu_adjusted'] - df['arpu_ma7']) / df['arpu_std7']
+        return AnomalyResult(
+            index=df.index,
+            dates=df['date'].to_numpy(),
+            arpu=arpu,
+            adjusted=adjusted,
+            baseline=baseline,
+            std=std,
+            zscore=zscore,
+            is_anomaly=is_anomaly,
+            dau=dau,
+            revenue=df['revenue'].to_numpy()
+        )
 
-        # 4. 多维度交叉验证（避免DAU突增导致的误判）
-        if 'dau_change' not in df.columns:
-            df['dau_change'] = df['dau'].pct_change() * 100
+    @staticmethod
+    def detect_matrix(values: np.ndarray, holiday: np.ndarray, threshold: float = None,
+                      window: int = None, dau: np.ndarray = None,
+                      series_keys: pd.DataFrame = None, dates=None,
+                      block_size: int = 4096, method: str = None) -> pd.DataFrame:
+        """
+        批量异常检测：对 (序列数 × 天数) 矩阵一次性计算剔除日历效应后的滚动Z-Score
 
-        is_anomaly = (
-            (abs(df['arpu_zscore']) > threshold) &  # 边现异常
-            (abs(df['dau_change']) < 30)            # DAU无剧烈波动
-        )
+        Args:
+            values: (序列数, 天数) 指标矩阵，缺失为NaN
+            holiday: (天数,) 或 (序列数, 天数) 节假日标记
+            threshold: Z-Score阈值（默认使用配置）
+            window: 滚动窗口天数（默认使用配置）
+            dau: 与values同形状的DAU矩阵（提供时剔除DAU波动超过30%的点）
+            series_keys: 每行序列的维度取值（行数等于序列数）
+            dates: 每列对应的日期
+            block_size: 每批处理的序列数（控制内存峰值）
+            method: 检测算法 zscore/mad/seasonal（默认使用配置）
 
-        # 5. 分级
-        df['anomaly_level'] = 'normal'
-        df.loc[abs(df['arpu_zscore']) > 1.5, 'anomaly_level'] = '🟡 轻微'
-        df.loc[abs(df['arpu_zscore']) > 2.0, 'anomaly_level'] = '🟠 中度'
-        df.loc[abs(df['arpu_zscore']) > 2.5, 'anomaly_level'] = '🔴 严重'
+        Returns:
+            按|Z-Score|降序排列的预警表
+        """
+        threshold = threshold or Config.ANOMALY_THRESHOLD
+        window = window or Config.ANOMALY_WINDOW
+        method = method or Config.ANOMALY_METHOD
+        values = np.asarray(values, dtype=float)
+        holiday = np.asarray(holiday) != 0
+        if dates is not None:
+            weekday = pd.DatetimeIndex(np.asarray(dates)).dayofweek.to_numpy()
+        else:
+            weekday = np.arange(values.shape[-1]) % 7
 
-        anomalies = df[is_anomaly].copy()
+        hits = {'series': [], 'day': [], 'zscore': [], 'baseline': []}
+        for start in range(0, values.shape[0], block_size):
+            block = values[start:start + block_size]
+            block_holiday = holiday if holiday.ndim == 1 else holiday[start:start + block_size]
 
-        if len(anomalies) > 0:
-            return anomalies[['date', 'arpu', 'arpu_zscore', 'anomaly_level', 'dau', 'revenue']]
+            _, baseline, _, zscore = _score_matrix(block, block_holiday, window, weekday, method)
+
+            with np.errstate(invalid='ignore'):
+                is_anomaly = np.abs(zscore) > threshold
+
+                # 多维度交叉验证（避免DAU突增导致的误判）
+                if dau is not None:
+                    block_dau = np.asarray(dau[start:start + block_size], dtype=float)
+                    dau_change = np.full(block_dau.shape, np.nan)
+                    dau_change[:, 1:] = (block_dau[:, 1:] / block_dau[:, :-1] - 1) * 100
+                    is_anomaly &= np.abs(dau_change) < 30
+
+            rows, cols = np.nonzero(is_anomaly)
+            hits['series'].append(rows + start)
+            hits['day'].append(cols)
+            hits['zscore'].append(zscore[rows, cols])
+            hits['baseline'].append(baseline[rows, cols])
+
+        series = np.concatenate(hits['series']) if hits['series'] else np.array([], dtype=int)
+        day = np.concatenate(hits['day']) if hits['day'] else np.array([], dtype=int)
+        zscore = np.concatenate(hits['zscore']) if hits['zscore'] else np.array([])
+        baseline = np.concatenate(hits['baseline']) if hits['baseline'] else np.array([])
+
+        order = np.argsort(-np.abs(zscore), kind='stable')
+        series, day, zscore, baseline = series[order], day[order], zscore[order], baseline[order]
+
+        if series_keys is not None and len(series_keys.columns) > 0:
+            alerts = series_keys.iloc[series].reset_index(drop=True)
         else:
-            return pd.DataFrame()
+            alerts = pd.DataFrame({'series': series})
+        alerts['date'] = np.asarray(dates)[day] if dates is not None else day
+        alerts['value'] = values[series, day]
+        alerts['baseline'] = baseline
+        alerts['zscore'] = zscore
+        alerts['anomaly_level'] = AnomalyResult.level_of(zscore)
+        alerts['rank'] = np.arange(1, len(alerts) + 1)
+        return alerts
+
+    @staticmethod
+    def detect_batch(df: pd.DataFrame, value_col: str = 'arpu', series_cols: list = None,
+                     date_col: str = 'date', holiday_col: str = 'is_holiday',
+                     threshold: float = None, window: int = None,
+                     block_size: int = 4096, method: str = None) -> pd.DataFrame:
+        """
+        长表批量异常检测：平台 × 内容类型 × 资源位等所有组合一次向量化完成
+
+        Args:
+            df: 长表（每行一个 序列 × 日期 的观测）
+            value_col: 检测指标列（为arpu且不存在时由revenue/dau计算）
+            series_cols: 序列维度列（默认取platform/content_type/resource_position中存在的列）
+            date_col: 日期列
+            holiday_col: 节假日标记列
+            threshold: Z-Score阈值（默认使用配置）
+            window: 滚动窗口天数（默认使用配置）
+            block_size: 每批处理的序列数
+            method: 检测算法 zscore/mad/seasonal（默认使用配置）
+
+        Returns:
+            按|Z-Score|降序排列的预警表（含序列维度、date、value、baseline、zscore、anomaly_level、rank）
+        """
+        if series_cols is None:
+            series_cols = [c for c in ('platform', 'content_type', 'resource_position') if c in df.columns]
+
+        if value_col in df.columns:
+            observed = df[value_col].to_numpy(dtype=float)
+        elif value_col == 'arpu':
+            observed = df['revenue'].to_numpy(dtype=float) / df['dau'].to_numpy(dtype=float)
+        else:
+            raise KeyError(f"缺少指标列: {value_col}")
+
+        # 长表 -> (序列数 × 天数) 矩阵
+        if series_cols:
+            grouped = df.groupby(series_cols, sort=True, observed=True)
+            series_code = grouped.ngroup().to_numpy()
+            series_keys = grouped.size().index.to_frame(index=False)
+        else:
+            series_code = np.zeros(len(df), dtype=int)
+            series_keys = None
+        day_code, dates = pd.factorize(df[date_col], sort=True)
+        shape = (int(series_code.max()) + 1 if len(df) else 0, len(dates))
+
+        values = np.full(shape, np.nan)
+        values[series_code, day_code] = observed
+
+        holiday = np.zeros(shape[1], dtype=bool)
+        holiday[day_code] = df[holiday_col].to_numpy() != 0
+
+        dau = None
+        if 'dau' in df.columns:
+            dau = np.full(shape, np.nan)
+            dau[series_code, day_code] = df['dau'].to_numpy(dtype=float)
+
+        alerts = AnomalyDetector.detect_matrix(
+            values, holiday, threshold=threshold, window=window, dau=dau,
+            series_keys=series_keys, dates=dates, block_size=block_size, method=method
+        )
+        return alerts.rename(columns={'value': value_col})
+
+    @staticmethod
+    def detect_arpu_anomalies(df: pd.DataFrame, threshold: float = None, method: str = None):
+        """
+        智能异常检测（剔除日历效应）
+
+        Args:
+            df: 包含arpu, is_holiday的DataFrame（不会被修改）
+            threshold: Z-Score阈值（默认使用配置）
+            method: 检测算法 zscore/mad/seasonal（默认使用配置）
+
+        Returns:
+            异常点DataFrame
+        """
+        return AnomalyDetector.score_arpu(df, threshold, method=method).to_frame()
 
     @staticmethod
     def get_anomaly_dates(df: pd.DataFrame, threshold: float = None) -> list:
@@ -71,3 +573,225 @@ class AnomalyDetector:
         if len(anomalies) > 0:
             return anomalies['date'].tolist()
         return []
+
+
+class _RollingWindow:
+    """滑动窗口Welford统计：新增/移除一个值都是O(1)"""
+
+    # 每累计若干次增删后按窗口内的值重算一次，消除浮点误差累积（均摊仍为O(1)）
+    RECOMPUTE_EVERY = 1024
+
+    def __init__(self, size: int, values: list = None):
+        self.size = size
+        self.values = deque(values or [], maxlen=size)
+        self._recompute()
+
+    def _recompute(self):
+        self.count = len(self.values)
+        self.mean = float(np.mean(self.values)) if self.values else 0.0
+        self.m2 = float(np.sum((np.asarray(self.values) - self.mean) ** 2)) if self.values else 0.0
+        self._updates = 0
+
+    def push(self, value: float):
+        """加入新值（窗口已满时先移除最旧的值）"""
+        if self.count == self.size:
+            oldest = self.values[0]
+            self.count -= 1
+            if self.count == 0:
+                self.mean, self.m2 = 0.0, 0.0
+            else:
+                delta = oldest - self.mean
+                self.mean -= delta / self.count
+                self.m2 = max(self.m2 - delta * (oldest - self.mean), 0.0)
+
+        self.values.append(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        self._updates += 1
+        if self._updates >= self.RECOMPUTE_EVERY:
+            self._recompute()
+
+    @property
+    def std(self) -> float:
+        """样本标准差（ddof=1）"""
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float('nan')
+
+
+class StreamingAnomalyDetector:
+    """流式异常检测器
+
+    每个序列按工作日/节假日（或星期几）分桶，各桶维护一个滑动窗口的Welford均值/方差。
+    每来一个观测值，先用同桶的历史窗口计算Z-Score（当前值不参与自己的基线），再并入窗口，
+    单点更新为O(1)。状态可序列化为JSON，重启后可恢复。
+    """
+
+    def __init__(self, threshold: float = None, window: int = None,
+                 bucket_by: str = 'holiday', min_periods: int = 3, max_alerts: int = 1000):
+        """
+        初始化流式检测器
+
+        Args:
+            threshold: Z-Score阈值（默认使用配置）
+            window: 每个桶的滑动窗口长度（默认使用配置）
+            bucket_by: 'holiday' 按工作日/节假日分桶；'weekday' 按星期几分桶（节假日单独一桶）
+            min_periods: 桶内至少积累多少个值才开始判定
+            max_alerts: 保留的最近预警条数
+        """
+        if bucket_by not in ('holiday', 'weekday'):
+            raise ValueError(f"不支持的分桶方式: {bucket_by}")
+        self.threshold = threshold or Config.ANOMALY_THRESHOLD
+        self.window = window or Config.ANOMALY_WINDOW
+        self.bucket_by = bucket_by
+        self.min_periods = max(min_periods, 2)
+        self.alerts = deque(maxlen=max_alerts)
+        self._series = {}
+
+    def _bucket(self, date: pd.Timestamp, is_holiday) -> str:
+        if is_holiday:
+            return 'holiday'
+        return 'workday' if self.bucket_by == 'holiday' else str(date.dayofweek)
+
+    def update(self, series_key, date, value: float, is_holiday=0, dau: float = None) -> dict:
+        """
+        输入一个新观测值
+
+        Args:
+            series_key: 序列标识（如 ('TV', '家庭剧', '首页位1')）
+            date: 观测日期
+            value: 指标值
+            is_holiday: 是否周末/节假日
+            dau: 当日DAU（提供时DAU波动超过30%不判为异常）
+
+        Returns:
+            触发预警时返回预警字典，否则返回None（早于已处理日期的重复数据会被忽略）
+        """
+        date = pd.Timestamp(date)
+        state = self._series.setdefault(series_key, {'last_date': None, 'last_dau': None, 'buckets': {}})
+        if state['last_date'] is not None and date <= pd.Timestamp(state['last_date']):
+            return None
+
+        bucket_name = self._bucket(date, is_holiday)
+        bucket = state['buckets'].get(bucket_name)
+        if bucket is None:
+            bucket = state['buckets'][bucket_name] = _RollingWindow(self.window)
+
+        alert = None
+        std = bucket.std
+        if bucket.count >= self.min_periods and std > 0:
+            zscore = (value - bucket.mean) / std
+            dau_stable = (
+                dau is None or not state['last_dau']
+                or abs(dau / state['last_dau'] - 1) * 100 < 30
+            )
+            if abs(zscore) > self.threshold and dau_stable:
+                alert = {
+                    'series': series_key,
+                    'date': date.strftime('%Y-%m-%d'),
+                    'value': float(value),
+                    'baseline': bucket.mean,
+                    'zscore': float(zscore),
+                    'anomaly_level': str(AnomalyResult.level_of(np.array([zscore]))[0]),
+                    'bucket': bucket_name,
+                }
+                self.alerts.append(alert)
+
+        bucket.push(float(value))
+        state['last_date'] = date.strftime('%Y-%m-%d')
+        if dau is not None:
+            state['last_dau'] = float(dau)
+        return alert
+
+    def update_frame(self, df: pd.DataFrame, value_col: str = 'arpu', series_cols: list = None,
+                     date_col: str = 'date', holiday_col: str = 'is_holiday') -> list:
+        """
+        按日期顺序逐行输入（用于补齐一批新数据）
+
+        Returns:
+            本批触发的预警列表
+        """
+        series_cols = series_cols or []
+        df = df.sort_values(date_col, kind='stable')
+        keys = (
+            list(df[series_cols].itertuples(index=False, name=None)) if series_cols
+            else ['total'] * len(df)
+        )
+        dau = df['dau'].to_numpy(dtype=float) if 'dau' in df.columns else [None] * len(df)
+
+        alerts = []
+        for key, date, value, holiday, day_dau in zip(
+            keys, df[date_col], df[value_col].to_numpy(dtype=float),
+            df[holiday_col].to_numpy(), dau
+        ):
+            alert = self.update(key, date, value, holiday, day_dau)
+            if alert is not None:
+                alerts.append(alert)
+        return alerts
+
+    def last_date(self, series_key='total'):
+        """序列已处理到的最后日期（未见过时为None）"""
+        state = self._series.get(series_key)
+        return pd.Timestamp(state['last_date']) if state and state['last_date'] else None
+
+    def to_dict(self) -> dict:
+        """导出可JSON序列化的状态"""
+        return {
+            'threshold': self.threshold,
+            'window': self.window,
+            'bucket_by': self.bucket_by,
+            'min_periods': self.min_periods,
+            'max_alerts': self.alerts.maxlen,
+            'series': [
+                {
+                    'key': list(key) if isinstance(key, tuple) else key,
+                    'last_date': state['last_date'],
+                    'last_dau': state['last_dau'],
+                    'buckets': {name: list(bucket.values) for name, bucket in state['buckets'].items()},
+                }
+                for key, state in self._series.items()
+            ],
+            'alerts': [
+                dict(alert, series=list(alert['series']) if isinstance(alert['series'], tuple) else alert['series'])
+                for alert in self.alerts
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StreamingAnomalyDetector':
+        """从to_dict()导出的状态恢复"""
+        detector = cls(
+            threshold=data['threshold'],
+            window=data['window'],
+            bucket_by=data['bucket_by'],
+            min_periods=data['min_periods'],
+            max_alerts=data['max_alerts']
+        )
+        for item in data['series']:
+            key = tuple(item['key']) if isinstance(item['key'], list) else item['key']
+            detector._series[key] = {
+                'last_date': item['last_date'],
+                'last_dau': item['last_dau'],
+                'buckets': {
+                    name: _RollingWindow(detector.window, values)
+                    for name, values in item['buckets'].items()
+                },
+            }
+        for alert in data['alerts']:
+            series = tuple(alert['series']) if isinstance(alert['series'], list) else alert['series']
+            detector.alerts.append(dict(alert, series=series))
+        return detector
+
+    def save(self, path: str):
+        """保存状态到JSON文件（原子替换）"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'StreamingAnomalyDetector':
+        """从JSON文件恢复状态"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
@@ -2,57 +2,454 @@
 数据加载模块
 """
 import pandas as pd
+import numpy as np
+import json
 import os
 from utils.config import Config
 
 
 class DataLoader:
-    """数据加载器"""
+    """数据加载器
 
-    def __init__(self, data_path: str = None):
+    支持两种存储后端：
+    - csv: data/<name>.csv（默认，便于人工查看）
+    - parquet: data/<name>.parquet/ 列式目录（按date排序写入，支持日期谓词下推与列裁剪）
+
+    storage='auto' 时，若列式文件存在且不早于CSV则优先读取列式文件。
+
+    日报数据支持增量写入（ingest_daily_metrics）：衍生指标与原始数据一起落到列式目录，
+    滚动窗口状态保存在 data/daily_metrics.state.json，每日刷新只计算新增行。
+    """
+
+    DATASETS = ['daily_metrics', 'user_segments', 'campaign_history', 'resource_capacity']
+
+    # 各数据集需在读取时解析为日期的列
+    DATE_COLUMNS = {
+        'daily_metrics': ['date'],
+        'campaign_history': ['start_date', 'end_date'],
+    }
+
+    # 计算衍生指标必须读取的原始列
+    DAILY_BASE_COLUMNS = ['date', 'dau', 'revenue', 'new_members', 'renew_members']
+
+    # 日报衍生指标列
+    DAILY_DERIVED_COLUMNS = [
+        'arpu', 'arpu_change', 'dau_change', 'revenue_change',
+        'conversion_rate', 'arpu_ma7', 'arpu_std7'
+    ]
+
+    # 衍生指标滚动窗口
+    DAILY_ROLLING_WINDOW = 7
+
+    def __init__(self, data_path: str = None, storage: str = None):
         self.data_path = data_path or Config.DATA_PATH
+        self.storage = storage or Config.DATA_STORAGE
+        if self.storage not in ('auto', 'csv', 'parquet'):
+            raise ValueError(f"不支持的存储后端: {self.storage}")
 
-    def load_daily_metrics(self) -> pd.DataFrame:
-        """加载日报数据并计算衍生指标"""
-        df = pd.read_csv(os.path.join(self.data_path, 'daily_metrics.csv'))
-        df['date'] = pd.to_datetime(df['date'])
+    # ==================== 存储后端 ====================
 
-        # 计算基础指标
+    def _csv_path(self, name: str) -> str:
+        return os.path.join(self.data_path, f'{name}.csv')
+
+    def _columnar_path(self, name: str) -> str:
+        return os.path.join(self.data_path, f'{name}.parquet')
+
+    def _use_columnar(self, name: str) -> bool:
+        """判断数据集是否从列式文件读取"""
+        if self.storage == 'csv':
+            return False
+        columnar_path = self._columnar_path(name)
+        if self.storage == 'parquet':
+            if not os.path.exists(columnar_path):
+                raise FileNotFoundError(f"列式数据不存在，请先运行 python scripts/convert_to_parquet.py: {columnar_path}")
+            return True
+
+        # auto: 列式文件存在且不早于CSV时才使用，避免读到过期数据
+        if not os.path.exists(columnar_path):
+            return False
+        csv_path = self._csv_path(name)
+        return not os.path.exists(csv_path) or os.path.getmtime(columnar_path) >= os.path.getmtime(csv_path)
+
+    def get_source_path(self, name: str) -> str:
+        """返回数据集当前实际读取的文件路径"""
+        return self._columnar_path(name) if self._use_columnar(name) else self._csv_path(name)
+
+    def _read_table(self, name: str, columns: list = None,
+                    start_date=None, end_date=None, date_column: str = 'date') -> pd.DataFrame:
+        """
+        读取数据集（列式后端下推日期过滤与列裁剪，CSV后端读取后过滤）
+
+        Args:
+            name: 数据集名称
+            columns: 需要读取的列（None表示全部）
+            start_date: 起始日期（含）
+            end_date: 结束日期（含）
+            date_column: 日期过滤所用列
+        """
+        start_date = pd.Timestamp(start_date) if start_date is not None else None
+        end_date = pd.Timestamp(end_date) if end_date is not None else None
+
+        if self._use_columnar(name):
+            filters = []
+            if start_date is not None:
+                filters.append((date_column, '>=', start_date))
+            if end_date is not None:
+                filters.append((date_column, '<=', end_date))
+            return pd.read_parquet(
+                self._columnar_path(name),
+                engine='pyarrow',
+                columns=columns,
+                filters=filters or None
+            )
+
+        date_columns = [
+            col for col in self.DATE_COLUMNS.get(name, [])
+            if columns is None or col in columns
+        ]
+        df = pd.read_csv(self._csv_path(name), usecols=columns, parse_dates=date_columns)
+        if start_date is not None:
+            df = df[df[date_column] >= start_date]
+        if end_date is not None:
+            df = df[df[date_column] <= end_date]
+        return df.reset_index(drop=True)
+
+    def get_date_range(self, name: str = 'daily_metrics', date_column: str = 'date') -> tuple:
+        """获取数据集的日期范围（仅读取日期列）"""
+        dates = self._read_table(name, columns=[date_column])[date_column]
+        if len(dates) == 0:
+            return None, None
+        return dates.min(), dates.max()
+
+    def convert_to_columnar(self, names: list = None, row_group_size: int = 100_000) -> dict:
+        """
+        一次性将CSV转换为列式存储
+
+        日报数据按date排序后写入，每个row group都带有date的min/max统计，
+        读取时按日期过滤可直接跳过无关row group。
+
+        Args:
+            names: 需要转换的数据集（默认全部）
+            row_group_size: 每个row group的行数
+
+        Returns:
+            {数据集名称: 行数}
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        converted = {}
+        for name in names or self.DATASETS:
+            df = pd.read_csv(self._csv_path(name), parse_dates=self.DATE_COLUMNS.get(name, []))
+            if name == 'daily_metrics':
+                df = df.sort_values('date', kind='stable').reset_index(drop=True)
+
+            columnar_path = self._columnar_path(name)
+            os.makedirs(columnar_path, exist_ok=True)
+            for old_part in os.listdir(columnar_path):
+                if old_part.endswith('.parquet'):
+                    os.remove(os.path.join(columnar_path, old_part))
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pq.write_table(
+                table,
+                os.path.join(columnar_path, 'part-00000.parquet'),
+                row_group_size=row_group_size
+            )
+            converted[name] = len(df)
+
+            # 重新转换后原始列覆盖了增量写入的衍生列，滚动状态随之失效
+            if name == 'daily_metrics' and os.path.exists(self._daily_state_path()):
+                os.remove(self._daily_state_path())
+
+        return converted
+
+    # ==================== 数据集加载 ====================
+
+    def load_daily_metrics(self, start_date=None, end_date=None,
+                           last_n_days: int = None, columns: list = None) -> pd.DataFrame:
+        """
+        加载日报数据并计算衍生指标
+
+        若列式数据已通过增量写入携带衍生指标，则直接读取，不再全量重算。
+
+        Args:
+            start_date: 起始日期（含），None表示不限
+            end_date: 结束日期（含），None表示不限
+            last_n_days: 仅加载最近N天（优先于start_date）
+            columns: 需要的原始列（衍生指标所需列会自动补齐）
+        """
+        if last_n_days is not None:
+            _, max_date = self.get_date_range('daily_metrics')
+            if max_date is None:
+                return pd.DataFrame(columns=self.DAILY_BASE_COLUMNS)
+            start_date = max_date - pd.Timedelta(days=last_n_days - 1)
+
+        if columns is not None:
+            columns = list(dict.fromkeys(self.DAILY_BASE_COLUMNS + list(columns)))
+
+        if self._has_precomputed_daily_metrics():
+            if columns is not None:
+                columns = list(dict.fromkeys(columns + self.DAILY_DERIVED_COLUMNS))
+            return self._read_table('daily_metrics', columns=columns, start_date=start_date, end_date=end_date)
+
+        # 滚动窗口与环比需要起始日之前的数据预热，多读一个窗口后再裁剪
+        read_start = None
+        if start_date is not None:
+            start_date = pd.Timestamp(start_date)
+            read_start = start_date - pd.Timedelta(days=self.DAILY_ROLLING_WINDOW)
+
+        df = self._read_table('daily_metrics', columns=columns, start_date=read_start, end_date=end_date)
+
+        # 读取范围含数据集首日且截止到end_date时，首日标准差的兜底值按全历史计算，不随加载窗口变化
+        arpu_std_fill = None
+        if end_date is not None and len(df) > 0 and (start_date is None or df['date'].min() >= start_date):
+            arpu_std_fill = self._full_history_arpu_std()
+        df = self._compute_daily_derived(df, arpu_std_fill=arpu_std_fill)
+
+        if start_date is not None:
+            df = df[df['date'] >= start_date].reset_index(drop=True)
+
+        return df
+
+    def _compute_daily_derived(self, df: pd.DataFrame, state: dict = None,
+                               arpu_std_fill: float = None) -> pd.DataFrame:
+        """
+        计算日报衍生指标
+
+        Args:
+            df: 原始日报数据
+            state: 上一批次的滚动窗口状态（None表示从头计算）
+            arpu_std_fill: arpu_std7缺失值的兜底（None表示由state与df的累计值计算）
+        """
+        df = df.reset_index(drop=True)
         df['arpu'] = df['revenue'] / df['dau']
-        df['arpu_change'] = df['arpu'].pct_change() * 100
-        df['dau_change'] = df['dau'].pct_change() * 100
-        df['revenue_change'] = df['revenue'].pct_change() * 100
+
+        # 拼接上一批次尾部的取值，使环比与滚动窗口在批次边界处保持连续
+        def with_history(history: list, column: str) -> pd.Series:
+            return pd.Series(np.concatenate([np.asarray(history, dtype=float), df[column].to_numpy(dtype=float)]))
+
+        prefix = len(state['window_arpu']) if state else 0
+        offset = 1 if state else 0
+        arpu = with_history(state['window_arpu'] if state else [], 'arpu')
+        dau = with_history([state['last_dau']] if state else [], 'dau')
+        revenue = with_history([state['last_revenue']] if state else [], 'revenue')
+
+        # 计算基础指标
+        df['arpu_change'] = (arpu.pct_change() * 100).iloc[prefix:].to_numpy()
+        df['dau_change'] = (dau.pct_change() * 100).iloc[offset:].to_numpy()
+        df['revenue_change'] = (revenue.pct_change() * 100).iloc[offset:].to_numpy()
         df['conversion_rate'] = (df['new_members'] + df['renew_members']) / df['dau'] * 100
 
         # 计算异常检测用指标
-        df['arpu_ma7'] = df['arpu'].rolling(window=7, min_periods=1).mean()
-        df['arpu_std7'] = df['arpu'].rolling(window=7, min_periods=1).std()
+        rolling = arpu.rolling(window=self.DAILY_ROLLING_WINDOW, min_periods=1)
+        df['arpu_ma7'] = rolling.mean().iloc[prefix:].to_numpy()
+        df['arpu_std7'] = rolling.std().iloc[prefix:].to_numpy()
 
-        # 处理NaN值
+        # 处理NaN值（标准差兜底使用全历史累计值）
         df = df.fillna({
             'arpu_change': 0,
             'dau_change': 0,
             'revenue_change': 0,
-            'arpu_std7': df['arpu'].std()
+            'arpu_std7': self._history_arpu_std(state, df['arpu']) if arpu_std_fill is None else arpu_std_fill
         })
 
         return df
 
+    def _full_history_arpu_std(self) -> float:
+        """全历史arpu标准差（只读revenue、dau两列）"""
+        totals = self._read_table('daily_metrics', columns=['revenue', 'dau'])
+        return self._history_arpu_std(None, totals['revenue'] / totals['dau'])
+
+    @staticmethod
+    def _history_arpu_std(state: dict, arpu: pd.Series) -> float:
+        """由累计和计算全历史arpu标准差（与全量计算的 df['arpu'].std() 一致）"""
+        count = (state['arpu_count'] if state else 0) + len(arpu)
+        if count < 2:
+            return np.nan
+        total = (state['arpu_sum'] if state else 0.0) + float(arpu.sum())
+        total_sq = (state['arpu_sumsq'] if state else 0.0) + float((arpu ** 2).sum())
+        variance = max(total_sq - total * total / count, 0.0) / (count - 1)
+        return float(np.sqrt(variance))
+
+    # ==================== 增量写入 ====================
+
+    def _daily_state_path(self) -> str:
+        return os.path.join(self.data_path, 'daily_metrics.state.json')
+
+    def load_daily_state(self) -> dict:
+        """读取日报滚动窗口状态（不存在时返回None）"""
+        if not os.path.exists(self._daily_state_path()):
+            return None
+        with open(self._daily_state_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _has_precomputed_daily_metrics(self) -> bool:
+        """列式日报数据是否已携带衍生指标（由增量写入生成且状态文件有效）"""
+        if self.storage == 'csv' or not self._use_columnar('daily_metrics'):
+            return False
+        return self.load_daily_state() is not None
+
+    def _next_state(self, state: dict, derived: pd.DataFrame) -> dict:
+        """根据新写入的行推进滚动窗口状态"""
+        window = (state['window_arpu'] if state else []) + derived['arpu'].tolist()
+        last = derived.iloc[-1]
+        return {
+            'last_date': last['date'].strftime('%Y-%m-%d'),
+            'rows': (state['rows'] if state else 0) + len(derived),
+            'window_arpu': [float(v) for v in window[-self.DAILY_ROLLING_WINDOW:]],
+            'last_dau': float(last['dau']),
+            'last_revenue': float(last['revenue']),
+            'arpu_count': (state['arpu_count'] if state else 0) + len(derived),
+            'arpu_sum': (state['arpu_sum'] if state else 0.0) + float(derived['arpu'].sum()),
+            'arpu_sumsq': (state['arpu_sumsq'] if state else 0.0) + float((derived['arpu'] ** 2).sum()),
+        }
+
+    def ingest_daily_metrics(self, new_df: pd.DataFrame = None) -> int:
+        """
+        增量写入日报数据，只为新增行计算衍生指标
+
+        首次调用时以当前数据（CSV或列式）为基线全量计算一次并建立状态；
+        之后每次只把新增行与状态中的窗口尾部拼接计算，并写成新的分片文件。
+
+        Args:
+            new_df: 新增的原始日报行（日期须晚于已写入的最后一天），None表示仅建立基线
+
+        Returns:
+            本次写入的行数
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.storage == 'csv':
+            raise ValueError("增量写入需要列式存储，请使用 storage='auto' 或 'parquet'")
+
+        columnar_path = self._columnar_path('daily_metrics')
+        state = self.load_daily_state() if self._use_columnar('daily_metrics') else None
+        written = 0
+
+        if state is None:
+            # 建立基线：读取当前原始数据全量计算一次
+            raw_columns = None
+            if os.path.exists(columnar_path) and self._use_columnar('daily_metrics'):
+                parts = sorted(p for p in os.listdir(columnar_path) if p.endswith('.parquet'))
+                schema = pq.read_schema(os.path.join(columnar_path, parts[0]))
+                raw_columns = [c for c in schema.names if c not in self.DAILY_DERIVED_COLUMNS]
+            history = self._read_table('daily_metrics', columns=raw_columns)
+            history = history.sort_values('date', kind='stable').reset_index(drop=True)
+            derived = self._compute_daily_derived(history)
+
+            os.makedirs(columnar_path, exist_ok=True)
+            for old_part in os.listdir(columnar_path):
+                if old_part.endswith('.parquet'):
+                    os.remove(os.path.join(columnar_path, old_part))
+            pq.write_table(
+                pa.Table.from_pandas(derived, preserve_index=False),
+                os.path.join(columnar_path, 'part-00000.parquet')
+            )
+            state = self._next_state(None, derived)
+            self._save_daily_state(state)
+            written += len(derived)
+
+        if new_df is None or len(new_df) == 0:
+            return written
+
+        new_df = new_df.copy()
+        new_df['date'] = pd.to_datetime(new_df['date'])
+        new_df = new_df.sort_values('date', kind='stable')
+        if new_df['date'].iloc[0] <= pd.Timestamp(state['last_date']):
+            raise ValueError(f"新增数据日期须晚于 {state['last_date']}")
+
+        derived = self._compute_daily_derived(new_df, state)
+
+        # 按已有分片的schema写入，保证整个目录可作为一个数据集读取
+        parts = sorted(p for p in os.listdir(columnar_path) if p.endswith('.parquet'))
+        schema = pq.read_schema(os.path.join(columnar_path, parts[0]))
+        table = pa.Table.from_pandas(derived[schema.names], schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(columnar_path, f'part-{len(parts):05d}.parquet'))
+
+        self._save_daily_state(self._next_state(state, derived))
+        return written + len(derived)
+
+    def _save_daily_state(self, state: dict):
+        """原子写入状态文件，避免中断后留下半截JSON"""
+        tmp_path = self._daily_state_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self._daily_state_path())
+
     def load_user_segments(self) -> pd.DataFrame:
         """加载用户分层数据"""
-        df = pd.read_csv(os.path.join(self.data_path, 'user_segments.csv'))
+        df = self._read_table('user_segments')
         return df
 
     def load_campaign_history(self) -> pd.DataFrame:
-        """加载历史活动数据"""
-        df = pd.read_csv(os.path.join(self.data_path, 'campaign_history.csv'))
+        """
+        加载历史活动数据
+
+        字符串形式的数值字段在加载时一次性解析为数值列（原列保留用于展示）：
+        - arpu_lift '+0.021' -> arpu_lift_value 0.021
+        - revenue_lift '+18%' -> revenue_lift_pct 18.0
+        content_mix / resource_capacity 的解析结果见 parse_content_mix / parse_resource_usage。
+        """
+        df = self._read_table('campaign_history')
         df['start_date'] = pd.to_datetime(df['start_date'])
         df['end_date'] = pd.to_datetime(df['end_date'])
+        df['arpu_lift_value'] = self._to_number(df['arpu_lift'])
+        df['revenue_lift_pct'] = self._to_number(df['revenue_lift'])
         return df
 
+    @staticmethod
+    def _to_number(series: pd.Series) -> pd.Series:
+        """'+0.021' / '+18%' / 0.021 等混合格式统一转为float（无法解析时为NaN）"""
+        if pd.api.types.is_numeric_dtype(series):
+            return series.astype(float)
+        cleaned = series.astype(str).str.replace(r'[+%\s元]', '', regex=True)
+        return pd.to_numeric(cleaned, errors='coerce').astype(float)
+
+    @staticmethod
+    def parse_content_mix(campaigns_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        将 content_mix（如'家庭剧70%+动漫30%'）解析为长表
+
+        Returns:
+            DataFrame[campaign_id, content_type, share]，share为百分比数值
+        """
+        parsed = campaigns_df.set_index('campaign_id')['content_mix'].astype(str).str.extractall(
+            r'(?P<content_type>[^+\d%]+?)\s*(?P<share>\d+(?:\.\d+)?)%'
+        )
+        parsed = parsed.reset_index(level='campaign_id').reset_index(drop=True)
+        parsed['content_type'] = parsed['content_type'].str.strip()
+        parsed['share'] = parsed['share'].astype(float)
+        return parsed[['campaign_id', 'content_type', 'share']]
+
+    @staticmethod
+    def parse_resource_usage(campaigns_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        将 resource_capacity（如'首页位3:0.6,详情页:0.5'）解析为长表
+
+        Returns:
+            DataFrame[campaign_id, resource_position, usage]
+        """
+        parsed = campaigns_df.set_index('campaign_id')['resource_capacity'].astype(str).str.extractall(
+            r'(?P<resource_position>[^,:]+):(?P<usage>\d*\.?\d+)'
+        )
+        parsed = parsed.reset_index(level='campaign_id').reset_index(drop=True)
+        parsed['resource_position'] = parsed['resource_position'].str.strip()
+        parsed['usage'] = parsed['usage'].astype(float)
+        return parsed[['campaign_id', 'resource_position', 'usage']]
+
+    def load_campaign_content_mix(self) -> pd.DataFrame:
+        """加载活动内容配比长表"""
+        return self.parse_content_mix(self.load_campaign_history())
+
+    def load_campaign_resource_usage(self) -> pd.DataFrame:
+        """加载活动资源位使用率长表"""
+        return self.parse_resource_usage(self.load_campaign_history())
+
     def load_resource_capacity(self) -> pd.DataFrame:
         """加载资源位容量数据"""
-        df = pd.read_csv(os.path.join(self.data_path, 'resource_capacity.csv'))
+        df = self._read_table('resource_capacity')
         return df
 
     def get_latest_metrics(self, df: pd.DataFrame) -> dict:
@@ -0,0 +1,175 @@
+"""
+共享数据仓库模块 - 进程内所有会话共用一份只读数据
+"""
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+from modules.data_loader import DataLoader
+from modules.rag_search import CampaignRAG
+from utils.config import Config
+
+
+class SharedDataStore:
+    """进程级共享数据仓库
+
+    每个数据集只加载一次，所有会话拿到的是共享底层数组的浅拷贝视图。
+    数值、日期列的底层数组加载后即设为只读，原地写入会直接报错；object列（pandas的Cython
+    字符串运算不接受只读数组）在每次get时复制一份指针数组。新增、替换列只影响会话自己的视图。
+    保护不依赖pandas写时复制（Copy-on-Write）是否开启；开启时原地写入会先复制，而不是报错。
+    超过TTL后检查一次源文件mtime，文件有更新才重新加载。
+    """
+
+    # 数据集名称 -> DataLoader加载方法
+    DATASETS = {
+        'daily_metrics': 'load_daily_metrics',
+        'user_segments': 'load_user_segments',
+        'campaign_history': 'load_campaign_history',
+        'resource_capacity': 'load_resource_capacity',
+    }
+
+    # 派生数据集 -> (上游数据集, 解析函数)；随上游刷新，解析结果只计算一次
+    DERIVED_DATASETS = {
+        'campaign_content_mix': ('campaign_history', DataLoader.parse_content_mix),
+        'campaign_resource_usage': ('campaign_history', DataLoader.parse_resource_usage),
+    }
+
+    def __init__(self, data_path: str = None, ttl: float = None):
+        """
+        初始化共享数据仓库
+
+        Args:
+            data_path: 数据目录（默认使用配置）
+            ttl: 两次检查源文件mtime之间的最短间隔（秒）
+        """
+        self.loader = DataLoader(data_path)
+        self.ttl = Config.DATA_STORE_TTL if ttl is None else ttl
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._rag = None
+        self._rag_version = None
+
+    def _source_mtime(self, name: str) -> float:
+        """数据集源文件的最新修改时间（列式目录取所有分片的最大值）"""
+        if name in self.DERIVED_DATASETS:
+            name = self.DERIVED_DATASETS[name][0]
+        path = self.loader.get_source_path(name)
+        if not os.path.isdir(path):
+            return os.path.getmtime(path)
+        mtimes = [os.path.getmtime(path)] + [
+            os.path.getmtime(os.path.join(path, part)) for part in os.listdir(path)
+        ]
+        return max(mtimes)
+
+    def _is_fresh(self, entry: dict) -> bool:
+        """条目在TTL内直接视为新鲜，超时后比较mtime"""
+        now = time.monotonic()
+        if now - entry['checked_at'] < self.ttl:
+            return True
+        entry['checked_at'] = now
+        return self._source_mtime(entry['name']) == entry['mtime']
+
+    def _load(self, name: str) -> dict:
+        if name in self.DERIVED_DATASETS:
+            parent_name, parse = self.DERIVED_DATASETS[name]
+            parent = self._entry(parent_name)
+            mtime = parent['mtime']
+            data = parse(parent['data'])
+        elif name in self.DATASETS:
+            mtime = self._source_mtime(name)
+            data = getattr(self.loader, self.DATASETS[name])()
+        else:
+            raise KeyError(f"未知数据集: {name}")
+        return {
+            'name': name,
+            'data': _read_only(data),
+            'mtime': mtime,
+            'checked_at': time.monotonic(),
+            'version': (name, mtime),
+        }
+
+    def _entry(self, name: str) -> dict:
+        entry = self._entries.get(name)
+        if entry is not None and self._is_fresh(entry):
+            return entry
+
+        with self._lock:
+            # 双重检查：等锁期间可能已被其他会话刷新
+            entry = self._entries.get(name)
+            if entry is None or entry['mtime'] != self._source_mtime(name):
+                entry = self._load(name)
+                self._entries[name] = entry
+            return entry
+
+    def get(self, name: str) -> pd.DataFrame:
+        """
+        获取数据集的只读视图
+
+        Args:
+            name: 数据集名称（见DATASETS / DERIVED_DATASETS）
+
+        Returns:
+            与共享数据共用只读内存的浅拷贝DataFrame（object列为本次调用独有的副本）
+        """
+        data = self._entry(name)['data']
+        view = data.copy(deep=False)
+        for column in data.columns[data.dtypes == object]:
+            view[column] = data[column].to_numpy(copy=True)
+        return view
+
+    def version(self, name: str) -> tuple:
+        """数据集当前版本标识（数据刷新后变化，可用作下游缓存的key）"""
+        return self._entry(name)['version']
+
+    def get_rag(self) -> CampaignRAG:
+        """获取基于当前活动数据构建的共享RAG检索器"""
+        version = self.version('campaign_history')
+        if self._rag is not None and self._rag_version == version:
+            return self._rag
+
+        with self._lock:
+            if self._rag is None or self._rag_version != version:
+                rag = CampaignRAG(Config.RAG_INDEX_PATH if Config.RAG_INDEX_PERSIST else None)
+                rag.build_index(self._entries['campaign_history']['data'])
+                self._rag = rag
+                self._rag_version = version
+            return self._rag
+
+    def refresh(self, name: str = None):
+        """丢弃缓存，下次访问时重新加载（name为None时全部丢弃）"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+                self._rag = None
+                self._rag_version = None
+            else:
+                self._entries.pop(name, None)
+
+
+def _read_only(df: pd.DataFrame) -> pd.DataFrame:
+    """重建为各列独立持有numpy数组的DataFrame，数值、日期列设为只读（object列与扩展类型列保持原样）"""
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, np.dtype) and series.dtype != object:
+            values = series.to_numpy()
+            values.flags.writeable = False
+            columns[column] = values
+        else:
+            columns[column] = series.array
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_data_store() -> SharedDataStore:
+    """获取进程级共享数据仓库（首次调用时创建）"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedDataStore()
+    return _store
@@ -0,0 +1,377 @@
+"""
+本地向量检索模块 - 字符n-gram哈希TF-IDF向量 + SVD降维 + NumPy实现的IVF近似最近邻索引
+
+向量完全由活动文本本身计算，不依赖联网下载的模型，适合离线环境。
+与BM25互补：BM25按jieba分词精确匹配，字符n-gram对分词差异和相近写法更宽容。
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+
+# 不参与组成n-gram的字符：文档分隔符和空白
+_SEPARATORS = np.array([0, 9, 10, 13, 32, 0x3000], dtype=np.uint64)
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64终混函数（uint64数组，溢出按2^64回绕）"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def char_ngrams(texts: List[str], ngram_range: Tuple[int, int] = (1, 2)) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取字符n-gram的64位哈希（整批文本一次向量化计算，不含跨越空白的n-gram）
+
+    Args:
+        texts: 文本列表
+        ngram_range: n-gram长度范围（含两端）
+
+    Returns:
+        (每个n-gram所属的文本下标, n-gram哈希)
+    """
+    codes = np.frombuffer('\x00'.join(texts).encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    is_separator = np.isin(codes, _SEPARATORS)
+    doc = np.cumsum(codes == 0)
+
+    docs, keys = [], []
+    for n in range(ngram_range[0], ngram_range[1] + 1):
+        length = len(codes) - n + 1
+        if length <= 0:
+            continue
+        # 以n作初值，不同长度的n-gram不会得到相同的哈希
+        key = np.full(length, n, dtype=np.uint64)
+        valid = np.ones(length, dtype=bool)
+        for offset in range(n):
+            key = key * _GOLDEN + codes[offset:offset + length]
+            valid &= ~is_separator[offset:offset + length]
+        docs.append(doc[:length][valid])
+        keys.append(_mix64(key[valid]))
+
+    if not docs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64)
+    return np.concatenate(docs).astype(np.int64), np.concatenate(keys)
+
+
+class IVFIndex:
+    """倒排文件（IVF）近似最近邻索引（内积/余弦）
+
+    k-means把向量分到约√N个簇，查询只比较质心最接近的nprobe个簇内的向量；
+    探查的簇内向量（带过滤时为满足过滤条件的向量）不足k个时继续按质心相似度往后探查。
+    向量按簇连续存放（簇内按向量下标升序），每个探查的簇是一次连续内存上的矩阵乘法。
+    """
+
+    TRAIN_PER_LIST = 64  # 每个簇用于训练k-means的样本数
+    EXACT_FILTERED = 8192  # 带过滤检索时候选不超过该数量则探查全部簇（精确检索）
+
+    def __init__(self, nprobe: int = 32, n_iter: int = 10, seed: int = 0):
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.seed = seed
+        self.centroids = None
+        # 按簇排列的向量、所属簇和原始下标
+        self.list_vectors = None
+        self.list_assign = np.zeros(0, dtype=np.int32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self._offsets = None
+        self._rows = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nlist(self) -> int:
+        return 0 if self.centroids is None else len(self.centroids)
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        """每个向量内积最大的质心（分块计算，控制内存）"""
+        return np.concatenate([
+            np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk)
+        ] or [np.zeros(0, dtype=np.int64)]).astype(np.int32)
+
+    def train(self, vectors: np.ndarray):
+        """在（抽样的）向量上训练球面k-means质心"""
+        rng = np.random.default_rng(self.seed)
+        nlist = max(1, int(round(np.sqrt(len(vectors)))))
+        sample_size = min(len(vectors), nlist * self.TRAIN_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = self._nearest(sample, centroids)
+            order = np.argsort(labels, kind='stable')
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[filled])
+            # 空簇换成随机样本，避免质心数减少
+            sums[~filled] = sample[rng.choice(sample_size, int((~filled).sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms > 0, norms, 1)
+        self.centroids = centroids.astype(np.float32)
+
+    def _arrange(self, vectors: np.ndarray, assign: np.ndarray, ids: np.ndarray):
+        """按簇重排（稳定排序，簇内保持传入顺序）"""
+        order = np.argsort(assign, kind='stable')
+        self.list_vectors = vectors[order]
+        self.list_assign = assign[order]
+        self.ids = ids[order]
+        self._set_layout()
+
+    def _set_layout(self):
+        """由按簇排列的所属簇和原始下标计算簇边界，以及原始下标 -> 排列位置的映射"""
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(self.list_assign, minlength=self.nlist))])
+        self._rows = np.empty(len(self.ids), dtype=np.int64)
+        self._rows[self.ids] = np.arange(len(self.ids))
+
+    def set_vectors(self, vectors: np.ndarray):
+        """设置全部向量并分配到簇"""
+        self._arrange(vectors, self._nearest(vectors, self.centroids), np.arange(len(vectors)))
+
+    def add(self, vectors: np.ndarray):
+        """追加向量（用已有质心分配，下标接在已有向量之后）"""
+        self._arrange(
+            np.concatenate([self.list_vectors, vectors]),
+            np.concatenate([self.list_assign, self._nearest(vectors, self.centroids)]),
+            np.concatenate([self.ids, np.arange(len(self), len(self) + len(vectors))])
+        )
+
+    def remove(self, keep: np.ndarray):
+        """移除向量（keep为按原始下标的保留掩码，保留向量按原顺序重新编号）"""
+        rows = keep[self.ids]
+        remap = np.cumsum(keep) - 1
+        self.list_vectors = self.list_vectors[rows]
+        self.list_assign = self.list_assign[rows]
+        self.ids = remap[self.ids[rows]]
+        self._set_layout()
+
+    def vectors(self) -> np.ndarray:
+        """按原始下标排列的全部向量"""
+        vectors = np.empty_like(self.list_vectors)
+        vectors[self.ids] = self.list_vectors
+        return vectors
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = None,
+               allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        近似最近邻检索
+
+        Args:
+            query: 查询向量
+            k: 返回数量
+            nprobe: 探查的簇数（默认使用初始化参数；不小于nlist时为精确检索）
+            allowed: 按原始下标的候选掩码（None为全部）；候选不超过EXACT_FILTERED个时对候选精确检索
+
+        Returns:
+            (向量下标, 内积)，按内积降序，同分时下标小的在前
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        n_available = len(self) if allowed is None else int(np.count_nonzero(allowed))
+        if allowed is not None and n_available <= self.EXACT_FILTERED:
+            # 候选较少，直接比较全部候选
+            ids = np.flatnonzero(allowed)
+            similarity = self.list_vectors[self._rows[ids]] @ query
+        else:
+            probe_order = np.argsort(-(self.centroids @ query), kind='stable')
+            n_probe = min(nprobe or self.nprobe, self.nlist)
+            if allowed is None:
+                covered = np.cumsum(np.diff(self._offsets)[probe_order])
+                n_probe = max(n_probe, int(np.searchsorted(covered, min(k, len(self)))) + 1)
+            while True:
+                ranges = [(self._offsets[c], self._offsets[c + 1]) for c in probe_order[:n_probe]]
+                similarity = np.concatenate([self.list_vectors[start:end] @ query for start, end in ranges])
+                ids = np.concatenate([self.ids[start:end] for start, end in ranges])
+                if allowed is not None:
+                    # 探查的簇整段计算后再去掉非候选（比按下标取出候选向量更快）
+                    keep = allowed[ids]
+                    similarity, ids = similarity[keep], ids[keep]
+                # 过滤后探查的簇内候选不足k个时加倍探查
+                if len(ids) >= min(k, n_available) or n_probe >= self.nlist:
+                    break
+                n_probe = min(n_probe * 2, self.nlist)
+
+        # 先取不低于第k名的候选（含并列），再按 (内积降序, 下标升序) 排序
+        if len(similarity) > k:
+            kth = -np.partition(-similarity, k - 1)[k - 1]
+            candidates = np.flatnonzero(similarity >= kth)
+        else:
+            candidates = np.arange(len(similarity))
+        top = candidates[np.lexsort((ids[candidates], -similarity[candidates]))][:k]
+        return ids[top], similarity[top]
+
+
+class DenseRetriever:
+    """字符n-gram向量检索器
+
+    文本的字符1~2-gram哈希到n_buckets个桶上统计文档频率，按 (1+log tf) × idf 加权后
+    带符号地哈希到hash_dim维（特征哈希），再用在样本上做的截断SVD降到dim维并L2归一化，
+    最后以IVFIndex做近似最近邻检索。idf和SVD在fit时确定，之后add的文本沿用同一套参数。
+    """
+
+    SVD_SAMPLE = 20000  # 计算SVD的最多文档数
+    CHUNK = 4096  # 分块向量化的文档数
+
+    def __init__(self, dim: int = 128, hash_dim: int = 1024, n_buckets: int = 2 ** 20,
+                 ngram_range: Tuple[int, int] = (1, 2), nprobe: int = 32, seed: int = 0):
+        """
+        初始化检索器
+
+        Args:
+            dim: 向量维度（不小于hash_dim时不做SVD）
+            hash_dim: 特征哈希的维度
+            n_buckets: 统计文档频率的哈希桶数
+            ngram_range: 字符n-gram长度范围
+            nprobe: IVF查询时探查的簇数
+            seed: 抽样和k-means的随机种子
+        """
+        self.dim = dim
+        self.hash_dim = hash_dim
+        self.n_buckets = n_buckets
+        self.ngram_range = tuple(ngram_range)
+        self.seed = seed
+        self.idf = None
+        self.components = None
+        self.fitted_docs = 0
+        self.index = IVFIndex(nprobe=nprobe, seed=seed)
+
+        # 每个桶在特征哈希中的维度和符号（由桶号确定，不需要持久化）
+        bucket_hash = _mix64(np.arange(n_buckets, dtype=np.uint64) + _GOLDEN)
+        self._bucket_dim = (bucket_hash % np.uint64(hash_dim)).astype(np.int64)
+        self._bucket_sign = np.where(bucket_hash >> np.uint64(63), -1.0, 1.0)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _bucket_counts(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(文本下标, 哈希桶, 词频)，按文本、桶升序"""
+        doc, key = char_ngrams(texts, self.ngram_range)
+        bucket = (key % np.uint64(self.n_buckets)).astype(np.int64)
+        pairs, tf = np.unique(doc * self.n_buckets + bucket, return_counts=True)
+        doc, bucket = np.divmod(pairs, self.n_buckets)
+        return doc, bucket, tf
+
+    def _hashed_tfidf(self, texts: List[str]) -> np.ndarray:
+        """TF-IDF特征哈希向量（未归一化）"""
+        doc, bucket, tf = self._bucket_counts(texts)
+        weights = (1 + np.log(tf)) * self.idf[bucket] * self._bucket_sign[bucket]
+        matrix = np.bincount(
+            doc * self.hash_dim + self._bucket_dim[bucket],
+            weights=weights,
+            minlength=len(texts) * self.hash_dim
+        )
+        return matrix.reshape(len(texts), self.hash_dim)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """文本 -> L2归一化的float32向量（没有任何n-gram的文本为零向量）"""
+        blocks = []
+        for start in range(0, len(texts), self.CHUNK):
+            vectors = self._hashed_tfidf(texts[start:start + self.CHUNK])
+            if self.components is not None:
+                vectors = vectors @ self.components
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            blocks.append((vectors / np.where(norms > 0, norms, 1)).astype(np.float32))
+        width = self.dim if self.components is not None else self.hash_dim
+        return np.concatenate(blocks) if blocks else np.zeros((0, width), dtype=np.float32)
+
+    def fit(self, texts: List[str]):
+        """在语料上确定idf和SVD投影，向量化全部文本并训练IVF索引"""
+        doc_freq = np.zeros(self.n_buckets, dtype=np.int64)
+        for start in range(0, len(texts), self.CHUNK):
+            _, bucket, _ = self._bucket_counts(texts[start:start + self.CHUNK])
+            doc_freq += np.bincount(bucket, minlength=self.n_buckets)
+        self.idf = np.log((1 + len(texts)) / (1 + doc_freq)) + 1
+
+        self.components = None
+        if self.dim < self.hash_dim and len(texts):
+            # 截断SVD：X^T X 的前dim个特征向量即X的前dim个右奇异向量
+            rng = np.random.default_rng(self.seed)
+            sample = rng.choice(len(texts), min(len(texts), self.SVD_SAMPLE), replace=False)
+            gram = np.zeros((self.hash_dim, self.hash_dim))
+            for start in range(0, len(sample), self.CHUNK):
+                block = self._hashed_tfidf([texts[i] for i in sample[start:start + self.CHUNK]])
+                gram += block.T @ block
+            _, eigenvectors = np.linalg.eigh(gram)
+            self.components = eigenvectors[:, ::-1][:, :self.dim].copy()
+
+        vectors = self.encode(texts)
+        self.fitted_docs = len(texts)
+        if len(vectors):
+            self.index.train(vectors)
+            self.index.set_vectors(vectors)
+
+    def needs_refit(self) -> bool:
+        """增量加入的文档已超过fit时的文档数（idf、SVD和簇划分已不再代表当前语料）"""
+        return len(self) > 2 * max(self.fitted_docs, 1)
+
+    def add(self, texts: List[str]):
+        """追加文本（沿用fit时的idf、SVD投影和质心）"""
+        if texts:
+            self.index.add(self.encode(texts))
+
+    def remove(self, keep: np.ndarray):
+        """移除文本（keep为保留文本的布尔掩码）"""
+        self.index.remove(keep)
+
+    def search(self, query: str, k: int, nprobe: int = None,
+               allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索与查询最相近的文本
+
+        Args:
+            query: 查询文本
+            k: 返回数量
+            nprobe: IVF探查的簇数（None使用初始化参数）
+            allowed: 候选文本掩码（None为全部）
+
+        Returns:
+            (文本下标, 余弦相似度)
+        """
+        return self.index.search(self.encode([query])[0], k, nprobe, allowed)
+
+    def search_batch(self, queries: List[str], k: int, nprobe: int = None,
+                     allowed: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        批量检索（查询一次性向量化，再逐个做IVF检索）
+
+        Args:
+            queries: 查询文本列表
+            k: 每个查询的返回数量
+            nprobe: IVF探查的簇数（None使用初始化参数）
+            allowed: 候选文本掩码（None为全部，所有查询共用）
+
+        Returns:
+            每个查询的 (文本下标, 余弦相似度)
+        """
+        return [self.index.search(vector, k, nprobe, allowed) for vector in self.encode(queries)]
+
+    def to_arrays(self) -> dict:
+        """导出为数组字典（np.savez持久化）"""
+        return {
+            'params': np.array([self.dim, self.hash_dim, self.n_buckets, *self.ngram_range,
+                                self.index.nprobe, self.seed, self.fitted_docs]),
+            'idf': self.idf.astype(np.float32),
+            'components': self.components if self.components is not None else np.zeros((0, 0)),
+            'centroids': self.index.centroids,
+            'vectors': self.index.vectors(),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'DenseRetriever':
+        """由to_arrays导出的数组恢复"""
+        dim, hash_dim, n_buckets, ngram_lo, ngram_hi, nprobe, seed, fitted_docs = arrays['params'].tolist()
+        retriever = cls(dim, hash_dim, n_buckets, (ngram_lo, ngram_hi), nprobe, seed)
+        retriever.idf = arrays['idf'].astype(np.float64)
+        retriever.components = arrays['components'] if arrays['components'].size else None
+        retriever.fitted_docs = fitted_docs
+        retriever.index.centroids = arrays['centroids']
+        retriever.index.set_vectors(arrays['vectors'])
+        return retriever
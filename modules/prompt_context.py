@@ -0,0 +1,216 @@
+"""
+Prompt上下文构建模块 - 按token预算压缩日度数据
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from utils.config import Config
+
+
+# 写入prompt的日度字段
+CONTEXT_COLUMNS = ['date', 'dau', 'revenue', 'arpu', 'content_type']
+
+# 计算偏离度时复用的预计算列（同一批日期按不同窗口加载时取值可能不同，须计入缓存key）
+DEVIATION_COLUMNS = ['arpu_ma7', 'arpu_std7']
+
+# 中文、全角标点
+_WIDE_CHAR_PATTERN = re.compile(r'[　-〿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算token数（不依赖分词器，偏保守）
+
+    中文及全角字符按1字1个token，其余字符按每3个字符1个token
+    """
+    wide = len(_WIDE_CHAR_PATTERN.findall(text))
+    return wide + (len(text) - wide + 2) // 3
+
+
+class PromptContextBuilder:
+    """按token预算构建日度数据上下文
+
+    数据较少时输出逐日明细；超出预算时依次退化为：
+    周汇总 + 偏离最大的K天 → 月汇总 + 偏离最大的K天 → 内容汇总 + 偏离最大的若干天。
+    同一份数据的汇总结果和渲染文本都会缓存，重复调用不再格式化整个DataFrame。
+    """
+
+    def __init__(self, token_budget: int = None, top_k: int = 5, cache_size: int = 64):
+        """
+        初始化上下文构建器
+
+        Args:
+            token_budget: 上下文的默认token预算（默认使用配置）
+            top_k: 汇总模式下附带的偏离最大的天数
+            cache_size: 缓存的数据集份数
+        """
+        self.token_budget = token_budget or Config.PROMPT_TOKEN_BUDGET
+        self.top_k = top_k
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _frame_key(df: pd.DataFrame) -> tuple:
+        """按内容计算数据集的key（逐行向量化哈希后整体做摘要，比格式化整表便宜得多）"""
+        columns = [c for c in CONTEXT_COLUMNS + DEVIATION_COLUMNS if c in df.columns]
+        row_hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+        return len(df), tuple(columns), hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+    @staticmethod
+    def _daily(df: pd.DataFrame) -> pd.DataFrame:
+        """整理为每天一行（多平台/多资源位时按天合并，内容类型取当天收入最高的）"""
+        df = df[[c for c in CONTEXT_COLUMNS + DEVIATION_COLUMNS if c in df.columns]]
+        if not df['date'].duplicated().any():
+            return df.sort_values('date').reset_index(drop=True)
+
+        top_content = (
+            df.sort_values('revenue', ascending=False)
+            .drop_duplicates('date')
+            .set_index('date')['content_type']
+        )
+        daily = df.groupby('date', sort=True, observed=True).agg(dau=('dau', 'sum'), revenue=('revenue', 'sum'))
+        daily['arpu'] = daily['revenue'] / daily['dau']
+        daily['content_type'] = top_content
+        return daily.reset_index()
+
+    @staticmethod
+    def _rollup(daily: pd.DataFrame, freq: str, label: str) -> pd.DataFrame:
+        """按周/月汇总"""
+        period = daily['date'].dt.to_period(freq)
+        main_content = (
+            daily.assign(_period=period)
+            .groupby(['_period', 'content_type'], sort=False, observed=True)['revenue'].sum()
+            .sort_values(ascending=False)
+            .reset_index()
+            .drop_duplicates('_period')
+            .set_index('_period')['content_type']
+        )
+        rollup = daily.groupby(period, sort=True).agg(
+            days=('date', 'size'), dau_sum=('dau', 'sum'), revenue=('revenue', 'sum')
+        )
+        return pd.DataFrame({
+            label: rollup.index.start_time.strftime('%Y-%m-%d'),
+            '天数': rollup['days'].to_numpy(),
+            '日均DAU': (rollup['dau_sum'] / rollup['days']).round().astype('int64').to_numpy(),
+            '总收入': rollup['revenue'].to_numpy(),
+            '边现': (rollup['revenue'] / rollup['dau_sum']).round(4).to_numpy(),
+            '主推内容': main_content.reindex(rollup.index).to_numpy(),
+        })
+
+    @staticmethod
+    def _deviations(daily: pd.DataFrame) -> pd.DataFrame:
+        """按边现偏离程度降序排列的日度数据（有预计算的7日均值/标准差时直接复用）"""
+        arpu = daily['arpu'].to_numpy(dtype=float)
+        if 'arpu_ma7' in daily.columns and 'arpu_std7' in daily.columns:
+            center = daily['arpu_ma7'].to_numpy(dtype=float)
+            scale = daily['arpu_std7'].to_numpy(dtype=float)
+        else:
+            center = np.full(len(arpu), np.nanmean(arpu) if len(arpu) else np.nan)
+            scale = np.full(len(arpu), np.nanstd(arpu, ddof=1) if len(arpu) > 1 else np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            deviation = np.where(scale > 0, (arpu - center) / scale, 0.0)
+        deviation = np.nan_to_num(deviation)
+
+        order = np.argsort(-np.abs(deviation), kind='stable')
+        top = daily.iloc[order][['date', 'dau', 'revenue', 'arpu', 'content_type']].copy()
+        top['偏离σ'] = deviation[order].round(2)
+        return top
+
+    @staticmethod
+    def _content_summary(daily: pd.DataFrame) -> pd.DataFrame:
+        summary = daily.groupby('content_type', observed=True).agg(
+            天数=('date', 'size'), 总收入=('revenue', 'sum'), 平均边现=('arpu', 'mean')
+        ).sort_values('总收入', ascending=False)
+        summary['平均边现'] = summary['平均边现'].round(4)
+        return summary.reset_index().rename(columns={'content_type': '内容类型'})
+
+    @staticmethod
+    def _render(df: pd.DataFrame) -> str:
+        """紧凑的CSV格式（比to_string()的对齐空格省token）"""
+        return df.to_csv(index=False, float_format='%.4f', date_format='%Y-%m-%d').strip()
+
+    def _aggregates(self, df: pd.DataFrame, key: tuple) -> dict:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+
+        daily = self._daily(df)
+        entry = {
+            'days': len(daily),
+            'start': daily['date'].min(),
+            'end': daily['date'].max(),
+            'daily': self._render(daily[[c for c in CONTEXT_COLUMNS if c in daily.columns]]),
+            'weekly': self._render(self._rollup(daily, 'W', '周起始')),
+            'monthly': self._render(self._rollup(daily, 'M', '月份')),
+            'deviations': self._deviations(daily),
+            'content': self._render(self._content_summary(daily)),
+            'texts': {},
+        }
+        with self._lock:
+            self._cache[key] = entry
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _candidates(self, entry: dict):
+        """由详细到精简的候选上下文"""
+        span = f"{entry['start']:%Y-%m-%d} 至 {entry['end']:%Y-%m-%d}，共{entry['days']}天"
+        yield f"逐日明细（{span}）:\n{entry['daily']}"
+
+        top = self._render(entry['deviations'].head(self.top_k))
+        top_title = f"边现偏离最大的{min(self.top_k, entry['days'])}天:"
+        yield f"周汇总（{span}）:\n{entry['weekly']}\n\n{top_title}\n{top}"
+        yield f"月汇总（{span}）:\n{entry['monthly']}\n\n{top_title}\n{top}"
+
+        for k in range(min(self.top_k, entry['days']), -1, -1):
+            text = f"内容汇总（{span}）:\n{entry['content']}"
+            if k:
+                text += f"\n\n边现偏离最大的{k}天:\n{self._render(entry['deviations'].head(k))}"
+            yield text
+
+    def daily_context(self, df: pd.DataFrame, budget: int = None) -> str:
+        """
+        构建日度数据上下文
+
+        Args:
+            df: 日度数据（包含date, dau, revenue, arpu, content_type，可多行同日）
+            budget: token预算（默认使用初始化时的预算）
+
+        Returns:
+            不超过预算的上下文文本（所有候选都超预算时返回最精简的一种）
+        """
+        budget = budget or self.token_budget
+        if len(df) == 0:
+            return "（无数据）"
+
+        entry = self._aggregates(df, self._frame_key(df))
+        text = entry['texts'].get(budget)
+        if text is not None:
+            return text
+
+        for text in self._candidates(entry):
+            if estimate_tokens(text) <= budget:
+                break
+        entry['texts'][budget] = text
+        return text
+
+
+_builder = None
+_builder_lock = threading.Lock()
+
+
+def get_context_builder() -> PromptContextBuilder:
+    """获取进程级共享的上下文构建器（各会话共用汇总缓存）"""
+    global _builder
+    if _builder is None:
+        with _builder_lock:
+            if _builder is None:
+                _builder = PromptContextBuilder()
+    return _builder
@@ -0,0 +1,438 @@
+"""
+多提供商路由模块 - 按延迟加权分配请求，慢请求对冲到备用提供商
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+import openai
+from loguru import logger
+
+from modules.ai_engine import (
+    AsyncAIStrategyEngine, CircuitOpenError, get_circuit_breaker, is_retryable, retry_delay
+)
+from modules.ai_metrics import CallRecord, current_call
+from utils.config import Config
+
+
+# 延迟样本少于该数量时使用默认对冲等待时间
+MIN_LATENCY_SAMPLES = 5
+
+
+class Provider:
+    """一个上游提供商：客户端、熔断器和延迟统计"""
+
+    def __init__(self, name: str, api_key: str, model: str, base_url: str = None):
+        """
+        初始化提供商
+
+        Args:
+            name: 提供商名称（OpenAI/DeepSeek等）
+            api_key: API Key
+            model: 模型名称
+            base_url: API Base URL（None表示OpenAI默认地址）
+        """
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        self._client_kwargs = {'api_key': api_key, 'timeout': Config.OPENAI_TIMEOUT, 'max_retries': 0}
+        if base_url:
+            self._client_kwargs['base_url'] = base_url
+
+        # 同步客户端用于流式输出；异步客户端绑定路由器的事件循环，在其中首次使用时创建
+        self.client = openai.OpenAI(**self._client_kwargs)
+        self.aclient = None
+        self.breaker = get_circuit_breaker(base_url, model)
+        self.json_mode = Config.OPENAI_JSON_MODE
+
+        self.ewma = None
+        self.latencies = deque(maxlen=Config.ROUTER_LATENCY_WINDOW)
+        self.requests = 0
+        self.wins = 0
+        self.hedged = 0
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        """记录一次调用耗时"""
+        alpha = Config.ROUTER_EWMA_ALPHA
+        with self._lock:
+            self.latencies.append(latency)
+            self.ewma = latency if self.ewma is None else alpha * latency + (1 - alpha) * self.ewma
+
+    def hedge_delay(self) -> float:
+        """主请求等待多久仍未返回时发出对冲请求（最近耗时的P90）"""
+        with self._lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return Config.HEDGE_DEFAULT_DELAY
+            delay = float(np.percentile(self.latencies, Config.HEDGE_PERCENTILE))
+        return max(delay, Config.HEDGE_MIN_DELAY)
+
+    def weight(self) -> float:
+        """路由权重（与延迟EWMA成反比；没有样本时按默认对冲等待时间估计）"""
+        return 1.0 / max(self.ewma or Config.HEDGE_DEFAULT_DELAY, 0.05)
+
+    def available(self) -> bool:
+        """熔断器是否可能放行（不占用半开探测名额）"""
+        return self.breaker.state != self.breaker.OPEN or self.breaker.retry_after() == 0
+
+
+class ProviderRouter:
+    """多提供商路由器
+
+    每次调用按延迟EWMA的倒数加权随机选出主提供商；主请求超过其最近耗时P90仍未返回，
+    或已失败、返回无效结果时，向下一家提供商发出对冲请求，取最先返回的有效结果并取消其余请求。
+    异步请求都在路由器自己的后台事件循环中执行，各提供商的异步客户端长期复用连接池。
+    """
+
+    def __init__(self, providers: List[Provider], deadline: float = None, hedge: bool = True):
+        """
+        初始化路由器
+
+        Args:
+            providers: 提供商列表
+            deadline: 单次操作的端到端截止时间（秒，默认使用配置）
+            hedge: 是否发出对冲请求（False时只在失败后切换提供商）
+        """
+        if not providers:
+            raise ValueError("至少需要一个提供商")
+        self.providers = providers
+        self.deadline = deadline or Config.OPENAI_CALL_DEADLINE
+        self.hedge = hedge
+        self.max_retries = Config.OPENAI_MAX_RETRIES
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def model(self) -> str:
+        """路由的组合模型名（用作缓存和合并请求的key）"""
+        return '+'.join(p.model for p in self.providers)
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._loop_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name='provider-router', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def rank(self) -> List[Provider]:
+        """本次调用的提供商顺序：主提供商按权重随机选出，其余按延迟EWMA升序"""
+        candidates = [p for p in self.providers if p.available()] or list(self.providers)
+        primary = random.choices(candidates, weights=[p.weight() for p in candidates])[0]
+        rest = sorted((p for p in candidates if p is not primary),
+                      key=lambda p: p.ewma or Config.HEDGE_DEFAULT_DELAY)
+        return [primary] + rest
+
+    async def _attempt(self, provider: Provider, prompt: str, temperature: float,
+                       validate, json_mode: bool, timeout: float, record: CallRecord, failed: set) -> str:
+        """
+        向一家提供商请求一次（本次操作已通过熔断器放行）
+
+        可重试的失败不在这里记入熔断，只登记到failed，由_complete在操作结束时每家结算一次
+        """
+        if provider.aclient is None:
+            provider.aclient = openai.AsyncOpenAI(**provider._client_kwargs)
+
+        provider.requests += 1
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                self._create(provider, prompt, temperature, json_mode), timeout=timeout
+            )
+        except asyncio.CancelledError:
+            # 对冲中落败被取消：不计入熔断统计；因过慢被对冲的，已等待时长作为耗时下限计入延迟统计
+            elapsed = time.monotonic() - started
+            if elapsed >= provider.hedge_delay():
+                provider.observe(elapsed)
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                failed.add(provider)
+            else:
+                failed.discard(provider)
+                provider.breaker.record_success(time.monotonic() - started)
+            raise
+
+        latency = time.monotonic() - started
+        failed.discard(provider)
+        provider.breaker.record_success(latency)
+        provider.observe(latency)
+        record.add_usage(response.usage)
+
+        content = response.choices[0].message.content
+        if validate is not None:
+            try:
+                validate(content)
+            except ValueError:
+                record.parse_failures += 1
+                raise
+        return content
+
+    @staticmethod
+    async def _create(provider: Provider, prompt: str, temperature: float, json_mode: bool):
+        """json_mode时带上response_format，提供商不支持时关闭JSON输出并改为普通请求"""
+        kwargs = {
+            'model': provider.model,
+            'messages': [{"role": "user", "content": prompt}],
+            'temperature': temperature
+        }
+        if json_mode and provider.json_mode:
+            try:
+                return await provider.aclient.chat.completions.create(
+                    response_format={'type': 'json_object'}, **kwargs
+                )
+            except openai.BadRequestError as e:
+                if 'response_format' not in str(e):
+                    raise
+                logger.info(f"{provider.name}不支持response_format，改为普通输出")
+                provider.json_mode = False
+        return await provider.aclient.chat.completions.create(**kwargs)
+
+    async def _hedged(self, prompt: str, temperature: float, validate, json_mode: bool,
+                      deadline: float, record: CallRecord, grants: dict, failed: set) -> str:
+        """
+        一轮对冲调用：返回最先成功的有效结果，所有提供商都失败时抛出最后一个异常
+
+        Args:
+            grants: 本次操作中各提供商的熔断放行凭证（每家只在首次使用时调用一次allow）
+            failed: 本次操作中最近一次请求可重试失败的提供商
+        """
+        queue = self.rank()
+        tasks = {}
+        last_error = None
+        last_launch = None
+
+        def launch() -> bool:
+            nonlocal last_launch
+            while queue:
+                provider = queue.pop(0)
+                if provider not in grants:
+                    token = provider.breaker.allow()
+                    if not token:
+                        continue
+                    grants[provider] = token
+                task = asyncio.ensure_future(self._attempt(
+                    provider, prompt, temperature, validate, json_mode,
+                    min(deadline - time.monotonic(), Config.OPENAI_TIMEOUT), record, failed
+                ))
+                tasks[task] = provider
+                last_launch = (time.monotonic(), provider)
+                return True
+            return False
+
+        try:
+            if not launch():
+                raise CircuitOpenError("所有AI提供商均处于熔断中")
+
+            while True:
+                pending = [task for task in tasks if not task.done()]
+                now = time.monotonic()
+                wait = deadline - now
+                if self.hedge and queue:
+                    launched_at, provider = last_launch
+                    wait = min(wait, launched_at + provider.hedge_delay() - now)
+
+                if pending:
+                    done, _ = await asyncio.wait(pending, timeout=max(wait, 0),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    done = set()
+
+                for task in done:
+                    if task.exception() is None:
+                        winner = tasks[task]
+                        winner.wins += 1
+                        record.provider = winner.name
+                        if len(tasks) > 1:
+                            logger.info(f"对冲请求由{winner.name}胜出")
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"{tasks[task].name}调用失败: {last_error!r}")
+
+                if time.monotonic() >= deadline:
+                    # 到截止时间仍未返回的提供商按失败结算
+                    failed.update(tasks[task] for task in tasks if not task.done())
+                    raise TimeoutError(f"AI调用超过截止时间{self.deadline:.0f}秒")
+
+                if done or not pending:
+                    # 有请求失败（或无在途请求）：立即换下一家
+                    if not launch() and not any(not task.done() for task in tasks):
+                        raise last_error or CircuitOpenError("所有AI提供商均处于熔断中")
+                elif self.hedge and queue:
+                    # 主请求超过P90耗时仍未返回：发出对冲请求
+                    slow = last_launch[1]
+                    if launch():
+                        slow.hedged += 1
+                        record.hedged = True
+                        logger.info(f"{slow.name}超过{slow.hedge_delay():.1f}秒未返回，对冲到{last_launch[1].name}")
+        finally:
+            # 取消落败或未完成的请求
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _complete(self, prompt: str, temperature: float, validate, json_mode: bool,
+                        record: CallRecord) -> str:
+        """
+        在截止时间内调用，整轮失败且可重试时按指数退避重来
+
+        熔断器按操作计数（与AIStrategyEngine一致）：每家提供商在本次操作中只放行一次；
+        操作结束时最近一次请求仍为可重试失败的记一次失败，其余释放放行凭证（含半开探测名额）
+        """
+        deadline = time.monotonic() + self.deadline
+        grants = {}
+        failed = set()
+        cancelled = False
+        attempt = 0
+        try:
+            while True:
+                try:
+                    return await self._hedged(prompt, temperature, validate, json_mode, deadline,
+                                              record, grants, failed)
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    attempt += 1
+                    delay = retry_delay(attempt)
+                    if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                        raise
+                    record.retries += 1
+                    await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # 调用方取消时不计结果，只释放凭证
+            for provider, token in grants.items():
+                if provider in failed and not cancelled:
+                    provider.breaker.record_failure()
+                else:
+                    provider.breaker.release(token)
+
+    def complete(self, prompt: str, temperature: float, validate=None, json_mode: bool = False) -> str:
+        """
+        同步调用（在路由器事件循环中执行）
+
+        Args:
+            prompt: 用户消息
+            temperature: 采样温度
+            validate: 校验回复的函数（抛出ValueError表示无效，继续等待其他提供商）
+            json_mode: 要求模型直接输出JSON对象（提供商支持时）
+
+        Returns:
+            最先返回的有效回复
+        """
+        # 路由器事件循环不继承调用方的上下文，当前调用记录显式传入
+        future = asyncio.run_coroutine_threadsafe(
+            self._complete(prompt, temperature, validate, json_mode, current_call()), self._event_loop()
+        )
+        try:
+            return future.result(self.deadline + 1)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    async def acomplete(self, prompt: str, temperature: float, validate=None, json_mode: bool = False) -> str:
+        """异步调用（可在任意事件循环中await；调用方被取消时同时取消路由器中的请求）"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+            self._complete(prompt, temperature, validate, json_mode, current_call()), self._event_loop()
+        ))
+
+    def open_stream(self, prompt: str, temperature: float):
+        """
+        建立流式连接：按路由顺序依次尝试，连接失败时换下一家（流式输出不对冲）
+
+        Returns:
+            openai流式响应
+        """
+        deadline = time.monotonic() + self.deadline
+        last_error = None
+        for provider in self.rank():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if not provider.breaker.allow():
+                continue
+
+            provider.requests += 1
+            started = time.monotonic()
+            try:
+                stream = provider.client.chat.completions.create(
+                    model=provider.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    stream=True,
+                    timeout=min(remaining, Config.OPENAI_TIMEOUT)
+                )
+            except Exception as e:
+                if not is_retryable(e):
+                    provider.breaker.record_success(time.monotonic() - started)
+                    raise
+                provider.breaker.record_failure()
+                logger.warning(f"{provider.name}流式连接失败，切换提供商: {e!r}")
+                last_error = e
+                continue
+
+            provider.breaker.record_success(time.monotonic() - started)
+            provider.wins += 1
+            current_call().provider = provider.name
+            return stream
+
+        raise last_error or CircuitOpenError("所有AI提供商均处于熔断中")
+
+    def stats(self) -> List[Dict]:
+        """各提供商的路由统计"""
+        rows = []
+        for p in self.providers:
+            with p._lock:
+                p90 = float(np.percentile(p.latencies, Config.HEDGE_PERCENTILE)) if p.latencies else None
+            rows.append({
+                'name': p.name,
+                'model': p.model,
+                'state': p.breaker.state,
+                'requests': p.requests,
+                'wins': p.wins,
+                'hedged': p.hedged,
+                'ewma': p.ewma,
+                'p90': p90,
+            })
+        return rows
+
+
+_routed_engines = {}
+_routed_engines_lock = threading.Lock()
+
+
+def get_routed_engine(providers: List[Dict]) -> AsyncAIStrategyEngine:
+    """
+    获取进程级共享的多提供商AI引擎
+
+    Args:
+        providers: 提供商配置列表，每项包含 name/api_key/model/base_url，第一项为首选
+
+    Returns:
+        经由ProviderRouter调用的AsyncAIStrategyEngine
+    """
+    key = tuple(
+        (p['name'], p['model'], p.get('base_url'), hashlib.sha256(p['api_key'].encode('utf-8')).hexdigest())
+        for p in providers
+    )
+
+    engine = _routed_engines.get(key)
+    if engine is None:
+        with _routed_engines_lock:
+            engine = _routed_engines.get(key)
+            if engine is None:
+                router = ProviderRouter([Provider(**p) for p in providers])
+                primary = providers[0]
+                engine = AsyncAIStrategyEngine(
+                    api_key=primary['api_key'], base_url=primary.get('base_url'), router=router
+                )
+                _routed_engines[key] = engine
+    return engine
@@ -1,72 +1,938 @@
 """
-RAG经验库检索模块（BM25实现）
+RAG经验库检索模块（BM25实现，可选本地向量检索和BM25+向量混合检索）
+
+分词语料以词项-文档词频矩阵（CSR）的形式连同文档频率、文档长度持久化到磁盘：
+启动时只对新增或内容变化的活动分词，新活动通过add_documents/remove_documents增量更新，无需全量重建。
+检索可按目标人群、优惠方式、资源位、活动日期和ROI过滤，过滤条件在打分前圈定候选文档（见FilterIndex）。
 """
-import pandas as pd
-from rank_bm25 import BM25Okapi
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Iterable, List, Tuple, Union
+
 import jieba
+import numpy as np
+import pandas as pd
+
+from modules.data_loader import DataLoader
+from modules.dense_retriever import DenseRetriever
+from utils.config import Config
+
+
+# 拼接为检索文本的活动字段（按顺序，空格分隔）
+SEARCH_FIELDS = ['strategy_tag', 'target_segment', 'success_factors', 'content_mix']
+
+RESULT_COLUMNS = [
+    'campaign_id', 'strategy_tag', 'target_segment',
+    'roi', 'arpu_lift', 'success_factors', 'similarity_score'
+]
+
+# 检索方式：bm25 关键词 / dense 字符n-gram向量 / hybrid 两路结果按排名倒数融合（RRF）
+SEARCH_MODES = ('bm25', 'dense', 'hybrid')
+
+RRF_K = 60  # RRF平滑常数：融合分 = Σ 1 / (RRF_K + 排名)
+RRF_MIN_CANDIDATES = 50  # 每一路参与融合的最少候选数（至少 top_k × 10）
+
+PARALLEL_TOKENIZE_MIN = 1000  # 批量检索的查询数达到该值才用进程池并行分词（进程启动有固定开销）
+BATCH_SCORE_CELLS = 2 ** 25  # 批量检索每块得分矩阵的最多元素数（float32约128MB），按查询分块打分
+
+
+def _tokenize(texts: List[str]) -> List[List[str]]:
+    """jieba分词（进程池任务，需定义在模块顶层）"""
+    return [list(jieba.cut(text)) for text in texts]
+
+
+def tokenize_batch(texts: List[str], workers: int = None) -> List[List[str]]:
+    """
+    批量分词
+
+    jieba分词是纯Python计算，受GIL限制线程无法并行；文本数达到PARALLEL_TOKENIZE_MIN时
+    分块交给进程池，否则在当前进程内分词。
+
+    Args:
+        texts: 文本列表
+        workers: 进程数（None使用Config.RAG_BATCH_WORKERS，0为CPU核数）
+
+    Returns:
+        每个文本的分词结果（与texts顺序一致）
+    """
+    workers = Config.RAG_BATCH_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(texts) < PARALLEL_TOKENIZE_MIN:
+        return _tokenize(texts)
+
+    chunk_size = -(-len(texts) // (workers * 4))
+    chunks = [texts[start:start + chunk_size] for start in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(chain.from_iterable(executor.map(_tokenize, chunks)))
+
+
+def top_k_indices(scores: np.ndarray, k: int, block: int = 1024) -> np.ndarray:
+    """
+    按分数取前k个下标（argpartition选出候选，只对候选排序）
+
+    先按块取最大值：第k大的块最大值不超过第k名的分数，候选只需包含块最大值高于它的块，
+    以及最大值与它相等的块中下标最小的k个（大量文档同分时，如只有个别文档命中查询词）。
+    结果与对全量分数做稳定降序排序一致：同分时下标小的在前，第k名有并列时取下标小的。
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+
+    n_blocks = len(scores) // block
+    if n_blocks > k:
+        block_max = scores[:n_blocks * block].reshape(n_blocks, block).max(axis=1)
+        threshold = np.partition(block_max, n_blocks - k)[n_blocks - k]
+        blocks = np.union1d(
+            np.flatnonzero(block_max > threshold),
+            np.flatnonzero(block_max == threshold)[:k]
+        )
+        candidates = np.concatenate([
+            (blocks[:, None] * block + np.arange(block)).ravel(),
+            np.arange(n_blocks * block, len(scores))
+        ])
+    else:
+        candidates = np.arange(len(scores))
+
+    values = scores[candidates]
+    if k < len(candidates):
+        partition = np.argpartition(-values, k - 1)[:k]
+        kth = values[partition].min()
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(candidates))
+    return candidates[selected[np.lexsort((selected, -values[selected]))]]
+
+
+class BM25Matrix:
+    """BM25词项-文档权重矩阵（CSR，按词项分行，纯numpy实现）
+
+    第t行是词项t的倒排：doc_index[indptr[t]:indptr[t+1]] 为包含该词的文档（升序），tf为对应词频。
+    打分与BM25Okapi一致（idf为负的词取 epsilon × 平均idf），语料变化后在首次查询时整体重算权重，
+    查询即查询词计数向量与权重矩阵的稀疏乘积：只取查询词对应的行按文档累加。
+    覆盖大部分文档的高频词（空格、"+"等）另存一份稠密行，累加时不必按下标散列写入。
+    """
+
+    # 文档频率达到文档数的 1/DENSE_ROW_RATIO 时另存稠密行（float32稠密行不超过稀疏存储的4倍，
+    # 约在这个密度以上，整行相加比按下标散列写入更快）
+    DENSE_ROW_RATIO = 8
+    # 只对部分文档打分时，候选不到文档数的 1/SUBSET_RATIO 才逐词二分查找候选，否则全量打分后取候选
+    # （二分查找按元素计比顺序累加慢一个数量级）
+    SUBSET_RATIO = 32
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.terms = []
+        self.vocab = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.doc_index = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0)
+        self._weights = None
+        self._dense_rows = {}
+
+    @property
+    def n_docs(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def doc_freq(self) -> np.ndarray:
+        """每个词项的文档频率（已全部移除的词项为0）"""
+        return np.diff(self.indptr)
+
+    def _entry_terms(self) -> np.ndarray:
+        """每个非零元素所属的词项"""
+        return np.repeat(np.arange(len(self.terms), dtype=np.int32), self.doc_freq)
+
+    def _set_entries(self, entry_terms: np.ndarray, doc_index: np.ndarray, tf: np.ndarray):
+        """由按词项排好序的非零元素重建CSR"""
+        counts = np.bincount(entry_terms, minlength=len(self.terms))
+        self.indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.doc_index = doc_index.astype(np.int32)
+        self.tf = tf.astype(np.float32)
+        self._weights = None
+        self._dense_rows = {}
+
+    def add(self, tokenized_docs: List[List[str]]):
+        """追加文档（新文档下标接在已有文档之后）"""
+        n_new = len(tokenized_docs)
+        if not n_new:
+            return
+        old_terms = self._entry_terms()
+        lengths = np.fromiter(map(len, tokenized_docs), dtype=np.int64, count=n_new)
+        codes, uniques = pd.factorize(np.array(list(chain.from_iterable(tokenized_docs)), dtype=object))
+
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, term in enumerate(uniques):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = self.vocab[term] = len(self.terms)
+                self.terms.append(term)
+            mapping[i] = term_id
+
+        # (词项, 文档) 编码为一个整数去重计数，结果按词项、文档升序排列
+        total = self.n_docs + n_new
+        docs = np.repeat(np.arange(self.n_docs, total, dtype=np.int64), lengths)
+        keys, counts = np.unique(mapping[codes] * total + docs, return_counts=True)
+        new_terms, new_docs = np.divmod(keys, total)
+
+        if len(self.doc_index):
+            # 新文档下标都大于已有文档，按词项稳定排序后每行仍按文档升序
+            entry_terms = np.concatenate([old_terms, new_terms])
+            order = np.argsort(entry_terms, kind='stable')
+            self._set_entries(
+                entry_terms[order],
+                np.concatenate([self.doc_index, new_docs])[order],
+                np.concatenate([self.tf, counts])[order]
+            )
+        else:
+            self._set_entries(new_terms, new_docs, counts)
+        self.doc_len = np.concatenate([self.doc_len, lengths])
+
+    def remove(self, keep: np.ndarray):
+        """移除文档（keep为保留文档的布尔掩码，保留文档按原顺序重新编号）"""
+        entry_keep = keep[self.doc_index]
+        remap = np.cumsum(keep) - 1
+        self._set_entries(
+            self._entry_terms()[entry_keep],
+            remap[self.doc_index[entry_keep]],
+            self.tf[entry_keep]
+        )
+        self.doc_len = self.doc_len[keep]
+
+    def idf(self) -> np.ndarray:
+        """每个词项的idf（负idf取 epsilon × 平均idf，平均值只计语料中存在的词项）"""
+        freq = self.doc_freq.astype(np.float64)
+        present = freq > 0
+        idf = np.log(self.n_docs - freq + 0.5) - np.log(freq + 0.5)
+        idf[~present] = 0.0
+        if present.any():
+            idf[present & (idf < 0)] = self.epsilon * idf[present].mean()
+        return idf
+
+    def weights(self) -> np.ndarray:
+        """非零元素的BM25权重（语料变化后首次调用时重算）"""
+        if self._weights is None:
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len / self.doc_len.mean())
+            tf = self.tf.astype(np.float64)
+            weights = self.idf()[self._entry_terms()] * tf * (self.k1 + 1) / (tf + norm[self.doc_index])
+            self._weights = weights.astype(np.float32)
+
+            self._dense_rows = {}
+            for term_id in np.flatnonzero(self.doc_freq * self.DENSE_ROW_RATIO >= self.n_docs):
+                row = slice(self.indptr[term_id], self.indptr[term_id + 1])
+                dense = np.zeros(self.n_docs, dtype=np.float32)
+                dense[self.doc_index[row]] = self._weights[row]
+                self._dense_rows[term_id] = dense
+        return self._weights
+
+    def _row_entries(self, term_id: int, weights: np.ndarray, docs: np.ndarray = None) -> tuple:
+        """
+        权重矩阵第term_id行在得分列上的 (列下标, 权重)；列下标为None表示稠密行（覆盖全部列）
+
+        docs不为None时得分列即docs（升序）：倒排和候选都是升序，在较长的一方中二分查找较短的一方。
+        """
+        dense = self._dense_rows.get(term_id)
+        row = slice(self.indptr[term_id], self.indptr[term_id + 1])
+        if docs is None:
+            return (None, dense) if dense is not None else (self.doc_index[row], weights[row])
+        if dense is not None:
+            return None, dense[docs]
+        row_docs = self.doc_index[row]
+        if not len(row_docs):
+            return row_docs, weights[row]
+        if len(docs) < len(row_docs):
+            pos = np.minimum(np.searchsorted(row_docs, docs), len(row_docs) - 1)
+            hit = row_docs[pos] == docs
+            return np.flatnonzero(hit), weights[row][pos[hit]]
+        pos = np.minimum(np.searchsorted(docs, row_docs), len(docs) - 1)
+        hit = docs[pos] == row_docs
+        return pos[hit], weights[row][hit]
+
+    def get_scores(self, query_tokens: Iterable[str], docs: np.ndarray = None) -> np.ndarray:
+        """
+        查询的BM25得分（重复的查询词重复计分）
+
+        Args:
+            query_tokens: 查询分词
+            docs: 只对这些文档打分（升序下标，None为全部文档）；idf等语料统计不受影响
+
+        Returns:
+            每个文档的得分（指定docs时与docs一一对应）
+        """
+        return self.get_scores_batch([list(query_tokens)], docs)[0]
+
+    def get_scores_batch(self, tokenized_queries: List[List[str]], docs: np.ndarray = None) -> np.ndarray:
+        """
+        一批查询的BM25得分矩阵
+
+        即查询-词项计数矩阵与权重矩阵的稀疏乘积：按词项遍历，每个词项的倒排行一次累加到所有包含该词的查询上。
+
+        Args:
+            tokenized_queries: 每个查询的分词
+            docs: 只对这些文档打分（升序下标，None为全部文档）
+
+        Returns:
+            float32得分矩阵，形状为 (查询数, 文档数) 或 (查询数, len(docs))
+        """
+        if docs is not None and len(docs) * self.SUBSET_RATIO >= self.n_docs:
+            # 候选占比较大时全量打分再取候选更快
+            return self.get_scores_batch(tokenized_queries)[:, docs]
+
+        n_queries = len(tokenized_queries)
+        n_scores = self.n_docs if docs is None else len(docs)
+        # 与权重同为float32累加（混合精度相加需要逐元素转换，稠密行相加慢约3倍）
+        scores = np.zeros((n_queries, n_scores), dtype=np.float32)
+        pairs = [
+            self.vocab[token] * n_queries + query_id
+            for query_id, tokens in enumerate(tokenized_queries)
+            for token in tokens if token in self.vocab
+        ]
+        if not pairs or not n_scores:
+            return scores
+
+        # (词项, 查询) 编码为一个整数计数：按词项、查询升序排列，重复的查询词计数大于1
+        keys, multiplicity = np.unique(pairs, return_counts=True)
+        term_ids, query_ids = np.divmod(keys, n_queries)
+        multiplicity = multiplicity.astype(np.float32)
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(term_ids)) + 1, [len(keys)]])
+
+        weights = self.weights()
+        if docs is not None:
+            docs = docs.astype(self.doc_index.dtype)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            cols, values = self._row_entries(term_ids[start], weights, docs)
+            queries, m = query_ids[start:end], multiplicity[start:end]
+            if len(queries) == 1:
+                # 同一行内文档下标不重复，可直接按下标累加
+                target = scores[queries[0]]
+                if cols is None:
+                    np.add(target, values if m[0] == 1 else values * m[0], out=target)
+                else:
+                    target[cols] += values * m[0]
+            elif cols is None:
+                scores[queries] += m[:, None] * values
+            else:
+                scores[np.ix_(queries, cols)] += m[:, None] * values
+        return scores
+
+
+class FilterIndex:
+    """活动结构化过滤索引（按文档下标，检索打分前圈定候选）
+
+    类别字段（目标人群、优惠方式、资源位）按取值分组存放文档下标，数值/日期字段（ROI、起止日期）
+    存按值升序排列的文档下标，范围条件二分查找取一段。查询时每个条件散列成一个布尔位图，
+    多个条件按位与；字段缺失或取值为空的活动不满足该字段上的任何条件。
+    """
+
+    CATEGORY_FIELDS = ('target_segment', 'discount')
+    RANGE_FIELDS = ('roi', 'start_date', 'end_date')
+
+    def __init__(self, campaigns_df: pd.DataFrame):
+        """
+        按活动表构建索引
+
+        Args:
+            campaigns_df: 活动表（行顺序即文档下标）
+        """
+        self.n_docs = len(campaigns_df)
+        self.postings = {}
+        for field in self.CATEGORY_FIELDS:
+            if field in campaigns_df.columns:
+                values, docs = self._parse_unique(campaigns_df[field], lambda uniques: uniques.astype(str).str.strip())
+                self.postings[field] = self._group(values, docs)
+        self.postings['resource_positions'] = self._group(*self._resource_positions(campaigns_df))
+
+        self.sorted = {}
+        self.missing = {}
+        for field in self.RANGE_FIELDS:
+            if field not in campaigns_df.columns:
+                continue
+            if field == 'roi':
+                values = pd.to_numeric(campaigns_df[field], errors='coerce')
+            else:
+                values = pd.to_datetime(campaigns_df[field], errors='coerce')
+            values = values.to_numpy()
+            missing = pd.isna(values)
+            valid = np.flatnonzero(~missing)
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self.sorted[field] = (values[order], order)
+            self.missing[field] = np.flatnonzero(missing)
+
+    @staticmethod
+    def _group(values: np.ndarray, docs: np.ndarray) -> dict:
+        """取值 -> 升序文档下标（空值不计）"""
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        docs = docs[order]
+        return {
+            value: np.unique(docs[bounds[i]:bounds[i + 1]])
+            for i, value in enumerate(uniques)
+        }
+
+    @staticmethod
+    def _parse_unique(column: pd.Series, parse) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对列中的不同取值逐一解析，再展开到取该值的文档（活动表中的取值大量重复）
+
+        Args:
+            column: 活动表中的一列
+            parse: 不同取值Series -> 解析结果Series（索引为取值在Series中的位置）
+
+        Returns:
+            (解析结果, 文档下标)
+        """
+        codes, uniques = pd.factorize(column.to_numpy())
+        parsed = parse(pd.Series(uniques, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        source = parsed.index.to_numpy(dtype=np.int64)
+        return (
+            np.repeat(parsed.to_numpy(dtype=object), bounds[source + 1] - bounds[source]),
+            np.concatenate([order[bounds[c]:bounds[c + 1]] for c in source] or [np.zeros(0, dtype=np.int64)])
+        )
+
+    @staticmethod
+    def _parse_capacity(capacity: pd.Series) -> pd.Series:
+        """resource_capacity取值 -> 资源位名称"""
+        usage = DataLoader.parse_resource_usage(pd.DataFrame({
+            'campaign_id': np.arange(len(capacity)),
+            'resource_capacity': capacity,
+        }))
+        return pd.Series(usage['resource_position'].to_numpy(), index=usage['campaign_id'].to_numpy())
+
+    @staticmethod
+    def _parse_positions(positions: pd.Series) -> pd.Series:
+        """resource_positions取值 -> 资源位名称（省略前缀的简写如'首页位1+位3'中的'位3'补全为'首页位3'）"""
+        items = positions.astype(str).str.split('+').explode().str.strip()
+        items = items[items != '']
+        prefix = items.str.extract(r'^(.+?)位\d+$', expand=False).groupby(level=0).ffill()
+        shorthand = items.str.fullmatch(r'位\d+')
+        return items.where(~shorthand, (prefix.groupby(level=0).shift() + items).fillna(items))
+
+    @classmethod
+    def _resource_positions(cls, campaigns_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """每个活动使用的资源位（资源位名称, 文档下标），合并resource_capacity和resource_positions两列"""
+        names, docs = [np.zeros(0, dtype=object)], [np.zeros(0, dtype=np.int64)]
+        for field, parse in [('resource_capacity', cls._parse_capacity), ('resource_positions', cls._parse_positions)]:
+            if field in campaigns_df.columns:
+                field_names, field_docs = cls._parse_unique(campaigns_df[field], parse)
+                names.append(field_names)
+                docs.append(field_docs)
+        return np.concatenate(names), np.concatenate(docs)
+
+    def options(self, field: str) -> List[str]:
+        """类别字段（含resource_positions）的全部取值（排序后）"""
+        return sorted(self.postings.get(field, {}))
+
+    def _match_any(self, field: str, values: Iterable[str]) -> np.ndarray:
+        """字段取值为values之一的文档"""
+        postings = self.postings.get(field, {})
+        mask = np.zeros(self.n_docs, dtype=bool)
+        for value in values:
+            docs = postings.get(str(value).strip())
+            if docs is not None:
+                mask[docs] = True
+        return mask
+
+    def _match_range(self, field: str, low, high) -> np.ndarray:
+        """字段取值在 [low, high] 内的文档（None表示不限）"""
+        if field not in self.sorted:
+            return np.zeros(self.n_docs, dtype=bool)
+        values, order = self.sorted[field]
+        if field != 'roi':
+            low = None if low is None else pd.Timestamp(low).to_datetime64()
+            high = None if high is None else pd.Timestamp(high).to_datetime64()
+        start = 0 if low is None else np.searchsorted(values, low, side='left')
+        end = len(values) if high is None else np.searchsorted(values, high, side='right')
+
+        # 按范围内、范围外中较少的一方散列（取值为空的文档不在order中，始终不满足）
+        if (end - start) * 2 <= self.n_docs:
+            mask = np.zeros(self.n_docs, dtype=bool)
+            mask[order[start:end]] = True
+        else:
+            mask = np.ones(self.n_docs, dtype=bool)
+            mask[order[:start]] = False
+            mask[order[end:]] = False
+            mask[self.missing[field]] = False
+        return mask
+
+    def select(self, target_segment: Union[str, Iterable[str]] = None, discount: Union[str, Iterable[str]] = None,
+               resource_positions: Union[str, Iterable[str]] = None, date_range: Tuple = None,
+               roi_range: Tuple = None) -> np.ndarray:
+        """
+        满足全部过滤条件的文档掩码
+
+        Args:
+            target_segment: 目标人群（一个或多个，满足其一即可）
+            discount: 优惠方式（一个或多个，满足其一即可）
+            resource_positions: 资源位（一个或多个，需全部使用）
+            date_range: (起, 止) 日期，活动期与该区间有重叠即满足（任一端为None表示不限）
+            roi_range: (下限, 上限) ROI，闭区间（任一端为None表示不限）
+
+        Returns:
+            布尔掩码（按文档下标）
+        """
+        as_list = lambda value: [value] if isinstance(value, str) else list(value)
+        masks = []
+        if target_segment is not None:
+            masks.append(self._match_any('target_segment', as_list(target_segment)))
+        if discount is not None:
+            masks.append(self._match_any('discount', as_list(discount)))
+        if resource_positions is not None:
+            masks.extend(self._match_any('resource_positions', [p]) for p in as_list(resource_positions))
+        if date_range is not None:
+            date_from, date_to = date_range
+            # 活动期 [start_date, end_date] 与 [date_from, date_to] 有重叠
+            masks.append(self._match_range('start_date', None, date_to))
+            masks.append(self._match_range('end_date', date_from, None))
+        if roi_range is not None:
+            masks.append(self._match_range('roi', *roi_range))
+
+        if not masks:
+            return np.ones(self.n_docs, dtype=bool)
+        mask = masks[0]
+        for condition in masks[1:]:
+            mask &= condition
+        return mask
 
 
 class CampaignRAG:
-    """活动经验RAG检索器"""
+    """活动经验RAG检索器
+
+    文档以campaign_id为键并记录检索文本的哈希，build_index时与持久化的索引比对，
+    只对新增和内容变化的活动重新分词；打分见BM25Matrix。
+    向量检索器（DenseRetriever）在第一次向量/混合检索时构建，之后随文档增量更新。
+    过滤索引（FilterIndex）随build_index构建，增量更新后在下一次带过滤条件的检索时重建。
+    """
+
+    def __init__(self, index_path: str = None):
+        """
+        初始化检索器
 
-    def __init__(self):
-        self.bm25 = None
+        Args:
+            index_path: 索引持久化目录（None表示只在内存中构建）
+        """
+        self.index_path = index_path
+        self.bm25 = BM25Matrix()
+        self.dense = None
+        self.filters = None
         self.campaigns_df = None
-        self.tokenized_docs = []
+        self.doc_ids = []
+        self.doc_hashes = []
+        self._generation = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def search_texts(campaigns_df: pd.DataFrame) -> pd.Series:
+        """拼接检索文本（按列向量化拼接）"""
+        text = campaigns_df[SEARCH_FIELDS[0]].astype(str)
+        for field in SEARCH_FIELDS[1:]:
+            text = text + ' ' + campaigns_df[field].astype(str)
+        return text
+
+    @classmethod
+    def _prepare(cls, campaigns_df: pd.DataFrame) -> pd.DataFrame:
+        """去重（同一campaign_id保留最后一条）并补充检索文本及其哈希"""
+        campaigns = campaigns_df.drop_duplicates('campaign_id', keep='last').reset_index(drop=True)
+        campaigns['search_text'] = cls.search_texts(campaigns)
+        campaigns['text_hash'] = pd.util.hash_pandas_object(campaigns['search_text'], index=False).to_numpy()
+        return campaigns
 
     def build_index(self, campaigns_df: pd.DataFrame):
-        """构建BM25索引"""
-        self.campaigns_df = campaigns_df.copy()
+        """构建BM25索引（有持久化索引时只对新增和变化的活动分词）"""
+        with self._lock:
+            campaigns = self._prepare(campaigns_df)
+            if self.index_path is not None:
+                self._load()
 
-        # 构建检索文本
-        self.campaigns_df['search_text'] = campaigns_df.apply(
-            lambda row: f"{row['strategy_tag']} {row['target_segment']} {row['success_factors']} {row['content_mix']}",
-            axis=1
-        )
+            current = dict(zip(campaigns['campaign_id'], campaigns['text_hash']))
+            stale = [
+                cid for cid, text_hash in zip(self.doc_ids, self.doc_hashes)
+                if current.get(cid) != text_hash
+            ]
+            self._remove_docs(stale)
+            new = campaigns[~campaigns['campaign_id'].isin(self.doc_ids)]
+            self._add_docs(new)
 
-        # 分词
-        self.tokenized_docs = [
-            list(jieba.cut(text))
-            for text in self.campaigns_df['search_text']
-        ]
+            # 活动表按索引中的文档顺序排列，检索结果按下标取行
+            self.campaigns_df = campaigns.set_index('campaign_id', drop=False).loc[self.doc_ids].reset_index(drop=True)
+            self.filters = FilterIndex(self.campaigns_df)
+            if self.index_path is not None and (stale or len(new)):
+                self.save()
+
+        print(f"✅ RAG索引构建完成: {len(self.doc_ids)} 个历史活动（本次分词 {len(new)} 个）")
+
+    def add_documents(self, campaigns_df: pd.DataFrame):
+        """
+        增量加入活动（campaign_id已存在时视为更新，替换原文档）
+
+        Args:
+            campaigns_df: 新活动数据（与历史活动表相同的列）
+        """
+        with self._lock:
+            campaigns = self._prepare(campaigns_df)
+            self._remove_docs(campaigns['campaign_id'])
+            self._add_docs(campaigns)
+
+            if self.campaigns_df is None:
+                self.campaigns_df = campaigns
+            else:
+                kept = self.campaigns_df[~self.campaigns_df['campaign_id'].isin(campaigns['campaign_id'])]
+                self.campaigns_df = pd.concat([kept, campaigns], ignore_index=True)
+            self.filters = None
+            if self.index_path is not None:
+                self.save()
+
+    def remove_documents(self, campaign_ids: Iterable):
+        """
+        移除活动
+
+        Args:
+            campaign_ids: 要移除的campaign_id（不存在的忽略）
+        """
+        with self._lock:
+            removed = self._remove_docs(campaign_ids)
+            if removed and self.campaigns_df is not None:
+                self.campaigns_df = self.campaigns_df[
+                    self.campaigns_df['campaign_id'].isin(self.doc_ids)
+                ].reset_index(drop=True)
+                self.filters = None
+            if removed and self.index_path is not None:
+                self.save()
+
+    def _add_docs(self, campaigns: pd.DataFrame):
+        """分词并追加文档"""
+        texts = campaigns['search_text'].tolist()
+        self.bm25.add([list(jieba.cut(text)) for text in texts])
+        self.doc_ids = self.doc_ids + campaigns['campaign_id'].tolist()
+        self.doc_hashes = self.doc_hashes + campaigns['text_hash'].tolist()
+
+        if self.dense is not None:
+            if self.dense.index.centroids is None:
+                self.dense = None
+            else:
+                self.dense.add(texts)
+                if self.dense.needs_refit():
+                    # 语料已远大于fit时的规模，下次向量检索时重新构建
+                    self.dense = None
 
-        # 创建BM25索引
-        self.bm25 = BM25Okapi(self.tokenized_docs)
+    def _remove_docs(self, campaign_ids: Iterable) -> int:
+        """移除文档，返回移除的文档数"""
+        targets = set(campaign_ids)
+        keep = np.fromiter((cid not in targets for cid in self.doc_ids), dtype=bool, count=len(self.doc_ids))
+        if keep.all():
+            return 0
 
-        print(f"✅ RAG索引构建完成: {len(campaigns_df)} 个历史活动")
+        self.bm25.remove(keep)
+        if self.dense is not None:
+            self.dense.remove(keep)
+        self.doc_ids = [cid for cid, k in zip(self.doc_ids, keep) if k]
+        self.doc_hashes = [h for h, k in zip(self.doc_hashes, keep) if k]
+        return int((~keep).sum())
 
-    def search(self, query: str, top_k: int = 3) -> pd.DataFrame:
+    def save(self):
+        """持久化文档信息、词项文档频率和词频矩阵
+
+        各文件先写临时文件再替换，并带同一个批次号；加载时批次号不一致视为索引损坏，重新构建。
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        generation = self._generation = time.time_ns()
+        bm25 = self.bm25
+        tables = {
+            'docs.parquet': pd.DataFrame({
+                'campaign_id': self.doc_ids,
+                'text_hash': np.array(self.doc_hashes, dtype=np.uint64),
+                'doc_len': bm25.doc_len.astype(np.int64),
+                'generation': generation,
+            }),
+            'terms.parquet': pd.DataFrame({
+                'term': bm25.terms,
+                'doc_freq': bm25.doc_freq,
+                'generation': generation,
+            }),
+        }
+        try:
+            for name, table in tables.items():
+                path = os.path.join(self.index_path, name)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                table.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+
+            # 词频矩阵按词项分行，行边界由terms中的文档频率累加得到
+            path = os.path.join(self.index_path, 'postings.npz')
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, doc_index=bm25.doc_index, tf=bm25.tf, generation=generation)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ RAG索引保存失败: {e}")
+        self._save_dense()
+
+    def _save_dense(self):
+        """持久化向量检索器（与其余索引文件同一批次号，未构建时不写）"""
+        if self.dense is None or self.dense.index.centroids is None or self._generation is None:
+            return
+        path = os.path.join(self.index_path, 'dense.npz')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, generation=self._generation, **self.dense.to_arrays())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 向量索引保存失败: {e}")
+
+    def _load(self) -> bool:
+        """加载持久化索引（不存在或损坏时返回False，保持空索引）"""
+        try:
+            docs = pd.read_parquet(os.path.join(self.index_path, 'docs.parquet'))
+            terms = pd.read_parquet(os.path.join(self.index_path, 'terms.parquet'))
+            with np.load(os.path.join(self.index_path, 'postings.npz')) as postings:
+                doc_index, tf = postings['doc_index'], postings['tf']
+                generations = {int(postings['generation'])}
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"⚠️ RAG索引读取失败，将重新构建: {e}")
+            return False
+
+        generations |= set(docs['generation']) | set(terms['generation'])
+        if len(generations) > 1 or terms['doc_freq'].sum() != len(doc_index):
+            print("⚠️ RAG索引文件不一致，将重新构建")
+            return False
+
+        bm25 = BM25Matrix()
+        bm25.terms = terms['term'].tolist()
+        bm25.vocab = {term: i for i, term in enumerate(bm25.terms)}
+        bm25.indptr = np.concatenate([[0], np.cumsum(terms['doc_freq'].to_numpy())]).astype(np.int64)
+        bm25.doc_index = doc_index
+        bm25.tf = tf
+        bm25.doc_len = docs['doc_len'].to_numpy(dtype=np.float64)
+        self.bm25 = bm25
+        self.doc_ids = docs['campaign_id'].tolist()
+        self.doc_hashes = docs['text_hash'].tolist()
+        self._generation = int(generations.pop())
+        self.dense = self._load_dense()
+        return True
+
+    def _load_dense(self):
+        """加载持久化的向量检索器（不存在或批次号不一致时返回None，下次向量检索时重建）"""
+        try:
+            with np.load(os.path.join(self.index_path, 'dense.npz')) as arrays:
+                if int(arrays['generation']) != self._generation:
+                    return None
+                return DenseRetriever.from_arrays(arrays)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"⚠️ 向量索引读取失败，将重新构建: {e}")
+            return None
+
+    def _get_dense(self) -> DenseRetriever:
+        """向量检索器（首次使用时在当前语料上构建，调用方需持有锁）"""
+        if self.dense is None:
+            dense = DenseRetriever(dim=Config.RAG_DENSE_DIM, nprobe=Config.RAG_IVF_NPROBE)
+            dense.fit(self.campaigns_df['search_text'].tolist())
+            self.dense = dense
+            if self.index_path is not None:
+                self._save_dense()
+        return self.dense
+
+    def _get_filters(self) -> FilterIndex:
+        """过滤索引（活动变化后首次使用时重建，调用方需持有锁）"""
+        if self.filters is None:
+            self.filters = FilterIndex(self.campaigns_df)
+        return self.filters
+
+    def filter_options(self) -> dict:
+        """
+        各类别过滤字段的可选值（供页面筛选控件使用）
+
+        Returns:
+            {'target_segment': [...], 'discount': [...], 'resource_positions': [...]}
+        """
+        if self.campaigns_df is None:
+            raise ValueError("请先调用build_index()构建索引")
+        with self._lock:
+            filters = self._get_filters()
+            return {
+                field: filters.options(field)
+                for field in (*FilterIndex.CATEGORY_FIELDS, 'resource_positions')
+            }
+
+    @staticmethod
+    def _fuse(bm25_indices: np.ndarray, dense_indices: np.ndarray, top_k: int):
+        """RRF融合：两路各自的排名取倒数相加"""
+        rankings = [bm25_indices, dense_indices]
+        indices = np.concatenate(rankings)
+        contributions = np.concatenate([1.0 / (RRF_K + np.arange(1, len(r) + 1)) for r in rankings])
+        docs, inverse = np.unique(indices, return_inverse=True)
+        fused = np.bincount(inverse, weights=contributions)
+
+        top = top_k_indices(fused, top_k)
+        return docs[top], fused[top]
+
+    def search(self, query: str, top_k: int = 3, mode: str = 'bm25',
+               target_segment: Union[str, Iterable[str]] = None, discount: Union[str, Iterable[str]] = None,
+               resource_positions: Union[str, Iterable[str]] = None, date_range: Tuple = None,
+               roi_range: Tuple = None) -> pd.DataFrame:
         """
         检索相似活动
 
+        过滤条件在打分前圈定候选，只对满足全部条件的活动打分，得分与不过滤时相同。
+
         Args:
             query: 查询文本
             top_k: 返回top_k个结果
+            mode: 检索方式（bm25/dense/hybrid，见SEARCH_MODES）
+            target_segment: 目标人群（一个或多个，满足其一即可）
+            discount: 优惠方式（一个或多个，满足其一即可）
+            resource_positions: 资源位（一个或多个，需全部使用）
+            date_range: (起, 止) 日期，活动期与该区间有重叠的活动
+            roi_range: (下限, 上限) ROI闭区间
 
         Returns:
             检索结果DataFrame
         """
-        if self.bm25 is None:
+        if self.campaigns_df is None:
             raise ValueError("请先调用build_index()构建索引")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"未知检索方式: {mode}")
 
         # 查询分词
-        tokenized_query = list(jieba.cut(query))
+        tokenized_query = list(jieba.cut(query)) if mode != 'dense' else []
+        n_candidates = max(top_k * 10, RRF_MIN_CANDIDATES)
+        filters = {
+            'target_segment': target_segment, 'discount': discount, 'resource_positions': resource_positions,
+            'date_range': date_range, 'roi_range': roi_range,
+        }
+        filtered = any(value is not None for value in filters.values())
 
-        # 检索
-        scores = self.bm25.get_scores(tokenized_query)
+        # 权重矩阵/向量索引/过滤索引在锁内按需构建，增量更新期间不会读到不一致的索引
+        with self._lock:
+            campaigns = self.campaigns_df
+            allowed = self._get_filters().select(**filters) if filtered else None
+            docs = np.flatnonzero(allowed) if filtered else None
+            if mode != 'dense':
+                scores = self.bm25.get_scores(tokenized_query, docs)
+            if mode != 'bm25':
+                dense_indices, dense_scores = self._get_dense().search(
+                    query, top_k if mode == 'dense' else n_candidates, allowed=allowed
+                )
 
-        # 获取top_k索引
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+        top_indices, top_scores = self._rank(
+            mode, top_k, n_candidates,
+            scores if mode != 'dense' else None, docs,
+            (dense_indices, dense_scores) if mode != 'bm25' else None
+        )
 
         # 返回结果
-        results = self.campaigns_df.iloc[top_indices].copy()
-        results['similarity_score'] = [scores[i] for i in top_indices]
+        results = campaigns.iloc[top_indices].copy()
+        results['similarity_score'] = top_scores
 
         # 归一化分数到0-1
         max_score = results['similarity_score'].max() if len(results) > 0 and results['similarity_score'].max() > 0 else 1
         results['similarity_score'] = results['similarity_score'] / max_score
 
-        return results[[
-            'campaign_id', 'strategy_tag', 'target_segment',
-            'roi', 'arpu_lift', 'success_factors', 'similarity_score'
-        ]]
+        return results[RESULT_COLUMNS]
+
+    def search_batch(self, queries: Iterable[str], top_k: int = 3, mode: str = 'bm25',
+                     workers: int = None, **filters) -> pd.DataFrame:
+        """
+        批量检索相似活动（结果与逐个调用search相同）
+
+        查询先并行分词（见tokenize_batch），BM25按查询分块，每块以一次稀疏矩阵乘积对全部查询打分；
+        向量检索时所有查询一次性向量化。过滤条件对所有查询相同，只计算一次。
+
+        Args:
+            queries: 查询文本
+            top_k: 每个查询返回top_k个结果
+            mode: 检索方式（bm25/dense/hybrid，见SEARCH_MODES）
+            workers: 分词进程数（None使用Config.RAG_BATCH_WORKERS）
+            **filters: 过滤条件（target_segment/discount/resource_positions/date_range/roi_range，同search）
+
+        Returns:
+            长表DataFrame：query_index（查询序号）、query、rank（从1开始）及search结果的各列，
+            按 (query_index, rank) 排序；没有结果的查询不出现
+        """
+        if self.campaigns_df is None:
+            raise ValueError("请先调用build_index()构建索引")
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"未知检索方式: {mode}")
+
+        queries = [str(query) for query in queries]
+        tokenized_queries = tokenize_batch(queries, workers) if mode != 'dense' else None
+        n_candidates = max(top_k * 10, RRF_MIN_CANDIDATES)
+        filtered = any(value is not None for value in filters.values())
+
+        ranked = []
+        with self._lock:
+            campaigns = self.campaigns_df
+            allowed = self._get_filters().select(**filters) if filtered else None
+            docs = np.flatnonzero(allowed) if filtered else None
+            if mode != 'bm25':
+                dense_results = self._get_dense().search_batch(
+                    queries, top_k if mode == 'dense' else n_candidates, allowed=allowed
+                )
+            n_scores = len(self.doc_ids) if docs is None else len(docs)
+            block = max(1, BATCH_SCORE_CELLS // max(n_scores, 1))
+            for start in range(0, len(queries), block):
+                if mode != 'dense':
+                    scores = self.bm25.get_scores_batch(tokenized_queries[start:start + block], docs)
+                for offset in range(min(block, len(queries) - start)):
+                    ranked.append(self._rank(
+                        mode, top_k, n_candidates,
+                        scores[offset] if mode != 'dense' else None, docs,
+                        dense_results[start + offset] if mode != 'bm25' else None
+                    ))
+
+        # 拼成长表，分数按查询分别归一化到0-1
+        counts = np.array([len(indices) for indices, _ in ranked], dtype=np.int64)
+        query_index = np.repeat(np.arange(len(queries)), counts)
+        top_indices = np.concatenate([indices for indices, _ in ranked] or [np.zeros(0, dtype=np.int64)])
+        top_scores = np.concatenate([scores for _, scores in ranked] or [np.zeros(0)]).astype(np.float64)
+        max_scores = np.array([scores.max() if len(scores) else 0 for _, scores in ranked], dtype=np.float64)
+        max_scores = np.where(max_scores > 0, max_scores, 1)
+
+        results = campaigns.iloc[top_indices][[c for c in RESULT_COLUMNS if c != 'similarity_score']].reset_index(drop=True)
+        results.insert(0, 'query_index', query_index)
+        results.insert(1, 'query', np.array(queries, dtype=object)[query_index])
+        results.insert(2, 'rank', np.arange(len(top_indices)) - np.repeat(np.cumsum(counts) - counts, counts) + 1)
+        results['similarity_score'] = top_scores / max_scores[query_index]
+        return results
+
+    def _rank(self, mode: str, top_k: int, n_candidates: int, scores: np.ndarray = None,
+              docs: np.ndarray = None, dense_result: tuple = None) -> tuple:
+        """
+        由BM25得分和/或向量检索结果取前top_k个
+
+        Args:
+            mode: 检索方式
+            top_k: 返回数量
+            n_candidates: 混合检索时每一路参与融合的候选数
+            scores: BM25得分（过滤时与docs一一对应）
+            docs: 过滤后的候选文档下标（None表示未过滤）
+            dense_result: 向量检索的 (文档下标, 相似度)
+
+        Returns:
+            (文档下标, 未归一化的分数)
+        """
+        if mode != 'dense':
+            bm25_top = top_k_indices(scores, top_k if mode == 'bm25' else n_candidates)
+            bm25_scores = scores[bm25_top]
+            # 过滤时BM25得分与docs一一对应，映射回文档下标
+            bm25_indices = docs[bm25_top] if docs is not None else bm25_top
+        if mode == 'bm25':
+            return bm25_indices, bm25_scores
+        dense_indices, dense_scores = dense_result
+        if mode == 'dense':
+            return dense_indices, np.maximum(dense_scores, 0)
+        # BM25未命中任何查询词的文档不参与融合
+        return self._fuse(bm25_indices[bm25_scores > 0], dense_indices, top_k)
@@ -3,6 +3,7 @@
 """
 import streamlit as st
 from modules.charts import ChartGenerator
+from modules.data_store import get_data_store
 
 st.title("🎯 目标规划与AI预测")
 
@@ -10,8 +11,9 @@ if not st.session_state.get('data_loaded'):
     st.error("❌ 数据未加载，请先在主页配置API Key并等待数据加载完成")
     st.stop()
 
-df = st.session_state.daily_df
-segments_df = st.session_state.segments_df
+store = get_data_store()
+df = store.get('daily_metrics')
+segments_df = store.get('user_segments')
 
 # 顶部操作指引
 st.info("💡 **新手指引**：本页面帮助您设定运营目标并评估可行性。请按照下方3个步骤操作 → 填写目标 → 查看分析 → 前往下一页生成策略")
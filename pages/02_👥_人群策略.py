@@ -5,6 +5,7 @@ import streamlit as st
 import json
 from modules.charts import ChartGenerator
 from modules.budget_simulator import BudgetSimulator
+from modules.data_store import get_data_store
 
 st.title("👥 人群圈选与策略推荐")
 
@@ -12,9 +13,10 @@ if not st.session_state.get('data_loaded'):
     st.error("❌ 数据未加载，请先在主页配置API Key并等待数据加载完成")
     st.stop()
 
-segments_df = st.session_state.segments_df
-campaigns_df = st.session_state.campaigns_df
-capacity_df = st.session_state.capacity_df
+store = get_data_store()
+segments_df = store.get('user_segments')
+campaigns_df = store.get('campaign_history')
+capacity_df = store.get('resource_capacity')
 ai_engine = st.session_state.ai_engine
 
 # 顶部操作指引
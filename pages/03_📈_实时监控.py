@@ -4,7 +4,8 @@
 import streamlit as st
 import pandas as pd
 from modules.charts import ChartGenerator
-from modules.anomaly_detector import AnomalyDetector
+from modules.anomaly_detector import AnomalyDetector, StreamingAnomalyDetector
+from modules.data_store import get_data_store
 
 st.title("📈 实时监控与异常检测")
 
@@ -12,7 +13,7 @@ if not st.session_state.get('data_loaded'):
     st.error("❌ 数据未加载，请先在主页配置API Key并等待数据加载完成")
     st.stop()
 
-df = st.session_state.daily_df.copy()
+df = get_data_store().get('daily_metrics')
 ai_engine = st.session_state.ai_engine
 
 # 顶部操作指引
@@ -144,6 +145,22 @@ else:
     st.success("✅ **近期数据平稳**，未检测到明显异常，系统运行正常")
     st.caption("系统使用Z-Score算法自动检测边现波动，已剔除周末/节假日影响")
 
+# 流式预警：只把上次之后的新数据点喂给检测器，每个点O(1)判定
+if 'stream_detector' not in st.session_state:
+    st.session_state.stream_detector = StreamingAnomalyDetector()
+stream_detector = st.session_state.stream_detector
+last_seen = stream_detector.last_date()
+new_points = df if last_seen is None else df[df['date'] > last_seen]
+stream_detector.update_frame(new_points)
+
+latest_date = df['date'].max().strftime('%Y-%m-%d')
+latest_alerts = [alert for alert in stream_detector.alerts if alert['date'] == latest_date]
+if latest_alerts:
+    alert = latest_alerts[-1]
+    st.error(f"🔔 **实时预警**：{latest_date} 边现 {alert['value']:.4f}元，偏离同类日基线 {alert['baseline']:.4f}元（Z-Score: {alert['zscore']:.2f}）")
+else:
+    st.caption(f"🔔 实时预警：最新数据点（{latest_date}）与同类日基线相比无明显异常")
+
 # ==================== 第3部分：AI异常分析 ====================
 if len(anomalies) > 0:
     st.markdown("---")
@@ -197,11 +214,15 @@ if len(anomalies) > 0:
                         'conversion_rate': float(anomaly_row.get('conversion_rate', 0))
                     }
 
-                    explanation = ai_engine.explain_anomaly(
-                        selected_anomaly,
-                        metrics_dict,
-                        df
-                    )
+                    # 流式输出：边生成边展示，完成后收进下方tabs
+                    stream_box = st.empty()
+                    with stream_box.container():
+                        explanation = st.write_stream(ai_engine.explain_anomaly_stream(
+                            selected_anomaly,
+                            metrics_dict,
+                            df
+                        ))
+                    stream_box.empty()
 
                     # 保存到session state
                     st.session_state.anomaly_analyzed = True
@@ -334,6 +355,30 @@ if len(anomalies) > 0:
 
                 st.info("💡 **提示**：行动清单包含AI分析、执行计划、责任分工，可直接用于团队协作")
 
+    # 批量分析：所有异常日期并发请求，先完成的先展示
+    if hasattr(ai_engine, 'explain_anomalies_iter') and len(anomaly_dates) > 1:
+        st.markdown("---")
+        st.markdown("### ⚡ 批量AI分析")
+        st.caption(f"同时分析全部 {len(anomaly_dates)} 个异常日期（最多 {ai_engine.max_concurrency} 个并发请求），结果按完成顺序展示")
+
+        if st.button("🚀 批量分析全部异常", use_container_width=True):
+            batch_results = {}
+            progress = st.progress(0.0, text="AI批量分析中...")
+            for done, (date_str, explanation) in enumerate(
+                ai_engine.explain_anomalies_iter(anomaly_dates, df), 1
+            ):
+                batch_results[date_str] = explanation
+                progress.progress(done / len(anomaly_dates), text=f"已完成 {done}/{len(anomaly_dates)}")
+                with st.expander(f"**{date_str}** 分析结果", expanded=(done == 1)):
+                    st.markdown(explanation)
+            st.session_state.batch_explanations = batch_results
+            st.success("✅ 批量分析完成！")
+
+        elif st.session_state.get('batch_explanations'):
+            for date_str, explanation in st.session_state.batch_explanations.items():
+                with st.expander(f"**{date_str}** 分析结果"):
+                    st.markdown(explanation)
+
 # ==================== 第4部分：预警规则配置 ====================
 st.markdown("---")
 st.markdown("## ⚙️ 第4部分：预警规则配置")
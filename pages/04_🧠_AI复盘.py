@@ -4,6 +4,8 @@
 import streamlit as st
 import pandas as pd
 from modules.charts import ChartGenerator
+from modules.data_store import get_data_store
+from utils.config import Config
 
 st.title("🧠 AI自动复盘")
 
@@ -11,7 +13,8 @@ if not st.session_state.get('data_loaded'):
     st.warning("请先在主页配置API Key")
     st.stop()
 
-df = st.session_state.daily_df.copy()
+store = get_data_store()
+df = store.get('daily_metrics')
 ai_engine = st.session_state.ai_engine
 
 # 选择复盘周期
@@ -29,6 +32,16 @@ with col2:
         value=df['date'].max().date()
     )
 
+# 生成方式：长周期默认分段汇总（重叠周期复用已生成的分段摘要）
+period_days = (end_date - start_date).days + 1
+report_mode = st.radio(
+    "生成方式",
+    ["整体生成", "按周分段汇总", "按活动分段汇总"],
+    index=1 if period_days > Config.REPORT_MAPREDUCE_DAYS else 0,
+    horizontal=True,
+    help="长周期复盘建议分段汇总：先并发生成每周/每个活动的摘要，再汇总成一份报告"
+)
+
 # 生成复盘报告
 if st.button("🤖 生成AI复盘报告", type="primary", use_container_width=True):
     with st.spinner("AI生成复盘报告中..."):
@@ -43,16 +56,45 @@ if st.button("🤖 生成AI复盘报告", type="primary", use_container_width=Tr
             st.stop()
 
         try:
-            # 调用AI生成报告
-            report = ai_engine.generate_report(
-                start_date.strftime('%Y-%m-%d'),
-                end_date.strftime('%Y-%m-%d'),
-                period_df
-            )
+            chunk_summaries = None
+            if report_mode != "整体生成" and hasattr(ai_engine, 'summarize_chunks_iter'):
+                # 分段摘要（并发，按完成先后更新进度）
+                chunks = ai_engine.report_chunks(
+                    period_df,
+                    by='campaign' if report_mode == "按活动分段汇总" else 'week',
+                    campaigns=store.get('campaign_history')
+                )
+                progress = st.progress(0.0, text=f"分段摘要 0/{len(chunks)}")
+                summaries = [None] * len(chunks)
+                for done, (index, text) in enumerate(ai_engine.summarize_chunks_iter(chunks), 1):
+                    summaries[index] = text
+                    progress.progress(done / len(chunks), text=f"分段摘要 {done}/{len(chunks)}")
+                progress.empty()
+
+                chunk_summaries = [(label, text) for (label, _), text in zip(chunks, summaries)]
+                report_stream = ai_engine.synthesize_report_stream(
+                    start_date.strftime('%Y-%m-%d'),
+                    end_date.strftime('%Y-%m-%d'),
+                    period_df,
+                    chunk_summaries
+                )
+            else:
+                report_stream = ai_engine.generate_report_stream(
+                    start_date.strftime('%Y-%m-%d'),
+                    end_date.strftime('%Y-%m-%d'),
+                    period_df
+                )
+
+            # 流式生成报告：边生成边展示，完成后收进下方tabs
+            stream_box = st.empty()
+            with stream_box.container():
+                report = st.write_stream(report_stream)
+            stream_box.empty()
 
             # 保存报告
             st.session_state.current_report = report
             st.session_state.current_period_df = period_df
+            st.session_state.current_chunk_summaries = chunk_summaries
 
             st.success("✅ 复盘报告生成完成！")
 
@@ -74,6 +116,7 @@ if st.button("🤖 生成AI复盘报告", type="primary", use_container_width=Tr
             report = ai_engine._get_default_report(total_revenue, avg_arpu, arpu_change, content_perf)
             st.session_state.current_report = report
             st.session_state.current_period_df = period_df
+            st.session_state.current_chunk_summaries = None
 
 # 展示报告
 if 'current_report' in st.session_state:
@@ -88,6 +131,12 @@ if 'current_report' in st.session_state:
     with tab1:
         st.markdown(report)
 
+        chunk_summaries = st.session_state.get('current_chunk_summaries')
+        if chunk_summaries:
+            with st.expander(f"🧩 分段摘要（{len(chunk_summaries)}段）"):
+                for label, text in chunk_summaries:
+                    st.markdown(f"**{label}**\n\n{text}")
+
     with tab2:
         st.markdown("### 🎯 策略执行模板（可直接复用）")
         st.info("💡 此模板提取自复盘报告，可直接用于下期活动策划")
@@ -218,7 +267,7 @@ if 'current_report' in st.session_state:
 st.markdown("---")
 st.markdown("### 📚 历史复盘记录")
 
-campaigns = st.session_state.campaigns_df.copy()
+campaigns = store.get('campaign_history')
 
 # 显示历史活动列表
 # 格式化显示数据
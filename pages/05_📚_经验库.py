@@ -3,6 +3,9 @@
 """
 import streamlit as st
 import pandas as pd
+from modules.data_store import get_data_store
+from modules.rag_search import SEARCH_MODES
+from utils.config import Config
 
 st.title("📚 活动经验知识库")
 
@@ -10,8 +13,9 @@ if not st.session_state.get('data_loaded'):
     st.error("❌ 数据未加载，请先在主页配置API Key并等待数据加载完成")
     st.stop()
 
-rag = st.session_state.rag
-campaigns = st.session_state.campaigns_df
+store = get_data_store()
+rag = store.get_rag()
+campaigns = store.get('campaign_history')
 
 # 顶部操作指引
 st.info("💡 **新手指引**：本页面帮助您从历史活动中查找相似案例。输入目标 → 检索案例 → 查看详情 → 下载模板")
@@ -45,7 +49,7 @@ with col3:
     )
 
 with col4:
-    avg_arpu_lift = campaigns['arpu_lift'].apply(lambda x: float(x.replace('+', '')) if isinstance(x, str) else 0).mean()
+    avg_arpu_lift = campaigns['arpu_lift_value'].mean()
     st.metric(
         "平均边现提升",
         f"+{avg_arpu_lift:.3f}",
@@ -107,6 +111,50 @@ with st.form("rag_search_form"):
         )
         st.caption(f"📋 返回 **{top_k}** 个案例")
 
+    mode_labels = {
+        'bm25': "关键词（BM25）",
+        'dense': "语义向量",
+        'hybrid': "混合（关键词+向量）",
+    }
+    search_mode = st.radio(
+        "检索方式",
+        options=list(SEARCH_MODES),
+        index=SEARCH_MODES.index(Config.RAG_SEARCH_MODE) if Config.RAG_SEARCH_MODE in SEARCH_MODES else 0,
+        format_func=mode_labels.get,
+        horizontal=True,
+        help="关键词检索按分词精确匹配；语义向量对错别字、缺字和不同说法更宽容（首次使用需构建向量索引）；混合检索融合两者的排序"
+    )
+
+    # 结构化筛选：只在满足条件的活动中检索（不选表示不限）
+    with st.expander("🎛️ 筛选条件（可选）", expanded=False):
+        options = rag.filter_options()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            filter_segments = st.multiselect("目标人群", options['target_segment'], help="满足其一即可")
+        with col2:
+            filter_discounts = st.multiselect("优惠方式", options['discount'], help="满足其一即可")
+        with col3:
+            filter_positions = st.multiselect("资源位", options['resource_positions'], help="需全部使用")
+
+        col1, col2 = st.columns(2)
+        roi_bounds = (float(campaigns['roi'].min()), float(campaigns['roi'].max()))
+        with col1:
+            filter_roi = st.slider(
+                "ROI范围",
+                min_value=roi_bounds[0],
+                max_value=max(roi_bounds[1], roi_bounds[0] + 0.01),
+                value=(roi_bounds[0], max(roi_bounds[1], roi_bounds[0] + 0.01)),
+                step=0.01
+            )
+        date_bounds = (campaigns['start_date'].min().date(), campaigns['end_date'].max().date())
+        with col2:
+            filter_dates = st.date_input(
+                "活动日期（与该区间有重叠）",
+                value=date_bounds,
+                min_value=date_bounds[0],
+                max_value=date_bounds[1]
+            )
+
     st.markdown("---")
 
     # 提交按钮
@@ -122,15 +170,25 @@ if search_submitted or st.session_state.get('rag_searched'):
     if search_submitted:
         with st.spinner("🔍 RAG检索中，请稍候（约3-5秒）..."):
             try:
-                # RAG召回
-                results = rag.search(query, top_k=top_k)
+                # RAG召回（未改动的筛选条件不传，不做过滤）
+                filters = {
+                    'target_segment': filter_segments or None,
+                    'discount': filter_discounts or None,
+                    'resource_positions': filter_positions or None,
+                    'roi_range': filter_roi if filter_roi != roi_bounds else None,
+                    'date_range': tuple(filter_dates) if len(filter_dates) == 2 and tuple(filter_dates) != date_bounds else None,
+                }
+                results = rag.search(query, top_k=top_k, mode=search_mode, **filters)
 
                 # 保存结果
                 st.session_state.rag_results = results
                 st.session_state.rag_searched = True
                 st.session_state.rag_query = query
 
-                st.success(f"✅ 检索完成，找到 {len(results)} 个相关案例")
+                if len(results) > 0:
+                    st.success(f"✅ 检索完成，找到 {len(results)} 个相关案例")
+                else:
+                    st.warning("⚠️ 没有满足筛选条件的活动，请放宽筛选条件后重试")
 
             except Exception as e:
                 st.error(f"❌ 检索失败: {str(e)}")
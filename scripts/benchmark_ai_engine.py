@@ -0,0 +1,200 @@
+"""
+AI引擎压测脚本 - 通过本地模拟服务测量延迟分位数、并发吞吐、重试率和降级率
+
+--hedge 时再启动一个备用模拟服务，经多提供商路由压测对冲请求对长尾延迟的影响
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.ai_engine import AIStrategyEngine, SingleFlight
+from modules.data_loader import DataLoader
+from modules.provider_router import get_routed_engine
+from scripts.mock_openai_server import start_mock_server
+
+
+METHODS = ['recommend_strategy', 'explain_anomaly', 'generate_report', 'generate_report_stream']
+
+# 压测方法 -> 模拟服务中的请求场景（用于统计重试次数）
+METHOD_KINDS = {
+    'recommend_strategy': 'strategy',
+    'explain_anomaly': 'anomaly',
+    'generate_report': 'report',
+    'generate_report_stream': 'report',
+}
+
+
+class PassThroughFlight(SingleFlight):
+    """不合并请求：每次调用都直接请求上游（压测并发时相同prompt也各自计数）"""
+
+    def join(self, key: str):
+        return SingleFlight().join(key)
+
+    def do(self, key: str, fn):
+        return fn()
+
+
+def build_calls(engine: AIStrategyEngine, loader: DataLoader) -> dict:
+    """
+    构建各方法的单次调用函数
+
+    Returns:
+        方法名 -> 调用函数（返回 (是否降级, 首字耗时秒数或None)）
+    """
+    daily = loader.load_daily_metrics()
+    history = loader.load_campaign_history()
+    segments = loader.load_user_segments()
+
+    anomaly_date = daily['date'].iloc[len(daily) // 2].strftime('%Y-%m-%d')
+    metrics = engine.anomaly_metrics(daily, anomaly_date)
+    start, end = daily['date'].min().strftime('%Y-%m-%d'), daily['date'].max().strftime('%Y-%m-%d')
+
+    default_strategy = engine._get_default_strategy()
+    default_anomaly = engine._get_default_anomaly_explanation(metrics)
+    default_report = engine._get_default_report(*engine._report_summary(daily))
+
+    def recommend_strategy():
+        result = engine.recommend_strategy("提升家庭向会员收入", history, segments)
+        return result == default_strategy, None
+
+    def explain_anomaly():
+        result = engine.explain_anomaly(anomaly_date, metrics, daily)
+        return result == default_anomaly, None
+
+    def generate_report():
+        result = engine.generate_report(start, end, daily)
+        return result == default_report, None
+
+    def generate_report_stream():
+        started = time.perf_counter()
+        first_chunk = None
+        parts = []
+        for part in engine.generate_report_stream(start, end, daily):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            parts.append(part)
+        return ''.join(parts) == default_report, first_chunk
+
+    return {
+        'recommend_strategy': recommend_strategy,
+        'explain_anomaly': explain_anomaly,
+        'generate_report': generate_report,
+        'generate_report_stream': generate_report_stream,
+    }
+
+
+def run_case(call, n_requests: int, concurrency: int) -> dict:
+    """以指定并发执行n次调用，返回延迟与降级统计"""
+    def timed():
+        started = time.perf_counter()
+        fallback, first_chunk = call()
+        return time.perf_counter() - started, fallback, first_chunk
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: timed(), range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    latency = np.array([r[0] for r in results]) * 1000
+    first_chunks = [r[2] for r in results if r[2] is not None]
+    return {
+        'requests': n_requests,
+        'p50_ms': np.percentile(latency, 50),
+        'p95_ms': np.percentile(latency, 95),
+        'p99_ms': np.percentile(latency, 99),
+        'ttft_p50_ms': np.percentile(first_chunks, 50) * 1000 if first_chunks else np.nan,
+        'throughput_rps': n_requests / elapsed,
+        'fallback_rate': float(np.mean([r[1] for r in results])),
+    }
+
+
+def main():
+    """主函数：启动模拟服务（或连接已有服务）并逐项压测"""
+    parser = argparse.ArgumentParser(description="AI引擎延迟/吞吐压测")
+    parser.add_argument('--base-url', default=None,
+                        help="已运行的OpenAI兼容服务地址；省略时在进程内启动模拟服务")
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS, help="压测的方法")
+    parser.add_argument('--requests', type=int, default=20, help="每组压测的请求数")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8], help="并发数（可多个）")
+    parser.add_argument('--latency', type=float, default=0.3, help="模拟首字延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.1, help="模拟延迟抖动（秒）")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="模拟长尾慢请求概率（延迟×10）")
+    parser.add_argument('--error-rate', type=float, default=0.05, help="模拟500错误概率")
+    parser.add_argument('--chunk-delay', type=float, default=0.005, help="模拟流式分片间隔（秒）")
+    parser.add_argument('--seed', type=int, default=42, help="模拟服务随机种子")
+    parser.add_argument('--hedge', action='store_true',
+                        help="启动两个模拟服务，经多提供商路由对冲请求（重试率含对冲请求）")
+    parser.add_argument('--single-flight', action='store_true',
+                        help="保留并发相同请求的合并（默认关闭，以测量每次调用的上游路径）")
+    parser.add_argument('--output', default=None, help="结果另存为CSV")
+    args = parser.parse_args()
+
+    servers = []
+    base_urls = [args.base_url] if args.base_url else []
+    if not base_urls:
+        for seed in ([args.seed, args.seed + 1] if args.hedge else [args.seed]):
+            server = start_mock_server(
+                latency=args.latency,
+                jitter=args.jitter,
+                error_rate=args.error_rate,
+                slow_rate=args.slow_rate,
+                chunk_delay=args.chunk_delay,
+                seed=seed
+            )
+            servers.append(server)
+            base_urls.append(server.base_url)
+            print(f"🚀 已启动模拟服务: {server.base_url}")
+
+    if args.hedge:
+        engine = get_routed_engine([
+            {'name': f"mock{i}", 'api_key': 'mock', 'model': f"mock-model-{i}", 'base_url': url}
+            for i, url in enumerate(base_urls)
+        ])
+    else:
+        engine = AIStrategyEngine(api_key='mock', model='mock-model', base_url=base_urls[0])
+    # 压测测量的是真实调用路径，关闭响应缓存
+    engine.cache = None
+    if not args.single_flight:
+        engine._inflight = PassThroughFlight()
+    calls = build_calls(engine, DataLoader())
+
+    rows = []
+    try:
+        for method in args.methods:
+            for concurrency in args.concurrency:
+                kind = METHOD_KINDS[method]
+                before = sum(server.counts.get(kind, 0) for server in servers)
+                stats = run_case(calls[method], args.requests, concurrency)
+                if servers and not args.single_flight:
+                    # 服务端收到的请求数超出调用次数的部分即为客户端重试（及对冲）
+                    attempts = sum(server.counts.get(kind, 0) for server in servers) - before
+                    stats['retry_rate'] = (attempts - args.requests) / args.requests
+                else:
+                    stats['retry_rate'] = np.nan
+                rows.append({'method': method, 'concurrency': concurrency, **stats})
+                print(f"  ✓ {method} × 并发{concurrency}: p50 {stats['p50_ms']:.0f}ms, "
+                      f"{stats['throughput_rps']:.1f} req/s")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    result = pd.DataFrame(rows)
+    print()
+    print(result.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"\n✅ 结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
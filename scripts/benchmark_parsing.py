@@ -0,0 +1,129 @@
+"""
+策略响应解析压测脚本 - 对比旧解析路径（正则提取 + json.loads + Pydantic）与单次解析路径的吞吐和成功率
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.mock_openai_server import STRATEGY_RESPONSE
+from utils.validators import StrategyResponse, parse_strategy_response
+
+
+def legacy_parse(response_text: str):
+    """旧解析路径（贪婪DOTALL正则 → json.loads → Pydantic，失败时再对原文json.loads一次）"""
+    try:
+        match = re.search(r'```json\s*(\{.*?\})\s*```', response_text, re.DOTALL)
+        if match:
+            json_str = match.group(1)
+        else:
+            match = re.search(r'\{.*\}', response_text, re.DOTALL)
+            json_str = match.group(0) if match else response_text
+        data = json.loads(json_str)
+        if isinstance(data.get('risk_alert'), list):
+            data['risk_alert'] = '\n'.join(str(item) for item in data['risk_alert'])
+        return StrategyResponse(**data).model_dump()
+    except Exception:
+        try:
+            data = json.loads(response_text)
+            if isinstance(data.get('risk_alert'), list):
+                data['risk_alert'] = '\n'.join(str(item) for item in data['risk_alert'])
+            return data
+        except Exception:
+            raise ValueError("无法解析AI响应")
+
+
+def build_corpus(padding: int) -> dict:
+    """
+    构建解析语料：真实格式的各种变体和常见的异常输出
+
+    Args:
+        padding: 长文本样例中reason字段的重复次数（模拟长响应）
+
+    Returns:
+        名称 -> 响应文本
+    """
+    data = json.loads(STRATEGY_RESPONSE)
+    pretty = json.dumps(data, ensure_ascii=False, indent=2)
+
+    long_data = dict(data, content_strategy=dict(
+        data['content_strategy'], reason="历史同类活动ROI最高，家庭剧在周末时段转化稳定。" * padding
+    ))
+    list_alert = dict(data, risk_alert=["注意控制优惠券核销成本", "关注{周末}资源位排期"])
+    numeric = dict(data, kpi_forecast={"arpu_lift": 0.018, "confidence": 80, "roi_estimate": 1.32})
+    missing = {k: v for k, v in data.items() if k != 'kpi_forecast'}
+
+    return {
+        'json_only': STRATEGY_RESPONSE,
+        'pretty': pretty,
+        'fenced': f"以下是推荐方案：\n```json\n{pretty}\n```\n如需调整请告知。",
+        'prose_with_braces': f"分析思路：{{人群→内容→资源位}}\n{pretty}\n备注：预算按{{周}}拆分",
+        'list_risk_alert': json.dumps(list_alert, ensure_ascii=False),
+        'numeric_kpi': json.dumps(numeric, ensure_ascii=False),
+        'long_response': json.dumps(long_data, ensure_ascii=False, indent=2),
+        'truncated': pretty[:len(pretty) * 2 // 3],
+        'missing_field': json.dumps(missing, ensure_ascii=False),
+        'no_json': "抱歉，当前无法给出推荐方案，请补充运营目标。" * 5,
+    }
+
+
+def bench(parse, text: str, repeat: int, rounds: int = 5) -> tuple:
+    """重复解析（分若干轮取最快一轮，减少机器抖动的影响），返回 (每秒解析次数, 结果说明)"""
+    try:
+        result = parse(text)
+        status = 'ok'
+        try:
+            StrategyResponse(**result)
+        except Exception:
+            # 旧路径在校验失败时会返回未校验的dict，页面按字段取值时可能报错
+            status = 'unvalidated'
+    except ValueError:
+        status = 'error'
+
+    per_round = max(repeat // rounds, 1)
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(per_round):
+            try:
+                parse(text)
+            except ValueError:
+                pass
+        best = min(best, time.perf_counter() - started)
+    return per_round / best, status
+
+
+def main():
+    """主函数：逐个样例对比两种解析路径"""
+    parser = argparse.ArgumentParser(description="策略响应解析压测")
+    parser.add_argument('--repeat', type=int, default=2000, help="每个样例的解析次数")
+    parser.add_argument('--padding', type=int, default=200, help="长响应样例的文本重复次数")
+    args = parser.parse_args()
+
+    rows = []
+    for name, text in build_corpus(args.padding).items():
+        legacy_rate, legacy_status = bench(legacy_parse, text, args.repeat)
+        fast_rate, fast_status = bench(parse_strategy_response, text, args.repeat)
+        rows.append({
+            'sample': name,
+            'chars': len(text),
+            'legacy_per_s': legacy_rate,
+            'fast_per_s': fast_rate,
+            'speedup': fast_rate / legacy_rate,
+            'legacy_result': legacy_status,
+            'fast_result': fast_status,
+        })
+
+    result = pd.DataFrame(rows)
+    print(result.to_string(index=False, float_format=lambda v: f"{v:,.1f}"))
+
+
+if __name__ == '__main__':
+    main()
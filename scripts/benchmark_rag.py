@@ -0,0 +1,173 @@
+"""
+RAG检索压测脚本 - 在合成活动库上对比精确BM25（逐个/批量）、本地向量（IVF近似/精确）和混合检索的召回率与QPS
+
+查询由库中某个活动的字段改写而来（打乱顺序、去掉分隔、随机删字），检索文本与该活动相同的活动即为标准答案：
+- recall@k: 前k个结果中包含标准答案的查询比例
+- bm25_overlap@k: 与精确BM25前k个结果的重合比例
+- ann_recall@k: IVF近似检索前k个与精确向量检索前k个的重合比例
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.rag_search import CampaignRAG
+
+
+CONTENTS = ['家庭剧', '动漫', '综艺', '体育', '电影', '纪录片', '少儿', '短剧']
+ACTIONS = ['促活', '拉新', '召回', '续费', '升级']
+SEGMENTS = ['家庭向高活跃', '学生党', '银发用户', '女性向', '体育迷', '新注册用户', '沉默用户', '年轻白领']
+FACTORS = [
+    '周五高峰', '周末档期', '资源位权重高', '节日营销', '精准人群', '长假档期', '多内容组合', '独家首播',
+    '明星直播', '会员日', '限时折扣', '社群裂变', '开屏曝光', 'Push召回', '连续包月', '寒暑假档期',
+]
+
+
+def build_library(size: int, seed: int) -> pd.DataFrame:
+    """生成合成活动库（字段格式与campaign_history一致）"""
+    rng = np.random.default_rng(seed)
+    contents = rng.choice(CONTENTS, (size, 2))
+    share = rng.integers(5, 10, size) * 10
+    factors = [rng.choice(FACTORS, 3, replace=False) for _ in range(size)]
+    return pd.DataFrame({
+        'campaign_id': [f"SYN{i:07d}" for i in range(size)],
+        'strategy_tag': [c + a for c, a in zip(contents[:, 0], rng.choice(ACTIONS, size))],
+        'target_segment': rng.choice(SEGMENTS, size),
+        'success_factors': ['+'.join(f) for f in factors],
+        'content_mix': [f"{a}{s}%+{b}{100 - s}%" for a, b, s in zip(contents[:, 0], contents[:, 1], share)],
+        'roi': rng.uniform(0.6, 2.0, size).round(2),
+        'arpu_lift': rng.uniform(0.0, 0.05, size).round(3),
+    })
+
+
+def build_queries(library: pd.DataFrame, n_queries: int, seed: int) -> list:
+    """由随机抽取的活动改写查询，返回 [(查询, 来源活动下标)]"""
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for index in rng.choice(len(library), n_queries, replace=False):
+        row = library.iloc[index]
+        parts = [row['strategy_tag'], row['target_segment'], *rng.choice(row['success_factors'].split('+'), 2, replace=False)]
+        parts = [str(p) for p in rng.permutation(parts)]
+        if rng.random() < 0.5:
+            # 随机删掉一个字，模拟口语化/不完整的描述
+            target = int(rng.integers(len(parts)))
+            drop = int(rng.integers(len(parts[target])))
+            parts[target] = parts[target][:drop] + parts[target][drop + 1:]
+        queries.append(('，'.join(parts) if rng.random() < 0.5 else ''.join(parts), int(index)))
+    return queries
+
+
+def run_method(rag: CampaignRAG, queries: list, top_k: int, mode: str, answers: dict) -> tuple:
+    """执行一组查询，返回 (每个查询的前k个campaign_id, 统计)"""
+    results = []
+    latency = []
+    for query, _ in queries:
+        started = time.perf_counter()
+        ids = rag.search(query, top_k=top_k, mode=mode)['campaign_id'].tolist()
+        latency.append(time.perf_counter() - started)
+        results.append(ids)
+
+    hits = [bool(answers[source] & set(ids)) for (_, source), ids in zip(queries, results)]
+    latency = np.array(latency)
+    return results, {
+        f'recall@{top_k}': float(np.mean(hits)),
+        'qps': len(queries) / latency.sum(),
+        'p50_ms': np.percentile(latency, 50) * 1000,
+        'p99_ms': np.percentile(latency, 99) * 1000,
+    }
+
+
+def overlap(results: list, reference: list, top_k: int) -> float:
+    """两组检索结果前k个的平均重合比例"""
+    return float(np.mean([len(set(a) & set(b)) / top_k for a, b in zip(results, reference)]))
+
+
+def main():
+    """主函数：构建合成活动库的索引并逐项压测"""
+    parser = argparse.ArgumentParser(description="RAG检索召回率/QPS压测")
+    parser.add_argument('--size', type=int, default=20000, help="合成活动库的活动数")
+    parser.add_argument('--queries', type=int, default=500, help="查询数")
+    parser.add_argument('--top-k', type=int, default=5, help="召回数量k")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[8, 16, 32], help="IVF探查簇数（可多个）")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--output', default=None, help="结果另存为CSV")
+    args = parser.parse_args()
+
+    library = build_library(args.size, args.seed)
+    queries = build_queries(library, min(args.queries, args.size), args.seed)
+
+    rag = CampaignRAG()
+    started = time.perf_counter()
+    rag.build_index(library)
+    print(f"⏱️ BM25索引构建: {time.perf_counter() - started:.1f}s")
+    started = time.perf_counter()
+    # 向量索引在第一次向量检索时构建
+    rag.search(queries[0][0], top_k=args.top_k, mode='dense')
+    dense = rag.dense
+    print(f"⏱️ 向量索引构建: {time.perf_counter() - started:.1f}s（{len(dense)}条，{dense.index.nlist}个簇）")
+
+    # 检索文本相同的活动都算命中（合成库中存在完全相同的活动）
+    text_groups = rag.campaigns_df.groupby('search_text')['campaign_id'].agg(set)
+    answers = dict(enumerate(rag.campaigns_df['search_text'].map(text_groups)))
+    source_answers = {source: answers[source] for _, source in queries}
+
+    rows = []
+    bm25_results, stats = run_method(rag, queries, args.top_k, 'bm25', source_answers)
+    rows.append({'method': 'bm25（精确）', **stats})
+
+    # 批量检索：一次调用完成全部查询，结果应与逐个检索完全一致
+    started = time.perf_counter()
+    batch = rag.search_batch([query for query, _ in queries], top_k=args.top_k)
+    elapsed = time.perf_counter() - started
+    grouped = batch.groupby('query_index')['campaign_id'].agg(list)
+    batch_results = [grouped.get(i, []) for i in range(len(queries))]
+    rows.append({
+        'method': 'bm25（search_batch）',
+        f'recall@{args.top_k}': float(np.mean([
+            bool(source_answers[source] & set(ids)) for (_, source), ids in zip(queries, batch_results)
+        ])),
+        'qps': len(queries) / elapsed,
+        'bm25_overlap': overlap(batch_results, bm25_results, args.top_k),
+    })
+
+    default_nprobe = dense.index.nprobe
+    dense.index.nprobe = dense.index.nlist
+    exact_results, stats = run_method(rag, queries, args.top_k, 'dense', source_answers)
+    rows.append({'method': '向量（精确）', **stats, 'bm25_overlap': overlap(exact_results, bm25_results, args.top_k)})
+
+    for nprobe in args.nprobe:
+        dense.index.nprobe = nprobe
+        results, stats = run_method(rag, queries, args.top_k, 'dense', source_answers)
+        rows.append({
+            'method': f'向量（IVF nprobe={nprobe}）', **stats,
+            'bm25_overlap': overlap(results, bm25_results, args.top_k),
+            'ann_recall': overlap(results, exact_results, args.top_k),
+        })
+
+    dense.index.nprobe = default_nprobe
+    results, stats = run_method(rag, queries, args.top_k, 'hybrid', source_answers)
+    rows.append({
+        'method': f'混合（RRF，nprobe={default_nprobe}）', **stats,
+        'bm25_overlap': overlap(results, bm25_results, args.top_k),
+    })
+
+    result = pd.DataFrame(rows).rename(columns={
+        'bm25_overlap': f'bm25_overlap@{args.top_k}',
+        'ann_recall': f'ann_recall@{args.top_k}',
+    })
+    print()
+    print(result.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"\n✅ 结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
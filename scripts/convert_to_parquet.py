@@ -0,0 +1,33 @@
+"""
+CSV转列式存储脚本 - 将data/下的CSV一次性转换为Parquet
+"""
+import argparse
+import os
+import sys
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.data_loader import DataLoader
+
+
+def main():
+    """主函数：转换指定（默认全部）数据集"""
+    parser = argparse.ArgumentParser(description="将CSV数据转换为Parquet列式存储")
+    parser.add_argument('--data-path', default=None, help="数据目录（默认使用Config.DATA_PATH）")
+    parser.add_argument('--datasets', nargs='*', default=None,
+                        help=f"需要转换的数据集（默认全部: {' '.join(DataLoader.DATASETS)}）")
+    parser.add_argument('--row-group-size', type=int, default=100_000, help="每个row group的行数")
+    args = parser.parse_args()
+
+    loader = DataLoader(data_path=args.data_path, storage='csv')
+    converted = loader.convert_to_columnar(args.datasets, row_group_size=args.row_group_size)
+
+    for name, rows in converted.items():
+        print(f"✅ 转换 {name}: {rows} 行 -> {loader._columnar_path(name)}")
+
+    print("\n🎉 列式数据转换完成！DataLoader将自动优先读取较新的Parquet文件")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,54 +3,224 @@
 """
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import argparse
 import os
+import shutil
 import sys
 
 # 添加父目录到路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # 固定随机种子（确保异常点可复现）
-np.random.seed(42)
-
-def generate_daily_metrics(days=30):
-    """生成日报数据"""
-    dates = pd.date_range(end=datetime.now(), periods=days)
-
-    daily_data = []
-    for i, date in enumerate(dates):
-        # 周期性波动
-        base_dau = 4700000
-        weekend_boost = 200000 if date.dayofweek >= 5 else 0
-        random_factor = np.random.randint(-100000, 150000)
-        dau = base_dau + weekend_boost + random_factor
-
-        # 边现模拟
-        base_arpu = 0.092
-        content_boost = np.random.choice([0.005, 0.008, -0.003], p=[0.4, 0.3, 0.3])
-        arpu = base_arpu + content_boost + np.random.normal(0, 0.002)
-
-        # 人工注入异常点（固定日期，便于演示）
-        if i in [5, 12, 21]:  # 第6天、第13天、第22天
-            arpu *= 0.85  # 下降15%
-
-        revenue = int(dau * arpu)
-
-        daily_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'dau': dau,
-            'revenue': revenue,
-            'new_members': np.random.randint(18000, 25000),
-            'renew_members': np.random.randint(58000, 68000),
-            'content_type': np.random.choice(['家庭剧', '动漫', '综艺'], p=[0.5, 0.3, 0.2]),
-            'platform': 'TV',
-            'resource_position': np.random.choice(['首页位1', '首页位3', '详情页推荐']),
-            'discount_type': np.random.choice(['10元券', '5折月卡', '免费试看']),
-            'is_holiday': 1 if date.dayofweek >= 5 else 0,
-            'day_of_week': date.dayofweek
-        })
-
-    return pd.DataFrame(daily_data)
+DEFAULT_SEED = 42
+
+# 默认注入异常的日期下标（第6天、第13天、第22天）
+DEFAULT_ANOMALY_DAYS = (5, 12, 21)
+
+PLATFORMS = ['TV', 'APP', 'PC', 'PAD']
+CONTENT_TYPES = ['家庭剧', '动漫', '综艺']
+CONTENT_PROBS = [0.5, 0.3, 0.2]
+RESOURCE_POSITIONS = ['首页位1', '首页位3', '详情页推荐']
+DISCOUNT_TYPES = ['10元券', '5折月卡', '免费试看']
+
+# 压测数据CSV分片的临时目录（生成后合并为 daily_metrics.csv 并删除）
+CSV_PART_DIR = 'daily_metrics.csv.parts'
+
+
+def _sample_daily_fields(rng: np.random.Generator, dates: pd.DatetimeIndex, n: int,
+                         anomaly_mask: np.ndarray, anomaly_factor: float, dau_scale=1.0) -> dict:
+    """向量化采样日报字段（dates与anomaly_mask均为长度n的逐行数组）"""
+    day_of_week = dates.dayofweek.to_numpy()
+    is_weekend = day_of_week >= 5
+
+    # 周期性波动
+    dau = (4700000 + np.where(is_weekend, 200000, 0) + rng.integers(-100000, 150000, size=n)) * dau_scale
+    dau = np.maximum(dau.astype(np.int64), 1)
+
+    # 边现模拟
+    content_boost = rng.choice([0.005, 0.008, -0.003], p=[0.4, 0.3, 0.3], size=n)
+    arpu = 0.092 + content_boost + rng.normal(0, 0.002, size=n)
+
+    # 人工注入异常点
+    arpu = np.where(anomaly_mask, arpu * anomaly_factor, arpu)
+
+    return {
+        'dau': dau,
+        'revenue': (dau * arpu).astype(np.int64),
+        'new_members': (rng.integers(18000, 25000, size=n) * dau_scale).astype(np.int64),
+        'renew_members': (rng.integers(58000, 68000, size=n) * dau_scale).astype(np.int64),
+        'is_holiday': is_weekend.astype(np.int64),
+        'day_of_week': day_of_week.astype(np.int64),
+    }
+
+
+def generate_daily_metrics(days=30, anomaly_days=DEFAULT_ANOMALY_DAYS, anomaly_factor=0.85,
+                           seed=DEFAULT_SEED):
+    """
+    生成日报数据（单平台演示数据）
+
+    Args:
+        days: 天数
+        anomaly_days: 注入异常的日期下标
+        anomaly_factor: 异常日边现乘数（0.85即下降15%）
+        seed: 随机种子
+
+    Returns:
+        (日报DataFrame, 异常标注DataFrame)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end=datetime.now(), periods=days).normalize()
+    anomaly_mask = np.isin(np.arange(days), list(anomaly_days))
+
+    fields = _sample_daily_fields(rng, dates, days, anomaly_mask, anomaly_factor)
+    daily_df = pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d'),
+        'dau': fields['dau'],
+        'revenue': fields['revenue'],
+        'new_members': fields['new_members'],
+        'renew_members': fields['renew_members'],
+        'content_type': rng.choice(CONTENT_TYPES, p=CONTENT_PROBS, size=days),
+        'platform': 'TV',
+        'resource_position': rng.choice(RESOURCE_POSITIONS, size=days),
+        'discount_type': rng.choice(DISCOUNT_TYPES, size=days),
+        'is_holiday': fields['is_holiday'],
+        'day_of_week': fields['day_of_week'],
+    })
+
+    labels_df = daily_df.loc[anomaly_mask, ['date', 'platform', 'content_type', 'resource_position']].copy()
+    labels_df['anomaly_factor'] = anomaly_factor
+
+    return daily_df, labels_df
+
+
+def _generate_large_shard(shard_index: int, dates: pd.DatetimeIndex, day_offset: int,
+                          platforms: list, content_types: list, positions: list,
+                          seed_seq: np.random.SeedSequence, anomaly_rate: float,
+                          anomaly_days: tuple, anomaly_factor: float, output_dir: str,
+                          output_format: str) -> pd.DataFrame:
+    """
+    生成一个分片（若干天 × 全部平台/内容/资源位组合）并写盘
+
+    每个分片使用独立派生的SeedSequence，结果与worker数量和执行顺序无关。
+
+    Returns:
+        该分片的异常标注DataFrame
+    """
+    rng = np.random.default_rng(seed_seq)
+    n_days, n_series = len(dates), len(platforms) * len(content_types) * len(positions)
+    n = n_days * n_series
+
+    # 日期在外层、序列组合在内层展开
+    day_idx = np.repeat(np.arange(n_days), n_series)
+    series_idx = np.tile(np.arange(n_series), n_days)
+    platform_idx, rest = np.divmod(series_idx, len(content_types) * len(positions))
+    content_idx, position_idx = np.divmod(rest, len(positions))
+    row_dates = dates[day_idx]
+
+    anomaly_mask = rng.random(n) < anomaly_rate
+    if anomaly_days:
+        anomaly_mask |= np.isin(day_idx + day_offset, list(anomaly_days))
+
+    # 不同组合的量级不同：按组合数均分大盘DAU
+    fields = _sample_daily_fields(rng, row_dates, n, anomaly_mask, anomaly_factor, dau_scale=1.0 / n_series)
+
+    shard_df = pd.DataFrame({
+        'date': row_dates,
+        'dau': fields['dau'],
+        'revenue': fields['revenue'],
+        'new_members': fields['new_members'],
+        'renew_members': fields['renew_members'],
+        'content_type': pd.Categorical.from_codes(content_idx, categories=content_types),
+        'platform': pd.Categorical.from_codes(platform_idx, categories=platforms),
+        'resource_position': pd.Categorical.from_codes(position_idx, categories=positions),
+        'discount_type': pd.Categorical.from_codes(rng.integers(0, len(DISCOUNT_TYPES), size=n), categories=DISCOUNT_TYPES),
+        'is_holiday': fields['is_holiday'],
+        'day_of_week': fields['day_of_week'],
+    })
+
+    if output_format == 'parquet':
+        # 与DataLoader列式目录布局一致，可直接用 DataLoader(data_path=output_dir) 读取
+        shard_path = os.path.join(output_dir, 'daily_metrics.parquet', f'part-{shard_index:05d}.parquet')
+        shard_df.to_parquet(shard_path, index=False, engine='pyarrow')
+    else:
+        # 分片按顺序首尾拼接成 daily_metrics.csv：只有第一个分片带BOM和表头
+        shard_path = os.path.join(output_dir, CSV_PART_DIR, f'part-{shard_index:05d}.csv')
+        shard_df.to_csv(shard_path, index=False, header=shard_index == 0,
+                        encoding='utf-8-sig' if shard_index == 0 else 'utf-8', date_format='%Y-%m-%d')
+
+    labels_df = shard_df.loc[anomaly_mask, ['date', 'platform', 'content_type', 'resource_position']].copy()
+    labels_df['anomaly_factor'] = anomaly_factor
+    return labels_df
+
+
+def generate_large_daily_metrics(output_dir: str, days: int = 365 * 3, platforms: list = None,
+                                 content_types: list = None, positions: list = None,
+                                 shard_days: int = 30, workers: int = None, seed: int = DEFAULT_SEED,
+                                 anomaly_rate: float = 0.001, anomaly_days: tuple = (),
+                                 anomaly_factor: float = 0.85, output_format: str = 'parquet') -> dict:
+    """
+    生成压测用的大规模日报数据（天数 × 平台 × 内容类型 × 资源位）
+
+    按天切分为分片，在多个进程中并行采样写盘；异常标注汇总写入 anomaly_labels.csv。
+
+    Args:
+        output_dir: 输出目录
+        days: 天数
+        platforms/content_types/positions: 维度取值（默认使用内置列表）
+        shard_days: 每个分片包含的天数
+        workers: 并行进程数（默认CPU核数）
+        seed: 根随机种子（各分片种子由其派生）
+        anomaly_rate: 每行随机注入异常的概率
+        anomaly_days: 所有序列同时注入异常的日期下标
+        anomaly_factor: 异常行边现乘数
+        output_format: parquet（daily_metrics.parquet/ 分片目录）或 csv（合并为单个 daily_metrics.csv）
+
+    Returns:
+        {'rows': 总行数, 'shards': 分片数, 'anomalies': 异常行数}
+    """
+    platforms = platforms or PLATFORMS
+    content_types = content_types or CONTENT_TYPES
+    positions = positions or RESOURCE_POSITIONS
+
+    dates = pd.date_range(end=pd.Timestamp(datetime.now()).normalize(), periods=days)
+    shard_starts = list(range(0, days, shard_days))
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(shard_starts))
+
+    part_dir = os.path.join(output_dir, 'daily_metrics.parquet' if output_format == 'parquet' else CSV_PART_DIR)
+    os.makedirs(part_dir, exist_ok=True)
+    for old_part in os.listdir(part_dir):
+        os.remove(os.path.join(part_dir, old_part))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                _generate_large_shard, shard_index, dates[start:start + shard_days], start,
+                platforms, content_types, positions, seed_seqs[shard_index], anomaly_rate,
+                tuple(anomaly_days), anomaly_factor, output_dir, output_format
+            )
+            for shard_index, start in enumerate(shard_starts)
+        ]
+        labels = [future.result() for future in futures]
+
+    if output_format == 'csv':
+        # DataLoader的CSV后端只读取单个 daily_metrics.csv
+        with open(os.path.join(output_dir, 'daily_metrics.csv'), 'wb') as merged:
+            for shard_index in range(len(shard_starts)):
+                with open(os.path.join(part_dir, f'part-{shard_index:05d}.csv'), 'rb') as part:
+                    shutil.copyfileobj(part, merged)
+        shutil.rmtree(part_dir)
+
+    labels_df = pd.concat(labels, ignore_index=True)
+    labels_df.to_csv(os.path.join(output_dir, 'anomaly_labels.csv'), index=False,
+                     encoding='utf-8-sig', date_format='%Y-%m-%d')
+
+    return {
+        'rows': days * len(platforms) * len(content_types) * len(positions),
+        'shards': len(shard_starts),
+        'anomalies': len(labels_df),
+    }
 
 
 def generate_user_segments():
@@ -257,19 +427,83 @@ def generate_resource_capacity():
     return pd.DataFrame(capacity_data)
 
 
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="生成模拟数据")
+    parser.add_argument('--days', type=int, default=None, help="日报天数（演示默认30，压测默认1095）")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="随机种子")
+    parser.add_argument('--anomaly-days', type=int, nargs='*', default=None,
+                        help="注入异常的日期下标（演示默认 5 12 21，压测默认不注入）")
+    parser.add_argument('--anomaly-factor', type=float, default=0.85, help="异常日边现乘数")
+
+    large = parser.add_argument_group('压测数据（--large）')
+    large.add_argument('--large', action='store_true', help="生成大规模多维日报数据用于压测")
+    large.add_argument('--output-dir', default=None, help="输出目录（默认 data/large）")
+    large.add_argument('--platforms', nargs='*', default=None, help=f"平台列表（默认 {' '.join(PLATFORMS)}）")
+    large.add_argument('--content-types', nargs='*', default=None, help="内容类型列表")
+    large.add_argument('--positions', type=int, default=None,
+                       help="资源位数量（超过内置3个时自动补充“资源位N”）")
+    large.add_argument('--shard-days', type=int, default=30, help="每个分片的天数")
+    large.add_argument('--workers', type=int, default=None, help="并行进程数（默认CPU核数）")
+    large.add_argument('--anomaly-rate', type=float, default=0.001, help="每行随机注入异常的概率")
+    large.add_argument('--format', choices=['parquet', 'csv'], default='parquet',
+                       help="输出格式：parquet写分片目录 daily_metrics.parquet/，csv合并为单个 daily_metrics.csv")
+    return parser.parse_args()
+
+
+def main_large(args, project_root: str):
+    """生成压测数据"""
+    output_dir = args.output_dir or os.path.join(project_root, 'data', 'large')
+    positions = list(RESOURCE_POSITIONS)
+    if args.positions:
+        positions = (positions + [f'资源位{i}' for i in range(len(positions) + 1, args.positions + 1)])[:args.positions]
+
+    result = generate_large_daily_metrics(
+        output_dir,
+        days=args.days or 365 * 3,
+        platforms=args.platforms,
+        content_types=args.content_types,
+        positions=positions,
+        shard_days=args.shard_days,
+        workers=args.workers,
+        seed=args.seed,
+        anomaly_rate=args.anomaly_rate,
+        anomaly_days=tuple(args.anomaly_days or ()),
+        anomaly_factor=args.anomaly_factor,
+        output_format=args.format
+    )
+
+    print(f"✅ 生成压测日报数据: {result['rows']:,} 行，{result['shards']} 个分片")
+    print(f"✅ 异常标注: {result['anomalies']:,} 行 -> {os.path.join(output_dir, 'anomaly_labels.csv')}")
+    print(f"📁 数据文件位置: {output_dir}/")
+
+
 def main():
     """主函数：生成所有CSV文件"""
+    args = parse_args()
+
     # 切换到项目根目录
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     os.chdir(project_root)
 
+    if args.large:
+        main_large(args, project_root)
+        return
+
     # 确保data目录存在
     os.makedirs('data', exist_ok=True)
 
     # 1. 生成日报数据
-    daily_df = generate_daily_metrics(30)
+    anomaly_days = DEFAULT_ANOMALY_DAYS if args.anomaly_days is None else tuple(args.anomaly_days)
+    daily_df, labels_df = generate_daily_metrics(
+        args.days or 30,
+        anomaly_days=anomaly_days,
+        anomaly_factor=args.anomaly_factor,
+        seed=args.seed
+    )
     daily_df.to_csv('data/daily_metrics.csv', index=False, encoding='utf-8-sig')
-    print(f"✅ 生成日报数据: {len(daily_df)} 行")
+    labels_df.to_csv('data/anomaly_labels.csv', index=False, encoding='utf-8-sig')
+    print(f"✅ 生成日报数据: {len(daily_df)} 行（异常标注 {len(labels_df)} 行）")
 
     # 2. 生成用户分层
     segments_df = generate_user_segments()
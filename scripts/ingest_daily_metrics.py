@@ -0,0 +1,33 @@
+"""
+日报增量写入脚本 - 追加新的日报行，只计算新增部分的衍生指标
+"""
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+# 添加父目录到路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.data_loader import DataLoader
+
+
+def main():
+    """主函数：读取新增日报CSV并增量写入"""
+    parser = argparse.ArgumentParser(description="增量写入日报数据")
+    parser.add_argument('input', nargs='?', default=None,
+                        help="新增日报CSV（列与daily_metrics.csv一致）；省略时仅建立基线状态")
+    parser.add_argument('--data-path', default=None, help="数据目录（默认使用Config.DATA_PATH）")
+    args = parser.parse_args()
+
+    loader = DataLoader(data_path=args.data_path)
+    new_df = pd.read_csv(args.input) if args.input else None
+    written = loader.ingest_daily_metrics(new_df)
+
+    state = loader.load_daily_state()
+    print(f"✅ 写入 {written} 行，累计 {state['rows']} 行，最新日期 {state['last_date']}")
+
+
+if __name__ == '__main__':
+    main()
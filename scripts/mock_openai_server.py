@@ -0,0 +1,315 @@
+"""
+本地OpenAI兼容模拟服务 - 无网络、不消耗额度地压测AI引擎
+
+支持 /v1/chat/completions（含stream=True的SSE流式返回），
+可配置首字延迟、抖动、长尾慢请求、错误率和流式分片间隔，按prompt内容返回对应场景的模板回复。
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 各场景的模板回复（按prompt中的特征词匹配）
+STRATEGY_RESPONSE = json.dumps({
+    "target_segment": "家庭向高活跃",
+    "estimated_size": "86万",
+    "content_strategy": {
+        "primary_content": "家庭剧",
+        "content_ratio": "家庭剧70%+动漫30%",
+        "reason": "历史同类活动ROI最高"
+    },
+    "resource_allocation": {
+        "positions": ["首页位3", "详情页推荐"],
+        "peak_hours": "周五19-22点",
+        "budget_focus": "70%投入首页位"
+    },
+    "discount_recommendation": "影视VIP连月10元券-优爱腾",
+    "kpi_forecast": {"arpu_lift": "+0.018", "confidence": "80", "roi_estimate": "1.32"},
+    "risk_alert": "注意控制优惠券核销成本",
+    "historical_reference": "C001"
+}, ensure_ascii=False)
+
+ANOMALY_RESPONSE = """### 核心原因
+1. 当日主推内容转化偏弱
+2. 周末流量结构变化稀释边现
+
+### 数据洞察
+边现波动与内容类型切换同步出现
+
+### 行动建议
+1. 恢复高转化内容的首页曝光
+2. 针对高活跃人群补发续费券
+"""
+
+REPORT_RESPONSE = """## 📊 活动总结
+
+### 核心成果
+- 周期内总收入稳定增长
+- 家庭剧带动边现提升
+- 续费会员占比提高
+
+### 驱动因素分析
+- 家庭剧首页曝光带来主要增量
+- 周末活动拉动转化
+
+### 待优化项
+- 动漫内容转化偏低
+- 资源位排期不均衡
+
+## 🎯 策略执行模板（可复用）
+
+### 目标人群
+家庭向高活跃用户 - 约86万
+
+### 内容策略
+家庭剧70% + 综艺20% + 动漫10%
+
+### 资源位配置
+首页位3 + 详情页推荐
+
+### 优惠方案
+影视VIP连月10元券-优爱腾
+
+### KPI目标
+- 边现提升: +0.015元
+- ROI: 1.3
+
+### 行动清单
+- [ ] 配置内容推荐池
+- [ ] 申请资源位排期
+- [ ] 设置优惠券规则
+- [ ] 配置监控大盘
+
+### 风险点与建议
+关注券核销成本
+
+## 💡 下期优化建议
+1. 延续家庭剧主推
+2. 优化动漫内容配比
+3. 提前锁定周末资源位
+
+## 📝 策略沉淀
+家庭剧 + 首页位组合可复用
+"""
+
+
+def classify_prompt(prompt: str) -> str:
+    """按prompt特征判断请求场景"""
+    if '推荐方案' in prompt:
+        return 'strategy'
+    if '复盘' in prompt:
+        return 'report'
+    if '异常' in prompt:
+        return 'anomaly'
+    return 'other'
+
+
+CANNED_RESPONSES = {
+    'strategy': STRATEGY_RESPONSE,
+    'anomaly': ANOMALY_RESPONSE,
+    'report': REPORT_RESPONSE,
+    'other': "OK",
+}
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """带压测参数和请求计数的模拟服务"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.5, jitter: float = 0.2,
+                 error_rate: float = 0.0, chunk_delay: float = 0.02, chunk_size: int = 8,
+                 seed: int = None, slow_rate: float = 0.0, slow_factor: float = 10.0):
+        super().__init__(address, MockOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.random = random.Random(seed)
+        self.counts = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, failed: bool):
+        with self._lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            if failed:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def draw(self) -> tuple:
+        """抽取本次请求的 (首字延迟, 是否返回错误)"""
+        with self._lock:
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if self.random.random() < self.slow_rate:
+                delay *= self.slow_factor
+            failed = self.random.random() < self.error_rate
+        return delay, failed
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI Chat Completions 接口的最小实现"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端已取消请求（如对冲中落败）
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [{'id': 'mock-model', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        prompt = '\n'.join(m.get('content') or '' for m in request.get('messages', []))
+        kind = classify_prompt(prompt)
+
+        delay, failed = self.server.draw()
+        self.server.record(kind, failed)
+        time.sleep(delay)
+
+        if failed:
+            self._send_json(500, {'error': {'message': 'mock server error', 'type': 'server_error'}})
+            return
+
+        content = CANNED_RESPONSES[kind]
+        model = request.get('model', 'mock-model')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': len(prompt),
+                    'completion_tokens': len(content),
+                    'total_tokens': len(prompt) + len(content)
+                }
+            })
+            return
+
+        # SSE流式返回：按chunk_size切分，分片之间间隔chunk_delay
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        def send_chunk(delta: dict, finish_reason=None):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            send_chunk({'role': 'assistant', 'content': ''})
+            for start in range(0, len(content), self.server.chunk_size):
+                send_chunk({'content': content[start:start + self.server.chunk_size]})
+                time.sleep(self.server.chunk_delay)
+            send_chunk({}, finish_reason='stop')
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开
+            pass
+
+
+def start_mock_server(host: str = '127.0.0.1', port: int = 0, **options) -> MockOpenAIServer:
+    """
+    在后台线程启动模拟服务
+
+    Args:
+        host: 监听地址
+        port: 端口（0表示随机空闲端口）
+        **options: latency/jitter/error_rate/chunk_delay/chunk_size/seed/slow_rate/slow_factor
+
+    Returns:
+        已启动的服务实例（base_url属性为客户端应使用的地址，用完调用shutdown()）
+    """
+    server = MockOpenAIServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    """主函数：前台运行模拟服务"""
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容模拟服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    parser.add_argument('--latency', type=float, default=0.5, help="首字延迟（秒）")
+    parser.add_argument('--jitter', type=float, default=0.2, help="延迟抖动幅度（秒，均匀分布）")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="长尾慢请求的概率")
+    parser.add_argument('--slow-factor', type=float, default=10.0, help="慢请求的延迟倍数")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="返回500错误的概率")
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help="流式分片间隔（秒）")
+    parser.add_argument('--chunk-size', type=int, default=8, help="流式分片字符数")
+    parser.add_argument('--seed', type=int, default=None, help="随机种子")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        chunk_delay=args.chunk_delay,
+        chunk_size=args.chunk_size,
+        seed=args.seed,
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor
+    )
+    print(f"🚀 模拟服务已启动: {server.base_url}")
+    print(f"   使用方式: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=mock streamlit run app.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,13 +17,56 @@ class Config:
     OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', None)  # DeepSeek: https://api.deepseek.com/v1
     OPENAI_TIMEOUT = int(os.getenv('OPENAI_TIMEOUT', '30'))
     OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+    OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '4'))  # 批量调用的最大并发数
+    OPENAI_CALL_DEADLINE = float(os.getenv('OPENAI_CALL_DEADLINE', '25'))  # 单次操作的端到端截止时间（秒，含重试）
+    OPENAI_JSON_MODE = os.getenv('OPENAI_JSON_MODE', '1') != '0'  # 策略推荐请求JSON输出（response_format），不支持的模型自动关闭
+
+    # AI调用熔断（连续失败或慢调用达到阈值后暂停调用，直接走降级方案）
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))  # 连续失败次数
+    CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', '20'))  # 超过该耗时视为失败
+    CIRCUIT_RESET_SECONDS = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))  # 熔断后多久放行一次探测请求
+
+    # 多提供商路由（按延迟EWMA加权分配请求，主请求过慢时向备用提供商发出对冲请求）
+    HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '90'))  # 主请求超过该耗时分位仍未返回时对冲
+    HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))  # 延迟样本不足时的对冲等待（秒）
+    HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.5'))  # 对冲等待下限（秒），避免过早重复请求
+    ROUTER_EWMA_ALPHA = float(os.getenv('ROUTER_EWMA_ALPHA', '0.2'))  # 延迟EWMA的平滑系数
+    ROUTER_LATENCY_WINDOW = int(os.getenv('ROUTER_LATENCY_WINDOW', '100'))  # 计算分位数的最近样本数
+
+    # Prompt上下文（长周期复盘按周/活动分段并发摘要，再汇总为一份报告）
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '2000'))  # prompt中日度数据上下文的token预算
+    REPORT_MAPREDUCE_DAYS = int(os.getenv('REPORT_MAPREDUCE_DAYS', '45'))  # 复盘周期超过该天数时默认分段汇总
+    REPORT_CHUNK_TOKEN_BUDGET = int(os.getenv('REPORT_CHUNK_TOKEN_BUDGET', '600'))  # 每个分段的日度数据token预算
 
     # 数据路径
     DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+    DATA_STORAGE = os.getenv('DATA_STORAGE', 'auto')  # auto/csv/parquet
+    DATA_STORE_TTL = int(os.getenv('DATA_STORE_TTL', '60'))  # 共享数据检查文件更新的间隔（秒）
+
+    # AI响应缓存（SQLite磁盘缓存，多会话/多进程共享）
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', '1') != '0'
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(DATA_PATH, 'llm_cache.sqlite'))
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', '86400'))  # 缓存有效期（秒）
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '1000'))  # 超出后按最近访问时间淘汰
+
+    # RAG检索索引（分词语料和词项统计持久化，启动时只对新增/变化的活动分词）
+    RAG_INDEX_PERSIST = os.getenv('RAG_INDEX_PERSIST', '1') != '0'
+    RAG_INDEX_PATH = os.getenv('RAG_INDEX_PATH', os.path.join(DATA_PATH, 'rag_index'))
+    RAG_SEARCH_MODE = os.getenv('RAG_SEARCH_MODE', 'bm25')  # 经验库默认检索方式：bm25/dense(本地向量)/hybrid(混合)
+    RAG_DENSE_DIM = int(os.getenv('RAG_DENSE_DIM', '128'))  # 字符n-gram向量SVD降维后的维度
+    RAG_IVF_NPROBE = int(os.getenv('RAG_IVF_NPROBE', '32'))  # 向量近似检索每次探查的簇数
+    RAG_BATCH_WORKERS = int(os.getenv('RAG_BATCH_WORKERS', '0'))  # 批量检索并行分词的进程数（0为CPU核数）
+
+    # AI调用指标导出（JSONL逐次明细 + Prometheus文本格式，供本地采集）
+    AI_METRICS_EXPORT = os.getenv('AI_METRICS_EXPORT', '1') != '0'
+    AI_METRICS_JSONL_PATH = os.getenv('AI_METRICS_JSONL_PATH', os.path.join(DATA_PATH, 'ai_metrics.jsonl'))
+    AI_METRICS_PROM_PATH = os.getenv('AI_METRICS_PROM_PATH', os.path.join(DATA_PATH, 'ai_metrics.prom'))
+    AI_METRICS_JSONL_MAX_BYTES = int(os.getenv('AI_METRICS_JSONL_MAX_BYTES', str(20 * 1024 * 1024)))  # 超过后轮转为 .1（0不限制）
 
     # 异常检测配置
     ANOMALY_THRESHOLD = 1.5  # Z-Score阈值
     ANOMALY_WINDOW = 7  # 滚动窗口天数
+    ANOMALY_METHOD = os.getenv('ANOMALY_METHOD', 'zscore')  # zscore/mad(滚动中位数)/seasonal(星期季节分解)
 
     # UI配置
     PAGE_TITLE = "会员智能运营闭环"
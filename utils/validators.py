@@ -1,12 +1,16 @@
 """
 数据校验模块 - 使用Pydantic定义数据模型
 """
-from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+import json
+import re
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, field_validator
+from typing import Dict, Iterator, List, Optional
 
 
 class ContentStrategy(BaseModel):
     """内容策略模型"""
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     primary_content: str = Field(..., description="主推内容类型")
     content_ratio: str = Field(..., description="内容配比")
     reason: str = Field(..., description="选择理由")
@@ -14,13 +18,17 @@ class ContentStrategy(BaseModel):
 
 class ResourceAllocation(BaseModel):
     """资源位分配模型"""
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     positions: List[str] = Field(..., description="资源位列表")
     peak_hours: str = Field(..., description="最佳投放时段")
     budget_focus: str = Field(..., description="预算重点分配")
 
 
 class KPIForecast(BaseModel):
-    """KPI预测模型"""
+    """KPI预测模型（模型常把置信度、ROI输出为数字，统一转为字符串）"""
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
     arpu_lift: str = Field(..., description="预估边现提升")
     confidence: str = Field(..., description="置信度(0-100)")
     roi_estimate: str = Field(..., description="预估ROI")
@@ -37,9 +45,17 @@ class StrategyResponse(BaseModel):
     risk_alert: str = Field(..., description="风险提示")
     historical_reference: str = Field(..., description="参考活动ID")
 
-    class Config:
-        """Pydantic配置"""
-        json_schema_extra = {
+    @field_validator('risk_alert', mode='before')
+    @classmethod
+    def join_risk_alert(cls, value):
+        """AI有时会把风险提示返回为数组，合并为多行字符串"""
+        if isinstance(value, list):
+            return '\n'.join(str(item) for item in value)
+        return value
+
+    model_config = ConfigDict(
+        coerce_numbers_to_str=True,
+        json_schema_extra={
             "example": {
                 "target_segment": "家庭向高活跃",
                 "estimated_size": "86万",
@@ -63,3 +79,82 @@ class StrategyResponse(BaseModel):
                 "historical_reference": "2024Q4_VIP"
             }
         }
+    )
+
+
+# 预先构建的校验器（导入时生成一次校验逻辑，每次解析直接复用）
+STRATEGY_ADAPTER = TypeAdapter(StrategyResponse)
+
+_JSON_DECODER = json.JSONDecoder()
+
+# JSON结构字符：括号、字符串引号、转义符
+_JSON_STRUCTURE_PATTERN = re.compile(r'[{}"\\]')
+_JSON_FENCE_PATTERN = re.compile(r'```(?:json)?\s*(?=\{)', re.IGNORECASE)
+
+
+def _match_brace(text: str, start: int) -> int:
+    """
+    返回与text[start]处的'{'配对的'}'位置（不配对时返回-1）
+
+    只访问括号、引号、转义符；字符串内部的括号不参与配对。
+    """
+    depth = 0
+    in_string = False
+    escaped_at = -1
+    for match in _JSON_STRUCTURE_PATTERN.finditer(text, start):
+        char = match.group()
+        index = match.start()
+        if in_string:
+            if char == '\\':
+                # 转义符：跳过紧随其后的字符（连续反斜杠两两抵消）
+                escaped_at = -1 if escaped_at == index - 1 else index
+            elif char == '"' and escaped_at != index - 1:
+                in_string = False
+        elif char == '"':
+            in_string = True
+            escaped_at = -1
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index
+    return -1
+
+
+def iter_json_object_starts(text: str) -> Iterator[int]:
+    """
+    按出现顺序产出文本中顶层JSON对象的起始位置（有```json代码块时从代码块开始）
+
+    调用方继续迭代时才用括号配对跳过上一个对象，整体对文本只线性扫描一遍。
+    """
+    fence = _JSON_FENCE_PATTERN.search(text)
+    start = text.find('{', fence.end() if fence else 0)
+    while start != -1:
+        yield start
+        end = _match_brace(text, start)
+        if end == -1:
+            return
+        start = text.find('{', end + 1)
+
+
+def parse_strategy_response(text: str) -> Dict:
+    """
+    解析AI策略推荐响应
+
+    从每个顶层JSON对象的起始位置直接解码（解码同时确定对象结束位置，不需要先截取子串），
+    再用预构建的TypeAdapter校验，整个响应只做一次JSON解析。
+
+    Raises:
+        ValueError: 没有符合StrategyResponse的JSON对象
+    """
+    error = "未找到JSON对象"
+    for start in iter_json_object_starts(text):
+        try:
+            data, _ = _JSON_DECODER.raw_decode(text, start)
+            return STRATEGY_ADAPTER.validate_python(data).model_dump()
+        except json.JSONDecodeError as e:
+            error = f"JSON格式错误: {e.msg}"
+        except ValidationError as e:
+            error = e.errors()[0]['msg']
+    raise ValueError(f"无法解析AI响应: {error}")
@@ -18,7 +18,6 @@ required_packages = {
     'python-dotenv': 'python-dotenv==1.0.0',
     'pydantic': 'pydantic==2.5.0',
     'loguru': 'loguru==0.7.2',
-    'rank_bm25': 'rank-bm25==0.2.2',
     'jieba': 'jieba==0.42.1'
 }
 